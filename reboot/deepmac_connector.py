@@ -4,17 +4,29 @@
 # Author : Jeff Mercer <jedi@jedimercer.com>
 # Purpose: Class definition for DeepMac Repository Connector
 # Written: 2014/04/25
-# Updated: 2019/01/25
+# Updated: 2026/10/17
 
 # 20180125 - Updated logging levels, replaced printed errors with log statements, similar tweaks.
+# 20261017 - Implemented the database connection type as an embedded SQLite repository. The address is the
+#			 path to the database file, which is created along with its schema on first connect.
+#		   - Implemented the web connection type, a client of the HTTP service in deepmac_web.py. The address is the
+#			 service's URL, requests go through request() over a pool of keep-alive connections.
 
 # Used to establish a connection to a DeepMac record repository (aka journal).
 # This is an intermediary class, used by the dmManager class in order to communicate with
 # the repository. dmConnector will validate connection info, indicate if a connection
 # is successful or not and perform other duties related directly to managing the connection.
 
+import sys
 import os
+import base64
+import socket
+import httplib
+import urlparse
 import logging
+import threading
+import sqlite3
+import simplejson as json
 from deepmac_record_class import dmRecord
 
 # Logging configuration
@@ -34,6 +46,21 @@ class dmConnector:
 	addr = ''
 	creds = { 'u': None, 'p': None }
 	con = None
+
+	# Web connections: most idle keep-alive connections to hold on to, and seconds to wait for a response
+	webpool = 8
+	webtimeout = 60
+
+	# Schema for database repositories. Records are stored as their JSON string, indexed by OUI and event date.
+	# Private/deleted flags are held per OUI in their own table, in place of the filesystem flag files.
+	dbschema = (
+		"CREATE TABLE IF NOT EXISTS ouis (oui TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+		"private INTEGER NOT NULL DEFAULT 0, deleted INTEGER NOT NULL DEFAULT 0)",
+		"CREATE INDEX IF NOT EXISTS ouis_size ON ouis (size, private, deleted)",
+		"CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY, oui TEXT NOT NULL, "
+		"eventdate TEXT NOT NULL, rec TEXT NOT NULL)",
+		"CREATE INDEX IF NOT EXISTS records_oui ON records (oui, eventdate)"
+	)
 	
 	# Given an OUI (presumed valid), return a full path for the OUI's directory in the repository
 	# Note: Does not validate OUI. Does not test if directory exists or not.
@@ -69,7 +96,7 @@ class dmConnector:
 		log.debug("c = %s" % (c))
 		# 't' is the connection type: filesystem, database, web
 		# 'a' is the address for the connection type
-		# 'c' is the credentials to connect with and is a list. Ignored for filesystem type
+		# 'c' is the credentials to connect with and is a list. Ignored for filesystem and database types
 
 		### Perform some verification checks on params: Make sure type is valid, address isn't empty, etc.
 		# Make sure a valid connection type was given
@@ -86,17 +113,24 @@ class dmConnector:
 			# Convert to absolute path format. Expand any user paths that may be specified.
 			self.addr = os.path.abspath(os.path.expanduser(a)) + "/"
 		elif self.type == 'web':
-			# TODO: Regex to verify address is a valid URL
+			# Web repositories are the URL of a deepmac_web.py service, i.e. http://127.0.0.1:8080/
+			url = urlparse.urlparse(a)
+			if url.scheme != 'http' or not url.hostname:
+				log.error("Invalid address for connection type web, expected an http:// URL: %s" % (a))
+				sys.exit(1)
 			self.addr = a
+			self.host = url.hostname
+			self.port = url.port or 80
+			self.prefix = url.path.rstrip('/')
 		elif self.type == 'database':
-			# TODO: Regex to verify a valid DSN was given
-			self.addr = a
+			# Database repositories are an embedded SQLite file. Expand any user paths that may be specified.
+			self.addr = os.path.abspath(os.path.expanduser(a))
 
 		log.debug("self.addr is now %s" % (self.addr))
 
 		### Verify credentials
-		# Only need to check creds for DB and web types
-		if self.type in ('database', 'web'):
+		# Only need to check creds for web types, embedded databases have no logins
+		if self.type == 'web':
 			if c == None:
 				log.error("Credentials required for connection type %s" % (self.type))
 				sys.exit(1)
@@ -151,15 +185,35 @@ class dmConnector:
 			# For filesystem connection types there's no access handle to store, so we dupe the pathname
 			self.con = self.addr
 		elif self.type == 'database':
-			### Attempt to open DB connection using address and creds
-			### Report any errors and exit/fail if connection unsuccessful
+			### Attempt to open DB connection using address, creating the database and schema if needed
+			try:
+				con = sqlite3.connect(self.addr)
+				con.execute("PRAGMA journal_mode = WAL")
+				con.execute("PRAGMA synchronous = NORMAL")
+				for stmt in self.dbschema:
+					con.execute(stmt)
+				con.commit()
+			except sqlite3.Error as e:
+				log.warn("Couldn't open database %s" % (self.addr))
+				log.warn("Exception triggered: %s" % (e))
+				log.debug("connect() ending")
+				return False
+
 			### For success, store the resulting handle in this instance
-			self.con = result
+			self.con = con
 		elif self.type == 'web':
-			### Attempt to connect to website using address and creds
-			### Report any errors and exit/fail if connection unsuccessful
-			### For success, store the resulting handle in this instance
-			self.con = result
+			### Check the service answers with these creds. Connections are made as requests need them and kept
+			### in a pool, so the handle stored is the pool.
+			self.pool = []
+			self.poollock = threading.Lock()
+			self.con = self.pool
+			(status, result) = self.request('GET', '/ping')
+			if status != 200 or not isinstance(result, dict) or not isinstance(result.get('OUIs'), (int, long)):
+				log.warn("Couldn't connect to DeepMac web repository %s (status %s)" % (self.addr, status))
+				self.disconnect()
+				log.debug("connect() ending")
+				return False
+			log.info("Web repository has %d OUIs" % (result['OUIs']))
 		else:
 			# Should be impossible for this to happen
 			log.error("Unrecognized connection type %s" % (self.type))
@@ -181,23 +235,28 @@ class dmConnector:
 			self.con = None
 			log.debug("disconnect() ending")
 			return True
-		elif self.type == 'databae':
-			# TODO: Flesh this out
-			### Invoke DB connection method to flush any remaining operation
-			### Check DB connection for any error messages, report if found.
-			### Invoke DB connection method to logout of database
-			### Check DB connection for any error messages, report if found.
+		elif self.type == 'database':
+			# Flush any remaining operation and close the database
+			if self.con != None:
+				try:
+					self.con.commit()
+					self.con.close()
+				except sqlite3.Error as e:
+					log.warn("Error while closing database %s" % (self.addr))
+					log.warn("Exception triggered: %s" % (e))
 
 			# Erase connection handle
 			self.con = None
 			log.debug("disconnect() ending")
 			return True
 		elif self.type == 'web':
-			# TODO: Flesh this out
-			### Invoke web connection method to flush any remaining operation
-			### Check web connection for any error messages, report if found.
-			### Invoke web connection method to logout of database
-			### Check web connection for any error messages, report if found.
+			# Nothing is left pending between requests, so just close the pooled connections
+			if self.con != None:
+				self.poollock.acquire()
+				for conn in self.pool:
+					conn.close()
+				del self.pool[:]
+				self.poollock.release()
 
 			# Erase connection handle
 			self.con = None
@@ -212,6 +271,70 @@ class dmConnector:
 		log.debug("disconnect() ending")
 		return True
 
+####
+
+	# Function to send a request to a web repository. 'path' is relative to the repository address and 'body' is an
+	# object to send as JSON, if any. Returns a tuple of the HTTP status and the decoded JSON response, or of None and
+	# None if the service couldn't be reached. Safe to call from several threads, each request takes a connection
+	# from the pool (or makes a new one) and puts it back when done.
+	def request(self, method, path, body = None):
+		log.debug("request() starting")
+		log.debug("%s %s" % (method, path))
+
+		headers = {'Authorization': 'Basic ' + base64.b64encode('%s:%s' % (self.creds['u'], self.creds['p']))}
+		if body != None:
+			body = json.dumps(body)
+			headers['Content-Type'] = 'application/json'
+
+		# A pooled connection may have been closed by the server since it was last used, so a failure on one of
+		# those is retried once on a new connection
+		for attempt in (1, 2):
+			self.poollock.acquire()
+			conn = None
+			if self.pool:
+				conn = self.pool.pop()
+			self.poollock.release()
+			pooled = (conn != None)
+			if conn == None:
+				conn = httplib.HTTPConnection(self.host, self.port, timeout = self.webtimeout)
+
+			try:
+				conn.request(method, self.prefix + path, body, headers)
+				resp = conn.getresponse()
+				data = resp.read()
+			except (httplib.HTTPException, socket.error) as e:
+				conn.close()
+				if pooled and attempt == 1:
+					log.debug("Pooled connection failed, retrying on a new one")
+					continue
+				log.error("Request %s %s to %s failed" % (method, path, self.addr))
+				log.error("Exception triggered: %s" % (e))
+				log.debug("request() ending")
+				return (None, None)
+			break
+
+		# Keep the connection for the next request, unless the server is closing it or the pool is full
+		if resp.will_close:
+			conn.close()
+		else:
+			self.poollock.acquire()
+			if self.con != None and len(self.pool) < self.webpool:
+				self.pool.append(conn)
+				conn = None
+			self.poollock.release()
+			if conn != None:
+				conn.close()
+
+		try:
+			result = json.loads(data)
+		except ValueError:
+			log.warn("Response to %s %s isn't JSON" % (method, path))
+			result = None
+
+		log.debug("status = %d" % (resp.status))
+		log.debug("request() ending")
+		return (resp.status, result)
+
 ####
 		
 	# Function to check if a connection is established or not. Returns True if
@@ -0,0 +1,237 @@
+#!/usr/bin/python
+
+# File   : dmIEEEParser.py
+# Author : Jeff Mercer <jedi@jedimercer.com>
+# Purpose: Parsers for IEEE registry files
+# Written: 2026/10/17
+# Updated: 2026/10/17
+
+# 20261017 - Initial version. Reads the IEEE text registry formats (oui.txt, oui28.txt, oui36.txt, iab.txt) directly,
+#			 replacing the oui2csv.pl step, as well as the tab-separated files oui2csv.pl produces.
+#		   - Fixed company names differing from oui2csv.pl's: it strips the first line of every entry but the first (and
+#			 those after PRIVATE entries), keeping only the newline off the others. Added check_oui2csv(), run when this
+#			 file is run as a script, to compare the parser's output with oui2csv.pl's.
+
+# Generators for reading IEEE registry data one entry at a time, without holding the whole file in memory.
+# Both formats are turned into the same list of fields oui2csv.pl outputs:
+#	[prefix, range, orgname, address1, address2, address3, address4, address5, country]
+# or just [prefix, range, orgname] for PRIVATE entries. registry_entry() then normalizes those fields into the
+# (OUI, OrgName, OrgAddress, OrgCountry) values used to build a dmRecord for the entry.
+# The text parser follows oui2csv.pl's rules exactly (including its quirks), so records built from either source
+# compare equal to those already in the journal. check_oui2csv() compares the two on a given file.
+
+import os
+import re
+import sys
+import logging
+import tempfile
+import subprocess
+
+# Logging configuration
+log = logging.getLogger('dm_ieee')
+handler = logging.StreamHandler()
+logformat = logging.Formatter("%(asctime)s - %(name)s %(levelname)s: %(message)s")
+handler.setFormatter(logformat)
+log.addHandler(handler)
+log.setLevel(logging.ERROR)
+
+# Patterns for the prefix on the first line of an entry, the assigned range on the second (28/36-bit registries
+# only), and a US city/state/zip line, which means the country line was left out of the entry.
+prefixre = re.compile(r'\b((?:[ABCDEF0123456789]{2}\-){2}[ABCDEF0123456789]{2})\b')
+rangere = re.compile(r'\b([ABCDEF0123456789]{6}\-[ABCDEF0123456789]{6})\b')
+zipre = re.compile(r'\w+,?\s+[A-Z]{2}\s+[0-9]{5}')
+
+####
+
+# Generator to parse a registry file in the IEEE text format. 'fh' is any iterable of lines from the file, and
+# 'encoding' is the character set of the file (oui2csv.pl always read files as ISO-8859-1). Yields a list of
+# fields per entry, in the same form as oui2csv.pl's output.
+def parse_registry(fh, encoding = 'iso-8859-1'):
+	log.debug("parse_registry() starting")
+	lines = iter(fh)
+	line = next(lines, '')
+
+	# As long as we have data left...
+	while line:
+		# Skip ahead to the beginning of a new entry
+		if '(hex)' not in line:
+			line = next(lines, '')
+			continue
+
+		# This is the first line of an entry, extract the prefix and company name (always after two tabs). Like
+		# oui2csv.pl's chomp, only the newline itself is taken off here (a CR before it stays in the name).
+		m = prefixre.search(line)
+		prefix = m.group(1) if m else ''
+		if line.endswith('\n'):
+			line = line[:-1]
+		parts = line.split('\t\t')
+		comp = parts[1] if len(parts) > 1 else ''
+		log.debug("prefix = %s, comp = %s" % (prefix, comp))
+
+		# Next line may give a range for this OUI. oui2csv.pl takes the range from $1, which still holds the prefix
+		# when there's no range to match.
+		line = next(lines, '')
+		m = rangere.search(line)
+		rng = m.group(1) if m else prefix
+
+		# PRIVATE entries have nothing more to them
+		if comp == 'PRIVATE':
+			yield [f.decode(encoding) for f in (prefix, rng, comp)]
+			continue
+
+		# Read and store until we hit a NEW entry or end of file
+		data = []
+		while line and '(hex)' not in line:
+			line = next(lines, '')
+			data.append(line.strip())
+
+		# The last two pieces are the blank line and first line of the next entry, not part of this one
+		data = data[:-2]
+
+		# oui2csv.pl strips every line it reads in the loop above, including the first line of the next entry, so
+		# that entry's company name loses its surrounding whitespace. Entries found any other way (the first in the
+		# file, or one after a PRIVATE entry) keep theirs.
+		line = line.strip()
+
+		# There can be anywhere from 1 to 6 lines for the company address, but the last line is *usually* the country.
+		cn = data.pop() if data else ''
+		addr = (data + [''] * 5)[:5]
+
+		# Check for case where country was omitted, in which case it was good ol' USA.
+		if zipre.search(cn):
+			for i in range(1, 5):
+				if addr[i] == '':
+					addr[i] = cn
+					break
+			else:
+				log.error("Couldn't place address line '%s' of entry %s" % (cn, prefix))
+				raise ValueError("Entry for %s may be longer than expected" % (prefix))
+			cn = 'UNITED STATES'
+
+		yield [f.decode(encoding) for f in [prefix, rng, comp] + addr + [cn]]
+
+	log.debug("parse_registry() ending")
+
+
+# Generator to parse a tab-separated registry file made by oui2csv.pl. Yields a list of fields per entry.
+def parse_csv(fh):
+	for line in fh:
+		line = line.rstrip('\r\n')
+		if line == '':
+			continue
+		yield line.decode('utf8').split('\t')
+
+
+# Function to normalize the fields of a registry entry. 'osz' is the OUI size of the registry. Returns a tuple of
+# (OUI, OrgName, OrgAddress, OrgCountry). Private registrations have no address or country, so those are None.
+def registry_entry(fields, osz):
+	# Extract and normalize OUI string. For 28/36-bit registries the rest of the OUI is the start of the range.
+	oui = fields[0].replace('-', '')
+	if osz > 24:
+		oui = oui + fields[1][0:(osz - 24) / 4]
+
+	# Check organization name to determine if it's a private registration
+	oname = fields[2]
+	if oname.lower() == u'private' or len(fields) == 3:
+		return (oui, oname, None, None)
+
+	# Extract country
+	if len(fields) < 9:
+		country = u'Unspecified'
+	else:
+		country = fields[8]
+
+	# Extract and normalize address
+	oa = '\\n'.join(fields[3:7]).strip()
+	if not oa:
+		oa = u'Not listed in registry'
+
+	return (oui, oname, oa, country)
+
+
+# Generator to read the entries of a registry file in either format, chosen by file name (.txt for the IEEE text
+# format, anything else is taken as oui2csv.pl output). Yields a tuple per entry, see registry_entry().
+def read_entries(fname, osz):
+	fh = open(fname, 'r')
+	if fname.endswith('.txt'):
+		parser = parse_registry(fh)
+	else:
+		parser = parse_csv(fh)
+
+	for fields in parser:
+		yield registry_entry(fields, osz)
+	fh.close()
+
+
+# Function to check parse_registry() against oui2csv.pl on a registry file in the IEEE text format. The Perl script
+# (by default the one next to this file) is run on the file and its output compared with the parser's, entry by
+# entry. Needs perl. Returns a list of the differences found, empty if there are none.
+def check_oui2csv(fname, script = None):
+	log.debug("check_oui2csv() starting")
+	if script == None:
+		script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'oui2csv.pl')
+
+	perl = subprocess.Popen(['perl', script, fname], stdout = subprocess.PIPE)
+	expected = list(parse_csv(perl.stdout))
+	perl.wait()
+	fh = open(fname, 'r')
+	found = list(parse_registry(fh))
+	fh.close()
+
+	problems = []
+	if perl.returncode != 0:
+		problems.append("oui2csv.pl failed on %s (exit status %d)" % (fname, perl.returncode))
+	for (i, (a, b)) in enumerate(zip(expected, found)):
+		if a != b:
+			problems.append("Entry %d differs: oui2csv.pl gave %s, the parser %s" % (i + 1, repr(a), repr(b)))
+	if len(expected) != len(found):
+		problems.append("oui2csv.pl gave %d entries, the parser %d" % (len(expected), len(found)))
+
+	log.debug("check_oui2csv() ending")
+	return problems
+
+####
+
+# Sample registry file for the check below, with the quirks the parser has to match oui2csv.pl on: CRLF line ends,
+# trailing spaces, an entry after a PRIVATE one, an address without a country, a range and an ISO-8859-1 name.
+sample = ('00-00-00   (hex)\t\tXEROX CORPORATION \r\n000000     (base 16)\t\tXEROX CORPORATION \r\n'
+		  '\t\t\t\tM/S 105-50C \r\n\t\t\t\tWEBSTER  NY  14580\r\n\t\t\t\tUNITED STATES\r\n\r\n'
+		  '00-00-01   (hex)\t\tXEROX CORPORATION \r\n000001     (base 16)\t\tXEROX CORPORATION \r\n'
+		  '\t\t\t\t800 PHILLIPS ROAD\r\n\t\t\t\tWEBSTER  NY  14580\r\n\r\n'
+		  '00-00-02   (hex)\t\tPRIVATE\r\n000002     (base 16)\t\tPRIVATE\r\n\r\n'
+		  '00-00-03   (hex)\t\tM\xfcller GmbH  \r\n000003     (base 16)\t\tM\xfcller GmbH  \r\n'
+		  '\t\t\t\tHauptstra\xdfe 1\r\n\t\t\t\tBerlin  10115\r\n\t\t\t\tGERMANY\r\n\r\n'
+		  '70-B3-D5   (hex)\t\tAcme Widgets \r\n000000-000FFF     (base 16)\t\tAcme Widgets \r\n'
+		  '\t\t\t\t1 Main St\r\n\t\t\t\tSpringfield  IL  62701\r\n\t\t\t\tUS\r\n\r\n')
+
+#### Main Execution ###
+
+# Run as a script, checks the parser against oui2csv.pl on the registry files given, or on the sample above
+if __name__ == '__main__':
+	log.setLevel(logging.INFO)
+	fnames = sys.argv[1:]
+	tmpname = None
+	if not fnames:
+		(fd, tmpname) = tempfile.mkstemp(suffix = '.txt')
+		os.write(fd, sample)
+		os.close(fd)
+		fnames = [tmpname]
+
+	failed = 0
+	for fname in fnames:
+		problems = check_oui2csv(fname)
+		for problem in problems:
+			log.error(problem)
+		if problems:
+			failed += 1
+			log.error("%s: the parser doesn't match oui2csv.pl" % (fname))
+		else:
+			log.info("%s: the parser matches oui2csv.pl" % (fname))
+
+	if tmpname != None:
+		os.remove(tmpname)
+	sys.exit(1 if failed else 0)
+
+####
+
+# End-of-line
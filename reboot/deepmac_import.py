@@ -4,7 +4,7 @@
 # Author : Jeff Mercer <jedi@jedimercer.com>
 # Purpose: Import records from the IEEE registry archive into repository
 # Written: 2014/06/11
-# Updated: 2019/05/28
+# Updated: 2026/10/17
 
 # 20180124 - Fixed bug with incorrect detection of Private registries (IEEE data format change).
 #		     Now checks for uppercase and capitalized versions.
@@ -17,16 +17,46 @@
 # 20190524 - Revised comparison check between registry records to use a function, and added said function to perform check
 #			 without triggering potential exceptions due to inconsistent data format in IEEE registry files.
 # 20190528 - Fixed bugs with new compare() function. Hunted down and exterminated final bugs in importation process! :D
+# 20261017 - Repository type and address can now be set with the optional repotype/repoaddr config options.
+#		   - Added snapshot mode (snapshot = true in config). The latest record of every OUI is loaded once per run,
+#			 from the snapshot file left by the previous run or from the repository, and kept up to date in memory.
+#			 The repository is then only used for writes.
+#		   - Deletion detection now uses set differences instead of list lookups, with the IAB / MA-S split done by
+#			 prefix set membership. The pass is now linear in the registry size.
+#		   - Added fingerprint mode (fingerprint = true in config). Registry files identical to the last one imported
+#			 are skipped, and for changed files only the lines that differ from the last import are compared against
+#			 the journal.
+#		   - Added --workers option. Each registry file's rows are split by OUI prefix and journaled by a pool of worker
+#			 processes, producing the same journal as a serial import (filesystem repositories only).
+#		   - Registry files are now read with deepmac_ieee_parser, which can also parse the IEEE text files directly
+#			 (format = txt in config), without converting them with oui2csv.pl first.
+#		   - Journal changes for a registry file are now collected in a dmManager change set and committed together.
+#		   - Progress (lastdate and fingerprints) is saved after each day instead of only at the end of a run, and the
+#			 config, fingerprint and snapshot files are written to a temporary file, synced and renamed into place.
+#			 The repository is now closed at the end of a run.
+#		   - Added the cachesize config option, to have dmManager cache journal records between days.
+#		   - Without a snapshot, the latest record of an OUI is now read with dmManager.getLatest(), unless cachesize is
+#			 set, in which case whole histories are read with get() so they stay cached between days.
+#		   - compare() now compares the string dictionary numbers of the case-folded organization values instead of the
+#			 strings. The snapshot file stores each distinct organization value once, in a string table after its header.
+#		   - compare() now compares record fingerprints. Without a snapshot, an OUI whose latest record has the same
+#			 fingerprint as the registry entry (per the repository manifest) is skipped without reading its journal.
 
 
 import sys
 import os
-import re
+import codecs
+import hashlib
 import logging
 import datetime
+import argparse
 import ConfigParser
+import multiprocessing
+import simplejson as json
 from deepmac_manager import dmManager
 from deepmac_record_class import dmRecord
+from deepmac_strdict import dmStrDict
+from deepmac_ieee_parser import read_entries
 
 # Logging configuration
 log = logging.getLogger('dm_import')
@@ -36,8 +66,19 @@ handler.setFormatter(logformat)
 log.addHandler(handler)
 log.setLevel(logging.ERROR)
 
+# Command line options
+parser = argparse.ArgumentParser(description = 'Import records from the IEEE registry archive into repository')
+parser.add_argument('-w', '--workers', type = int, default = 1, help = 'Number of worker processes to journal with (default: 1)')
+args = parser.parse_args()
+
 # Initialization
 dupeoui = ('0001C8', '080030')
+
+# Registries to import, by file name (without extension) and OUI size. Files are named as ouiarchive.pl saves them.
+registries = (('oui', 24), ('oui28', 28), ('oui36', 36), ('iab', 36))
+
+# Prefixes of the original IAB program. 36-bit OUIs under these come from the iab registry, all others from oui36
+iabprefixes = frozenset(('0050C2', '40D855'))
 basedir = '/home/USERDIR/site/reboot/'
 cfg = ConfigParser.SafeConfigParser()
 cfg.read(basedir + 'dmimport.cfg')
@@ -54,15 +95,69 @@ except ConfigParser.NoOptionError:
 	# TODO: If last isn't in file, create last with earliest available date in calendar (?)
 	log.error("One or more required options missing from dmimport config file.")
 	sys.exit(1)
+
+# Optional repository options, defaults to the filesystem journal under our base directory
+repotype = 'filesystem'
+repoaddr = basedir + 'journal'
+if cfg.has_option('dmimport', 'repotype'):
+	repotype = cfg.get('dmimport', 'repotype')
+if cfg.has_option('dmimport', 'repoaddr'):
+	repoaddr = cfg.get('dmimport', 'repoaddr')
+
+# Optional snapshot mode, and where to keep the snapshot between runs
+snapmode = False
+snapfile = basedir + 'snapshot'
+if cfg.has_option('dmimport', 'snapshot'):
+	snapmode = cfg.getboolean('dmimport', 'snapshot')
+if cfg.has_option('dmimport', 'snapfile'):
+	snapfile = cfg.get('dmimport', 'snapfile')
+
+# Optional number of OUIs to keep cached journal records for, when not using a snapshot
+cachesize = 0
+if cfg.has_option('dmimport', 'cachesize'):
+	cachesize = cfg.getint('dmimport', 'cachesize')
+
+# Optional registry file format: csv for files converted by oui2csv.pl (default), or txt to parse the IEEE text files
+regformat = 'csv'
+if cfg.has_option('dmimport', 'format'):
+	regformat = cfg.get('dmimport', 'format')
+if regformat not in ('csv', 'txt'):
+	log.error("Unrecognized registry file format %s, must be csv or txt." % (regformat))
+	sys.exit(1)
+
+# Optional fingerprint mode, and where to keep the fingerprints between runs
+fpmode = False
+fpfile = basedir + 'fingerprints'
+if cfg.has_option('dmimport', 'fingerprint'):
+	fpmode = cfg.getboolean('dmimport', 'fingerprint')
+if cfg.has_option('dmimport', 'fpfile'):
+	fpfile = cfg.get('dmimport', 'fpfile')
 	
 # Normalize our datetime objects
 last = datetime.datetime.strptime(last, '%Y-%m-%d').date()
 today = datetime.date.today()
 
+# Worker processes each write their own part of the journal tree, which only works for filesystem repositories
+workers = args.workers
+if workers > 1 and repotype != 'filesystem':
+	log.warn("Worker processes are only supported for filesystem repositories, importing serially.")
+	workers = 1
+
 # Establish a connection to the DeepMac repository
-dm = dmManager('filesystem', basedir + 'journal', '')
+dm = dmManager(repotype, repoaddr, '', cachesize)
+
+# Journal changes are collected here and committed to the repository a registry file at a time
+changes = dm.batch()
 
 log.debug("base = %s" % (base))
+log.debug("repotype = %s" % (repotype))
+log.debug("repoaddr = %s" % (repoaddr))
+log.debug("snapmode = %s" % (snapmode))
+log.debug("snapfile = %s" % (snapfile))
+log.debug("regformat = %s" % (regformat))
+log.debug("fpmode = %s" % (fpmode))
+log.debug("fpfile = %s" % (fpfile))
+log.debug("workers = %d" % (workers))
 log.debug("last = %s" % (last))
 log.debug("today = %s" % (today))
 
@@ -71,27 +166,8 @@ log.debug("today = %s" % (today))
 def compare(rec1, rec2):
 	log.debug("compare() function starting")
 
-	# Initialize
-	result = False
-	name1 = rec1.getOrgName()
-	addr1 = rec1.getOrgAddr()
-	cntry1 = rec1.getOrgCN()
-	name2 = rec2.getOrgName()
-	addr2 = rec2.getOrgAddr()
-	cntry2 = rec2.getOrgCN()
-
-	# Convert any boolean values to strings. This is a terrible kludge and I shouldn't do it this way.
-	# Blanket string conversions on values will throw exceptions in cases where the unicode string contains undecodable characters. All of this will be avoided when moving to Python3.
-	log.debug("Checking for any boolean values and converting to strings if found")
-	if isinstance(name1, bool): name1 = str(name1)
-	if isinstance(addr1, bool): addr1 = str(addr1)
-	if isinstance(cntry1, bool): cntry1 = str(cntry1)
-	if isinstance(name2, bool): name2 = str(name2)
-	if isinstance(addr2, bool): addr2 = str(addr2)
-	if isinstance(cntry2, bool): cntry2 = str(cntry2)
-
-	# Perform check
-	if name1.lower() == name2.lower() and addr1.lower() == addr2.lower() and cntry1.lower() == cntry2.lower():
+	# Perform check. Records with the same fingerprint have the same organization values, ignoring case.
+	if rec1.getFingerprint() == rec2.getFingerprint():
 		log.debug("Compare gave true result.")
 		result = True
 	else:
@@ -103,8 +179,324 @@ def compare(rec1, rec2):
 	return result
 
 
+# Function to find OUIs that have disappeared from a registry. 'reg' is the registry name, 'known' is the list of
+# OUIs of the registry's size in the journal (not already deleted) and 'seen' is the set of OUIs in the registry file.
+# 36-bit OUIs are split between the IAB and MA-S registries, so only those belonging to the registry being checked
+# are considered. Returns a sorted list of the OUIs missing from the registry.
+def find_deleted(reg, known, seen):
+	log.debug("find_deleted() function starting")
+
+	if reg == 'oui36':
+		known = [o for o in known if o[:6] not in iabprefixes]
+	elif reg == 'iab':
+		known = [o for o in known if o[:6] in iabprefixes]
+
+	results = sorted(set(known) - seen)
+
+	log.debug("%d OUIs missing from %s registry" % (len(results), reg))
+	log.debug("find_deleted() function ending")
+	return results
+
+
+# Function to read a registry file into a list of lines, for processing and fingerprinting. Line endings are
+# removed and blank lines dropped, as is the "Generated:" header IEEE puts in their files (which changes even when
+# the registry data doesn't).
+def read_registry(fname):
+	log.debug("read_registry() function starting")
+
+	try:
+		fh = open(fname, 'r')
+	except Exception as e:
+		# TODO: Better error reporting/handling
+		log.error("Encountered exception %s trying to open file." % e)
+		raise
+
+	lines = []
+	for line in fh:
+		line = line.rstrip('\r\n')
+		if line == '' or line.lstrip().startswith('Generated:'):
+			continue
+		lines.append(line)
+	fh.close()
+
+	log.debug("read_registry() function ending")
+	return lines
+
+
+# Function to compute the fingerprint of a registry file's contents, as read by read_registry()
+def fingerprint(lines):
+	return hashlib.sha1('\n'.join(lines)).hexdigest()
+
+
+# Functions for fingerprint mode. For each registry file name we keep the fingerprint of the last copy imported,
+# along with its date and path so it can be re-read to work out what changed.
+def load_fingerprints(fname):
+	if not os.path.isfile(fname):
+		return {}
+	fh = open(fname, 'r')
+	fps = json.load(fh)
+	fh.close()
+	return fps
+
+
+def save_fingerprints(fname, fps):
+	# Write to a temporary file and rename over the original
+	fh = open(fname + '.tmp', 'w')
+	json.dump(fps, fh, indent = "\t", sort_keys = True)
+	fh.flush()
+	os.fsync(fh.fileno())
+	fh.close()
+	os.rename(fname + '.tmp', fname)
+	return True
+
+
+# Functions for snapshot mode. The snapshot holds the latest record of every OUI in the repository, keyed by OUI.
+# It's saved at the end of a run: a header line giving the date the run finished on and the size of the string table,
+# then the string table (each distinct OrgName, OrgAddress and OrgCountry value once, see dmStrDict), then one JSON
+# record per line with those fields given as string table numbers. A saved snapshot is only trusted if that date
+# matches our lastdate, otherwise it's reloaded from the repository. It's removed once loaded, since a run that
+# doesn't finish leaves the repository ahead of it.
+def load_snapshot(fname, date):
+	log.debug("load_snapshot() function starting")
+	snap = None
+
+	if os.path.isfile(fname):
+		fh = codecs.open(fname, 'r', encoding='utf-8')
+		header = json.loads(fh.readline())
+		if header.get('LastDate') == date.strftime('%Y-%m-%d') and 'Strings' in header:
+			log.info("Loading snapshot from %s" % (fname))
+			strings = dmStrDict.read(fh, header['Strings'])
+			snap = {}
+			for line in fh:
+				r = json.loads(line)
+				for key in dmRecord.interned:
+					if key in r:
+						r[key] = strings[r[key]]
+				rec = dmRecord.fromdict(r)
+				snap[rec.getOUI()] = rec
+		else:
+			log.info("Snapshot in %s is out of date, ignoring it" % (fname))
+		fh.close()
+		os.remove(fname)
+
+	if snap == None:
+		log.info("Loading snapshot from repository")
+		snap = dm.latest()
+
+	log.debug("snapshot has %d entries" % (len(snap)))
+	log.debug("load_snapshot() function ending")
+	return snap
+
+
+def save_snapshot(fname, date, snap):
+	log.debug("save_snapshot() function starting")
+
+	# Swap the organization values for their numbers in the string table
+	strings = dmStrDict()
+	recs = []
+	for oui in sorted(snap):
+		r = snap[oui].todict()
+		for key in dmRecord.interned:
+			if key in r:
+				r[key] = strings.intern(r[key])
+		recs.append(r)
+
+	# Write to a temporary file and rename over the original, so a failure leaves the old (ignored) snapshot behind
+	fh = codecs.open(fname + '.tmp', 'w', encoding='utf-8')
+	fh.write(json.dumps({'LastDate': date.strftime('%Y-%m-%d'), 'Strings': len(strings)}) + u'\n')
+	strings.write(fh)
+	for r in recs:
+		fh.write(json.dumps(r, ensure_ascii = False, sort_keys = True) + u'\n')
+	fh.flush()
+	os.fsync(fh.fileno())
+	fh.close()
+	os.rename(fname + '.tmp', fname)
+
+	log.debug("save_snapshot() function ending")
+	return True
+
+
+# Function to save our progress: the fingerprints of the files imported so far, and the date to pick up from in
+# the config file. Both are written to a temporary file and renamed over the original. Called after each day's
+# files are imported so a run that fails part way through resumes from the day it was on, which is safe to
+# import again since its changes are compared against the journal like any other.
+def save_progress(date):
+	log.debug("save_progress() function starting")
+
+	if fps != None:
+		save_fingerprints(fpfile, fps)
+
+	cfg.set('dmimport', 'lastdate', date.strftime('%Y-%m-%d'))
+	fh = open(basedir + 'dmimport.cfg.tmp', 'wb')
+	cfg.write(fh)
+	fh.flush()
+	os.fsync(fh.fileno())
+	fh.close()
+	os.rename(basedir + 'dmimport.cfg.tmp', basedir + 'dmimport.cfg')
+
+	log.debug("save_progress() function ending")
+	return True
+
+
+# Function to get the most recent journal record for an OUI, or None if there isn't one. Uses the snapshot if we
+# have one, otherwise reads it from the repository: from the end of its journal, or with a cache, from its whole
+# history, which is then kept in the cache for the next day (until the OUI is next written to).
+def latest(oui):
+	if snap != None:
+		return snap.get(oui)
+
+	if cachesize > 0:
+		recs = dm.get(oui)
+		if recs:
+			return recs[-1]
+		return None
+	return dm.getLatest(oui)
+
+
+# Function to journal one entry of a registry file. Compares the entry against the latest journal record for its OUI
+# and appends a new record and/or changes flags as needed. 'entry' is an (OUI, OrgName, OrgAddress, OrgCountry) tuple
+# from deepmac_ieee_parser.registry_entry().
+def import_row(entry, osz):
+	(oui, oname, oa, country) = entry
+	log.debug("oui = %s" % (oui))
+
+	# The same OUI can turn up twice in a registry file, so make sure its pending changes are in the journal first
+	if oui in changes:
+		changes.commit()
+
+	# Private registrations have no address or country of origin
+	isprv = (oa == None)
+	if isprv:
+		# Create a minimal record
+		drec = dmRecord(rectype = u'registry', source = u'IEEE', edate = last.strftime('%Y-%m-%d').decode('utf8'), osize = osz, oui = oui, orgname = oname)
+	else:
+		log.debug("orgname = %s" % (oname.encode('utf8')))
+		log.debug("country = %s" % (country))
+		log.debug("oa = %s" % (oa.encode('utf8')))
+
+		# Create a full record for this OUI registry entry
+		drec = dmRecord(rectype = u'registry', source = u'IEEE', edate = last.strftime('%Y-%m-%d').decode('utf8'), osize = osz, oui = oui, orgname = oname, orgadd = oa, orgcn = country)
+
+	# Without a snapshot, the manifest can tell us the entry is unchanged without reading the journal
+	if snap == None:
+		known = dm.getFingerprint(oui)
+		if known != None and known[0] == drec.getFingerprint() and known[1] != 'delete':
+			log.debug("OUI %s unchanged (fingerprint %s)" % (oui, known[0]))
+			return
+
+	# Check if any existing records exist for this OUI
+	delflag = None	#\_
+	prvflag = None	#/  Use None to indicate no flag change, T/F to indicate flag change and to what state
+	orec = latest(oui)
+	if orec is not None:
+		log.info("Existing records for OUI %s found" % (oui))
+
+		# Check if any changes between most recent record in journal and our current record in hand
+		if not compare(drec, orec):
+			# Absurdly we must "whitelist" several OUIs as they are duplicated in the official registry files, :(
+			if orec.getOUI() in dupeoui:
+				log.info("Skipping whitelisted OUI %s" % (oui))
+				return
+
+			# Handle cases were OrgName is blank and record may be a private registration.
+			if orec.getOrgName().lower() == u'private' and drec.getOrgName() == '':
+				return
+
+			# Records differ - if previous record isn't a delete action then append this as a change record
+			if orec.getEvType() != 'delete':
+				log.info("Previous entry for OUI %s wasn't a delete action, so this is a change." % (oui))
+				drec.setEvType('change')
+
+				# Check if this OUI changed to/from private, set flag accordingly.
+				if drec.getOrgName().lower() == u'private' and orec.getOrgName().lower() != u'private':
+					log.info("OUI %s switched to private registry." % (oui))
+					prvflag = True
+				elif drec.getOrgName().lower() != u'private' and orec.getOrgName().lower() == u'private':
+					log.info("OUI %s switched to public registry." % (oui))
+					prvflag = False
+			else:
+				# Last record was deletion of data, record this as a new add and turn off the deleted flag
+				log.info("Previously deleted OUI %s has been re-registered, so this is an add." % (oui))
+				drec.setEvType('add')
+				delflag = False
+
+				# Also need to check if private entry to set flag accordingly (i.e. same as brand-new record)
+				if isprv:
+					prvflag = True
+					log.info("Registry for OUI %s is private, set private flag." % (oui))
+		else:
+			# Last record matches current record, so no change.
+			# But if last record was a delete action then this is a re-appearance of the OUI and needs to be recorded as an add.
+			if orec.getEvType() == 'delete':
+				log.info("Records matched for %s but previous record was a delete action, re-adding entry" % (oui))
+				drec.setEvType('add')
+				delflag = False
+	# No records found
+	else:
+		# Add this as a new record
+		log.info("No existing records for OUI %s found, treating as new" % (oui))
+		drec.setEvType('add')
+
+		# If it's a private record, flag it as such
+		if isprv:
+			prvflag = True
+			log.info("Registry for OUI %s is private, set private flag." % (oui))
+
+	# Update journal and flags if any changes were made
+	if drec.getEvType() != False:
+		if changes.append(drec) and snap != None:
+			snap[oui] = drec
+	if delflag != None: changes.setDeleted(oui, delflag)
+	if prvflag != None: changes.setPrivate(oui, prvflag)
+
+
+# Function to journal a list of registry rows, given as (line number, entry) tuples, in order. The changes are
+# committed to the repository together once all the rows are processed.
+def import_rows(rows, osz):
+	for (linenum, entry) in rows:
+		log.info("Processing line number %d" % (linenum))
+		import_row(entry, osz)
+	changes.commit()
+
+
+# Function to split registry rows into at most n partitions by the first byte of their OUI. The journal is sharded
+# on that byte, so partitions never write to the same journal files, and each OUI's rows keep their file order.
+def partition_rows(rows, n):
+	parts = [[] for i in range(n)]
+	for row in rows:
+		parts[int(row[1][0][0:2], 16) % n].append(row)
+	return [p for p in parts if p]
+
+
+# Function run by worker processes in --workers mode to journal one partition of registry rows. Workers are forked
+# for each registry file, so they start with the current manifest and snapshot. Manifest changes are held and handed
+# back to the parent to merge, along with the new snapshot entries for the partition's OUIs.
+def import_partition(args):
+	(rows, osz) = args
+	dm.holdManifest()
+	import_rows(rows, osz)
+
+	snapupd = {}
+	if snap != None:
+		for (linenum, entry) in rows:
+			if entry[0] in snap:
+				snapupd[entry[0]] = snap[entry[0]]
+
+	return (dm.releaseManifest(), snapupd)
+
+
 #### Main Execution ###
 
+# In snapshot mode, load the latest record of every OUI once up front
+snap = None
+if snapmode:
+	snap = load_snapshot(snapfile, last)
+
+# In fingerprint mode, load the fingerprints of the registry files imported last
+fps = None
+if fpmode:
+	fps = load_fingerprints(fpfile)
+
 # Loop through dates from last run to current date.
 while last <= today:
 	# Check if directory exists for this date
@@ -113,188 +505,95 @@ while last <= today:
 
 	if os.path.isdir(cwd):
 		# Cycle through possible OUI files here
-		for fname in ('oui.csv', 'oui28.csv', 'oui36.csv', 'iab.csv'):
+		for (reg, osz) in registries:
+			fname = reg + '.' + regformat
 			log.debug("fname = %s" % (fname))
+			log.debug("osz = %d" % (osz))
 
 			# Check if this file exists
 			if os.path.isfile(cwd + '/' + fname):
-				# Open this file for processing
-				try:
-					fh = open(cwd + '/' + fname, 'r')
-				except Exception as e:
-					# TODO: Better error reporting/handling
-					log.error("Encountered exception %s trying to open file." % e)
-					raise
-
-				# Determine OUI size being processed
-				if fname == 'oui.csv':
-					osz = 24
-				elif fname == 'oui28.csv':
-					osz = 28
-				elif fname == 'oui36.csv' or fname == 'iab.csv':
-					osz = 36
-				else:
-					log.error("Encountered unexpected import filename. This shouldn't happen.")
-					print "ERROR: Encountered unexpected import file. This shouldn't happen."
-					sys.exit()
-				log.debug("osz = %d" % (osz))
+				# In fingerprint mode, skip this file if it's the same as the last one imported. If it differs, only the
+				# entries that aren't in the last one need comparing against the journal.
+				preventries = None
+				if fps != None:
+					fp = fingerprint(read_registry(cwd + '/' + fname))
+					prev = fps.get(fname)
+					if prev != None and prev['Date'] < last.strftime('%Y-%m-%d'):
+						if prev['Hash'] == fp:
+							log.info("%s/%s is unchanged since %s, skipping" % (cwd, fname, prev['Date']))
+							continue
+						if os.path.isfile(prev['Path']):
+							preventries = set(read_entries(prev['Path'], osz))
+					fps[fname] = {'Date': last.strftime('%Y-%m-%d'), 'Hash': fp, 'Path': cwd + '/' + fname}
 
-				# Read CSV file and process for new/change/delete actions.
+				# Read registry file and process for new/change/delete actions.
 				log.info("Processing %s/%s" % (cwd, fname))
-				ouilist = []
-				for linenum, line in enumerate(fh):
-					if line == "": continue
-					log.info("Processing line number %d" % (linenum))
-
-					# TODO: Sanity-check line, make sure tab-delimited and the right number of fields, etc
-					fields = line.decode('utf8').rstrip('\n').split('	')
-					log.debug('line = %s' % (line))
-					log.debug('fields count = %d' % (len(fields)))
-
-					# Extract and normalize OUI string, save in list for later deletion detection
-					oui = re.sub('-', '', fields[0])
-					if osz > 24: oui = oui + fields[1][0:(osz - 24) / 4]
-					ouilist.append(oui)
-					log.debug("oui = %s" % (oui))
-
-					# Check organization name to determine if it's a private registration
-					oname = fields[2]
-					if oname.lower() == u'private' or len(fields) == 3:
-						# Private registrations have no address or country of origin. Create a minimal record
-						drec = dmRecord(rectype = u'registry', source = u'IEEE', edate = last.strftime('%Y-%m-%d').decode('utf8'), osize = osz, oui = oui, orgname = oname)
-						isprv = True
-					else:
-						log.debug("orgname = %s" % (fields[2]).encode('utf8'))
-
-						# Not a private registration - Extract country
-						ispriv = False
-						if len(fields) < 8:
-							country = u'Unspecified'
-						else:
-							country = fields[8]
-						log.debug("country = %s" % (country))
-
-						# Extract and normalize address
-						oa = '\\n'.join(fields[3:7]).strip()
-						if not oa:
-							oa = u'Not listed in registry'
-						log.debug("oa = %s" % (oa.encode('utf8')))
-
-						# Create a full record for this OUI registry entry
-						drec = dmRecord(rectype = u'registry', source = u'IEEE', edate = last.strftime('%Y-%m-%d').decode('utf8'), osize = osz, oui = oui, orgname = oname, orgadd = oa, orgcn = country)
-
-					# Check if any existing records exist for this OUI
-					delflag = None	#\_
-					prvflag = None	#/  Use None to indicate no flag change, T/F to indicate flag change and to what state
-					recs = dm.get(oui)
-					if recs:
-						log.info("Existing records for OUI %s found" % (oui))
-
-						# Copy most recent entry for this OUI from journal.
-						orec = recs[-1]
-
-						# Check if any changes between most recent record in journal and our current record in hand
-						if not compare(drec, orec):
-							# Absurdly we must "whitelist" several OUIs as they are duplicated in the official registry files, :(
-							if orec.getOUI() in dupeoui:
-								log.info("Skipping whitelisted OUI %s" % (oui))
-								continue
-
-							# Handle cases were OrgName is blank and record may be a private registration.
-							if orec.getOrgName().lower() == u'private' and drec.getOrgName() == '':
-								continue
-
-							# Records differ - if previous record isn't a delete action then append this as a change record
-							if orec.getEvType() != 'delete':
-								log.info("Previous entry for OUI %s wasn't a delete action, so this is a change." % (oui))
-								drec.setEvType('change')
-
-								# Check if this OUI changed to/from private, set flag accordingly.
-								if drec.getOrgName().lower() == u'private' and orec.getOrgName().lower() != u'private':
-									log.info("OUI %s switched to private registry." % (oui))
-									prvflag = True
-								elif drec.getOrgName().lower() != u'private' and orec.getOrgName().lower() == u'private':
-									log.info("OUI %s switched to public registry." % (oui))
-									prvflag = False
-							else:
-								# Last record was deletion of data, record this as a new add and turn off the deleted flag
-								log.info("Previously deleted OUI %s has been re-registered, so this is an add." % (oui))
-								drec.setEvType('add')
-								delflag = False
-
-								# Also need to check if private entry to set flag accordingly (i.e. same as brand-new record)
-								if oname.lower() == u'private' or len(fields) == 3:
-									prvflag = True
-									log.info("Registry for OUI %s is private, set private flag." % (oui))
-						else:
-							# Last record matches current record, so no change.
-							# But if last record was a delete action then this is a re-appearance of the OUI and needs to be recorded as an add.
-							if orec.getEvType() == 'delete':
-								log.info("Records matched for %s but previous record was a delete action, re-adding entry" % (oui))
-								drec.setEvType('add')
-								delflag = False
-					# No records found
-					else:
-						# Add this as a new record
-						log.info("No existing records for OUI %s found, treating as new" % (oui))
-						drec.setEvType('add')
-
-						# If it's a private record, flag it as such
-						if oname.lower() == u'private' or len(fields) == 3:
-							prvflag = True
-							log.info("Registry for OUI %s is private, set private flag." % (oui))
-
-					# Update journal and flags if any changes were made
-					if drec.getEvType() != False:
-						dm.append(drec)
-					if delflag != None: dm.setDeleted(oui, delflag)
-					if prvflag != None: dm.setPrivate(oui, prvflag)
+				ouiset = set()
+				rows = []
+				for linenum, entry in enumerate(read_entries(cwd + '/' + fname, osz)):
+					# Save OUI in set for later deletion detection
+					ouiset.add(entry[0])
+
+					# Entries unchanged since the last import have nothing new to journal
+					if preventries != None and entry in preventries:
+						continue
+					rows.append((linenum, entry))
+
+				# Journal the rows, split across worker processes if we have them
+				if workers > 1 and len(rows) > 0:
+					pool = multiprocessing.Pool(workers)
+					results = pool.map(import_partition, [(part, osz) for part in partition_rows(rows, workers)])
+					pool.close()
+					pool.join()
+					for (entries, snapupd) in results:
+						dm.mergeManifest(entries)
+						if snap != None:
+							snap.update(snapupd)
+				else:
+					import_rows(rows, osz)
 
 				# Finished processing file.
-				fh.close()
 
 				# -- Check for deleted/removed OUI entries --
 				# Pull list of all OUIs in journal matching current OUI size being processed
-				log.info("Checking for deleted OUI's in %s registry" % (fname))
-				for o in dm.enumerate(sz = osz):
-					# If an enumerated OUI isn't in our list of processed OUIs...
-					 if o not in ouilist:
-						# Differentiate between original IAB 36-bit OUI registry and newer MAM 36-bit OUI registry
-						if fname == 'oui36.csv' and (o[:6] == '0050C2' or o[:6] == '40D855'):
-							# The OUI isn't deleted, it's in another registry
-							log.info("OUI %s is part of IAB registry, skipping." % (o))
-							continue
-						if fname == 'iab.csv' and (o[:6] != '0050C2' and o[:6] != '40D855'):
-							# The OUI isn't deleted, it's in another registry
-							log.info("OUI %s is NOT part of IAB registry, skipping." % (o))
-							continue
-						else:
-							# Add a delete action record to the journal. Use the last available record for this OUI as a template.
-							recs = dm.get(o)
-							drec = recs[-1]
-							drec.setEvType('delete')
-							drec.setEvDate(last.strftime('%Y-%m-%d'))
-							dm.append(drec)
-							log.info("Added delete action for OUI %s to journal" % (o))
-
-							# Mark this OUI as deleted in the journal
-							dm.setDeleted(o, True)
-							log.info("Set OUI %s deleted flag to true." % (o))
-							
+				log.info("Checking for deleted OUI's in %s registry" % (reg))
+				for o in find_deleted(reg, dm.enumerate(sz = osz), ouiset):
+					# Add a delete action record to the journal. Use the last available record for this OUI as a template.
+					# (In snapshot mode the template is the snapshot entry itself, which becomes this delete record.)
+					drec = latest(o)
+					drec.setEvType('delete')
+					drec.setEvDate(last.strftime('%Y-%m-%d'))
+					changes.append(drec)
+					log.info("Added delete action for OUI %s to journal" % (o))
+
+					# Mark this OUI as deleted in the journal
+					changes.setDeleted(o, True)
+					log.info("Set OUI %s deleted flag to true." % (o))
+				changes.commit()
+
 			# End of if-file-exists block
 
+		# Day's files are all in the journal, save our progress
+		save_progress(last + datetime.timedelta(1))
+
 	prev = last
 	last = last + datetime.timedelta(1)
 	log.debug("last now %s" % (last))
 
 ### TODO: Generate final report (files processed, OUIs added/updated/removed, etc)
 
+# Save the snapshot for the next run, tagged with the date it'll pick up from
+if snap != None:
+	save_snapshot(snapfile, last, snap)
+
 # Update last run date, re-write config
 #cfg.set('dmimport', 'lastdate', today.strftime('%Y-%m-%d'))
-cfg.set('dmimport', 'lastdate', last.strftime('%Y-%m-%d'))
-with open(basedir + 'dmimport.cfg', 'wb') as fh:
-	cfg.write(fh)
-fh.close()
+save_progress(last)
+
+# All changes are in, close the repository cleanly
+if cachesize > 0:
+	log.info("Journal cache stats: %s" % (dm.cacheStats()))
+dm.end()
 
 ####
 
@@ -0,0 +1,516 @@
+#!/usr/bin/python
+
+# File   : dmLookup.py
+# Author : Jeff Mercer <jedi@jedimercer.com>
+# Purpose: MAC address lookups against a DeepMac repository
+# Written: 2026/10/17
+# Updated: 2026/10/17
+
+# 20261017 - Initial version. Resolves a MAC address to the most specific active registration covering it.
+#		   - Added findMany()/resolveMany() for resolving large numbers of MAC addresses at once with NumPy.
+#		   - Added lookup files: a lookup table saved by write_lookup() can be opened with dmLookupFile, which maps it
+#			 into memory instead of loading anything from the repository.
+
+# Registrations come in three sizes (MA-L 24-bit, MA-M 28-bit and MA-S 36-bit OUIs), and the smaller blocks are
+# carved out of bigger ones (i.e. the MA-S 70B3D5xxx blocks sit inside the MA-L 70B3D5). The owner of a MAC address
+# is the registration with the longest OUI covering it. A dmLookup loads the latest record of every active OUI once,
+# turns each OUI into the range of 48-bit MAC addresses it covers, and flattens the nested ranges into one sorted
+# table of non-overlapping ranges, each pointing at the most specific registration covering it. A lookup is then a
+# single binary search of the table, with no journal reads.
+# For bulk work (millions of addresses from an asset inventory) the table is also kept as NumPy arrays, and whole
+# arrays of MAC addresses are parsed, searched and flagged with a handful of vectorized operations. NumPy is only
+# needed for the bulk methods.
+# A lookup table can also be saved to a lookup file and opened again with dmLookupFile, so processes that only need
+# lookups don't have to connect to the repository at all. All numbers are little-endian. The file is laid out as:
+#	header		  - magic 'DMLK', format version, range, registration and string counts, and the offsets of the
+#					sections below
+#	ranges		  - the lookup table as three arrays: first addresses (uint64), last addresses + 1 (uint64) and
+#					registration positions (uint32)
+#	registrations - one fixed-width entry per registration, in OUI order: the OUI as an integer, its size and its
+#					flags (bit 0 Private)
+#	records		  - the latest record of each registration, in the same order, as pack file record entries
+#	strings		  - the string table of the records, as in pack files
+# Opening one reads nothing but the header. The rest is read through mmap as it's used, from the page cache that
+# every process with the file open shares.
+
+import os
+import re
+import mmap
+import struct
+import logging
+from bisect import bisect_right
+from deepmac_record_class import dmRecord
+from deepmac_strdict import dmStrDict
+from deepmac_pack import recentry, strentry, pack_record, unpack_record, pack_strings, unpack_string
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+# Logging configuration
+log = logging.getLogger('dm_lookup')
+handler = logging.StreamHandler()
+logformat = logging.Formatter("%(asctime)s - %(name)s %(levelname)s: %(message)s")
+handler.setFormatter(logformat)
+log.addHandler(handler)
+log.setLevel(logging.ERROR)
+
+macbits = 48
+macre = re.compile('^[0-9A-Fa-f]{12}$')
+
+# Address bits of the first octet, as bits of the integer form of a MAC address
+multicastbit = 40
+localbit = 41
+
+# Characters of a MAC address string, for turning whole arrays of them into integers: hex digits map to their value,
+# separators (and the NUL padding of NumPy strings) to 16, and anything else to 255.
+macseparators = ':-. '
+nibbles = [255] * 256
+for c in '0123456789abcdef':
+	nibbles[ord(c)] = int(c, 16)
+	nibbles[ord(c.upper())] = int(c, 16)
+for c in macseparators + '\0':
+	nibbles[ord(c)] = 16
+
+# Lookup file layout
+magic = 'DMLK'
+version = 1
+header = struct.Struct('<4sHxxIIIIIIIxxxx')
+addrentry = struct.Struct('<Q')
+slotentry = struct.Struct('<I')
+regentry = struct.Struct('<QBBxxxxxx')
+privatebit = 1
+
+####
+
+# Function to turn a MAC address into its integer form. Takes the usual notations (00:11:22:33:44:55,
+# 00-11-22-33-44-55, 0011.2233.4455, 001122334455) or an integer. Returns None if it isn't a valid MAC address.
+def mac2int(mac):
+	if isinstance(mac, (int, long)) and not isinstance(mac, bool):
+		if 0 <= mac < (1 << macbits):
+			return mac
+		return None
+	if not isinstance(mac, basestring):
+		return None
+	mac = re.sub('[:\-. ]', '', mac)
+	if not macre.match(mac):
+		return None
+	return int(mac, 16)
+
+
+# Function returning the range of MAC addresses covered by an OUI as a (first, last + 1) tuple of integers, or None
+# if the OUI isn't hex digits of one of the registry sizes.
+def ouirange(oui):
+	size = len(oui) * 4
+	if size not in (24, 28, 36):
+		return None
+	try:
+		value = int(oui, 16)
+	except ValueError:
+		return None
+	shift = macbits - size
+	return (value << shift, (value + 1) << shift)
+
+
+# Function to flatten a list of nested ranges into non-overlapping ones. 'ranges' is a list of (start, end, slot)
+# tuples where any two ranges are either disjoint or one holds the other, as OUI ranges always are. Returns a sorted
+# list of (start, end, slot) tuples, each part of the MAC address space getting the slot of the smallest range
+# covering it. Parts covered by no range are left out.
+def flatten(ranges):
+	results = []
+
+	def emit(start, end, slot):
+		if start < end:
+			results.append((start, end, slot))
+
+	# Sweep the ranges in order with a stack of the ranges open at the current position, innermost last. Bigger
+	# ranges sort first when two start at the same place, so they end up under the smaller ones.
+	stack = []
+	pos = 0
+	for (start, end, slot) in sorted(ranges, key = lambda r: (r[0], r[0] - r[1])):
+		# Close off the open ranges that end before this one starts
+		while stack and stack[-1][1] <= start:
+			top = stack.pop()
+			emit(pos, top[1], top[2])
+			pos = max(pos, top[1])
+
+		# Whatever is open now covers the gap up to this range
+		if stack:
+			emit(pos, start, stack[-1][2])
+		stack.append((start, end, slot))
+		pos = start
+
+	while stack:
+		top = stack.pop()
+		emit(pos, top[1], top[2])
+		pos = max(pos, top[1])
+
+	return results
+
+# Function to turn an array (or list) of MAC addresses into integers, all at once. Takes the same notations as mac2int(),
+# as an array of strings or of integers. Returns a tuple of two arrays: the addresses as uint64 integers, and whether
+# each one was valid (invalid addresses come out as 0). Needs NumPy.
+def macs2int(macs):
+	macs = numpy.asarray(macs)
+	if macs.ndim != 1:
+		macs = macs.reshape(-1)
+
+	# Integers just need their range checked
+	if macs.dtype.kind in 'iu':
+		valid = macs < (1 << macbits)
+		if macs.dtype.kind == 'i':
+			valid &= macs >= 0
+		values = macs.astype(numpy.uint64)
+		values[~valid] = 0
+		return (values, valid)
+
+	# Strings are handled as a matrix of characters, one row per address
+	if macs.dtype.kind == 'U':
+		try:
+			macs = macs.astype('S')
+		except UnicodeEncodeError:
+			macs = numpy.char.encode(macs, 'ascii', 'replace')
+	if macs.dtype.kind != 'S':
+		# Anything else (mixed lists, etc) is done one address at a time
+		values = [mac2int(m) for m in macs]
+		valid = numpy.array([v != None for v in values], dtype = bool)
+		return (numpy.array([v or 0 for v in values], dtype = numpy.uint64), valid)
+
+	values = numpy.zeros(len(macs), dtype = numpy.uint64)
+	if len(macs) == 0 or macs.itemsize == 0:
+		return (values, numpy.zeros(len(macs), dtype = bool))
+	chars = numpy.ascontiguousarray(macs).view(numpy.uint8).reshape(len(macs), macs.itemsize)
+	digits = numpy.array(nibbles, dtype = numpy.uint8)[chars]
+
+	# A valid address has exactly 12 hex digits and nothing but separators around them
+	ishex = digits < 16
+	valid = (ishex.sum(axis = 1) == 12) & ~(digits == 255).any(axis = 1)
+	hexdigits = digits[valid][ishex[valid]].reshape(-1, 12).astype(numpy.uint64)
+	v = numpy.zeros(len(hexdigits), dtype = numpy.uint64)
+	for k in xrange(12):
+		v = v * numpy.uint64(16) + hexdigits[:, k]
+	values[valid] = v
+	return (values, valid)
+
+
+# Function to read a file of MAC addresses, one per line (blank lines are skipped), into an array of strings for
+# findMany() or resolveMany(). Needs NumPy.
+def readmacs(fname):
+	fh = open(fname, 'rb')
+	macs = fh.read().split()
+	fh.close()
+	return numpy.array(macs, dtype = 'S')
+
+####
+
+# Class for looking up the owners of MAC addresses. Built from a connected dmManager instance, it holds a copy of the
+# latest record of every OUI in the lookup table, so it doesn't change when the repository does; make a new one to
+# pick up changes. Deleted OUIs (flagged deleted, or whose latest record is a delete) are never matched, and private
+# OUIs are only matched if 'prvflag' is True. Instances can be shared between threads.
+class dmLookup(object):
+	# Function to find the registration covering a MAC address. Returns its position in ouis/records, or None if no
+	# registration in the table covers it.
+	def find(self, mac):
+		# Integers in range go straight to the search, everything else through mac2int()
+		if type(mac) is not int or not 0 <= mac < 0x1000000000000:
+			mac = mac2int(mac)
+			if mac == None:
+				log.warn("An invalid MAC address was specified for lookup")
+				return None
+		i = bisect_right(self.starts, mac) - 1
+		if i >= 0 and mac < self.ends[i]:
+			return self.slots[i]
+		return None
+
+	# Function returning the latest record (a dmRecord) of the registration covering a MAC address, or None
+	def lookup(self, mac):
+		slot = self.find(mac)
+		if slot == None:
+			return None
+		return self.record(slot)
+
+	# Function returning the OUI of the registration covering a MAC address, or None
+	def owner(self, mac):
+		slot = self.find(mac)
+		if slot == None:
+			return None
+		return self.oui(slot)
+
+	# Functions returning the latest record and the OUI of the registration at a position
+	def record(self, slot):
+		return self.records[slot]
+
+	def oui(self, slot):
+		return self.ouis[slot]
+
+	# Function to find the registrations covering an array of MAC addresses (see macs2int() for what it takes). Returns
+	# an array of their positions in ouis/records, -1 for addresses that are invalid or not covered by any registration.
+	# Returns None if NumPy isn't available.
+	def findMany(self, macs):
+		if numpy == None:
+			log.error("NumPy is needed for bulk lookups, but isn't installed")
+			return None
+		(values, valid) = macs2int(macs)
+		return self.search(values, valid)
+
+	# Function to search the lookup table for an array of uint64 MAC addresses, 'valid' saying which ones to look for
+	def search(self, values, valid):
+		(starts, ends, slots) = self.vectors()
+		if len(starts) == 0:
+			return numpy.full(len(values), -1, dtype = numpy.int64)
+		i = numpy.searchsorted(starts, values, side = 'right').astype(numpy.int64) - 1
+		found = valid & (i >= 0)
+		found[found] = values[found] < ends[i[found]]
+		return numpy.where(found, slots[numpy.maximum(i, 0)], -1)
+
+	# Function to resolve an array of MAC addresses (see macs2int() for what it takes) in one go. Returns a dict of
+	# arrays, one entry per address in each:
+	#	MAC		  - The address as a uint64 integer (0 if invalid)
+	#	Valid	  - Whether the address is a valid MAC address
+	#	OUI		  - OUI of the registration covering it, or None
+	#	OrgName	  - OrgName of that registration's latest record, or None
+	#	Private	  - Whether that registration is private
+	#	Local	  - Whether the address is locally administered (its OUI bits weren't assigned by the IEEE)
+	#	Multicast - Whether the address is a multicast (group) address
+	# Returns None if NumPy isn't available.
+	def resolveMany(self, macs):
+		log.debug("resolveMany() starting")
+		if numpy == None:
+			log.error("NumPy is needed for bulk lookups, but isn't installed")
+			return None
+		(values, valid) = macs2int(macs)
+		slots = self.search(values, valid)
+
+		# The registration columns have an extra None/False entry on the end, picked by the -1 of unmatched addresses
+		if self.columns == None:
+			(ouis, records, private) = self.registrations()
+			self.columns = {
+				'OUI': numpy.array(ouis + [None], dtype = object),
+				'OrgName': numpy.array([r.getOrgName() for r in records] + [None], dtype = object),
+				'Private': numpy.array(private + [False], dtype = bool)
+			}
+		results = {'MAC': values, 'Valid': valid}
+		for (key, column) in self.columns.iteritems():
+			results[key] = column[slots]
+		results['Local'] = valid & ((values >> numpy.uint64(localbit)) & numpy.uint64(1) == 1)
+		results['Multicast'] = valid & ((values >> numpy.uint64(multicastbit)) & numpy.uint64(1) == 1)
+
+		log.debug("%d addresses, %d resolved" % (len(values), (slots >= 0).sum()))
+		log.debug("resolveMany() ending")
+		return results
+
+	# Function returning the lookup table as NumPy arrays (starts, ends, slots), made the first time they're needed
+	def vectors(self):
+		if self.arrays == None:
+			self.arrays = (numpy.array(self.starts, dtype = numpy.uint64), numpy.array(self.ends, dtype = numpy.uint64),
+						   numpy.array(self.slots, dtype = numpy.int64))
+		return self.arrays
+
+	# Function returning the registrations as three lists in table order: OUIs, latest records and private flags
+	def registrations(self):
+		return (self.ouis, self.records, self.private)
+
+	def __len__(self):
+		return len(self.ouis)
+
+	# Called upon instantiation of the object. 'dmmgr' is a connected dmManager instance to load the registrations
+	# from, 'prvflag' whether private OUIs are included.
+	def __init__(self, dmmgr, prvflag = True):
+		log.debug("__init__() starting")
+		log.debug("prvflag = %s" % (prvflag))
+
+		# Registrations, in OUI order. The lookup table refers to them by position.
+		self.ouis = []
+		self.records = []
+		self.private = []
+
+		ranges = []
+		latest = dmmgr.latest()
+		if latest == None:
+			raise ValueError("Couldn't load the latest records from the repository")
+		lists = [dmmgr.enumerate(0, True, False), dmmgr.enumerate(0, False, False), dmmgr.enumerate(0, prvflag, False)]
+		if None in lists:
+			raise ValueError("Couldn't enumerate the OUIs of the repository")
+		private = set(lists[0]) - set(lists[1])
+		for oui in sorted(lists[2]):
+			rec = latest.get(oui)
+			if rec is None or rec.getEvType() == 'delete':
+				continue
+			r = ouirange(oui)
+			if r == None:
+				log.warn("Skipping OUI %s, not a valid registry OUI" % (oui))
+				continue
+			ranges.append((r[0], r[1], len(self.ouis)))
+			self.ouis.append(oui)
+			self.records.append(rec)
+			self.private.append(oui in private)
+
+		# The lookup table, as three lists indexed together: first address, last address + 1, and registration
+		table = flatten(ranges)
+		self.starts = [t[0] for t in table]
+		self.ends = [t[1] for t in table]
+		self.slots = [t[2] for t in table]
+		self.arrays = None
+		self.columns = None
+
+		log.info("Lookup table has %d ranges for %d registrations" % (len(table), len(self.ouis)))
+		log.debug("__init__() ending")
+		return None
+
+####
+
+# Function to save the lookup table of a dmLookup instance to a lookup file. The file is written alongside and renamed
+# over 'fname', so processes that already have the old one open keep reading it. Returns the number of registrations
+# written.
+def write_lookup(fname, lookup):
+	log.debug("write_lookup() starting")
+	log.debug("fname = %s" % (fname))
+
+	(ouis, records, private) = lookup.registrations()
+	strings = dmStrDict()
+	regs = []
+	recs = []
+	for (oui, rec, prv) in zip(ouis, records, private):
+		regs.append(regentry.pack(int(oui, 16), len(oui) * 4, privatebit if prv else 0))
+		recs.append(pack_record(rec.todict(), strings))
+
+	# Lay out the sections one after another
+	count = len(lookup.starts)
+	rangeoff = header.size
+	tableend = rangeoff + count * (2 * addrentry.size + slotentry.size)
+	regoff = tableend + (-tableend % addrentry.size)
+	recoff = regoff + regentry.size * len(regs)
+	stroff = recoff + recentry.size * len(recs)
+
+	try:
+		fh = open(fname + '.tmp', 'wb')
+		fh.write(header.pack(magic, version, count, len(regs), len(strings), rangeoff, regoff, recoff, stroff))
+		fh.write(struct.pack('<%dQ' % (count), *lookup.starts))
+		fh.write(struct.pack('<%dQ' % (count), *lookup.ends))
+		fh.write(struct.pack('<%dI' % (count), *lookup.slots))
+		fh.write('\0' * (regoff - tableend))
+		fh.write(''.join(regs))
+		fh.write(''.join(recs))
+		fh.write(pack_strings(strings))
+		fh.flush()
+		os.fsync(fh.fileno())
+		fh.close()
+		os.rename(fname + '.tmp', fname)
+	except Exception as e:
+		log.error("Unknown error while trying to write lookup file %s" % (fname))
+		log.error("Exception triggered: %s" % (e))
+		raise
+
+	log.info("Wrote lookup file %s (%d ranges, %d registrations)" % (fname, count, len(regs)))
+	log.debug("write_lookup() ending")
+	return len(regs)
+
+####
+
+# Class for looking up the owners of MAC addresses in a lookup file written by write_lookup(). It works the same as
+# a dmLookup (the bulk methods included), but nothing is loaded up front: the file is mapped into memory and the
+# table is searched in place. Instances can be shared between threads.
+class dmLookupFile(dmLookup):
+	# Function to find the registration covering a MAC address. Returns its position in the file, or None if no
+	# registration in the table covers it.
+	def find(self, mac):
+		if type(mac) is not int or not 0 <= mac < 0x1000000000000:
+			mac = mac2int(mac)
+			if mac == None:
+				log.warn("An invalid MAC address was specified for lookup")
+				return None
+
+		# Find the last range starting at or before the address. NumPy can search the mapped array of first addresses
+		# directly, otherwise it's a binary search reading them one at a time.
+		mm = self.mm
+		if numpy != None:
+			i = int(self.vectors()[0].searchsorted(numpy.uint64(mac), 'right')) - 1
+		else:
+			starts = self.rangeoff
+			lo = 0
+			hi = self.count
+			while lo < hi:
+				mid = (lo + hi) // 2
+				if mac < addrentry.unpack_from(mm, starts + mid * addrentry.size)[0]:
+					hi = mid
+				else:
+					lo = mid + 1
+			i = lo - 1
+		if i >= 0 and mac < addrentry.unpack_from(mm, self.endoff + i * addrentry.size)[0]:
+			return slotentry.unpack_from(mm, self.slotoff + i * slotentry.size)[0]
+		return None
+
+	def record(self, slot):
+		return dmRecord.fromdict(unpack_record(self.mm, self.recoff + slot * recentry.size, self.string))
+
+	def oui(self, slot):
+		(value, size, flags) = regentry.unpack_from(self.mm, self.regoff + slot * regentry.size)
+		return u'%0*X' % (size / 4, value)
+
+	# Function returning a string from the string table by its number
+	def string(self, num):
+		return unpack_string(self.mm, self.stroff, self.strcount, num)
+
+	# The table arrays are views straight into the mapped file, nothing is copied
+	def vectors(self):
+		if self.arrays == None:
+			self.arrays = (numpy.frombuffer(self.mm, dtype = '<u8', count = self.count, offset = self.rangeoff),
+						   numpy.frombuffer(self.mm, dtype = '<u8', count = self.count, offset = self.endoff),
+						   numpy.frombuffer(self.mm, dtype = '<u4', count = self.count, offset = self.slotoff))
+		return self.arrays
+
+	def registrations(self):
+		ouis = [self.oui(slot) for slot in xrange(self.regcount)]
+		records = [self.record(slot) for slot in xrange(self.regcount)]
+		private = [bool(regentry.unpack_from(self.mm, self.regoff + slot * regentry.size)[2] & privatebit)
+				   for slot in xrange(self.regcount)]
+		return (ouis, records, private)
+
+	def __len__(self):
+		return self.regcount
+
+	# Function to unmap and close the lookup file
+	def close(self):
+		if self.mm != None:
+			self.arrays = None
+			self.mm.close()
+			self.fh.close()
+		self.mm = None
+		return None
+
+	# Called upon instantiation of the object. 'fname' is the lookup file to open, a ValueError is raised if it isn't
+	# one this version can read.
+	def __init__(self, fname):
+		log.debug("__init__() starting")
+		log.debug("fname = %s" % (fname))
+		self.fname = fname
+		self.mm = None
+		self.arrays = None
+		self.columns = None
+
+		self.fh = open(fname, 'rb')
+		try:
+			self.mm = mmap.mmap(self.fh.fileno(), 0, access = mmap.ACCESS_READ)
+			if len(self.mm) < header.size:
+				raise ValueError("%s is too short to be a lookup file" % (fname))
+			(m, v, self.count, self.regcount, self.strcount, self.rangeoff, self.regoff, self.recoff, self.stroff) = header.unpack_from(self.mm, 0)
+			if m != magic:
+				raise ValueError("%s is not a lookup file" % (fname))
+			if v != version:
+				raise ValueError("%s is lookup format version %d, expected %d" % (fname, v, version))
+			self.endoff = self.rangeoff + self.count * addrentry.size
+			self.slotoff = self.endoff + self.count * addrentry.size
+			if self.stroff + self.strcount * strentry.size > len(self.mm):
+				raise ValueError("%s is truncated" % (fname))
+		except Exception:
+			self.close()
+			self.fh.close()
+			raise
+
+		log.debug("__init__() ending")
+		return None
+
+####
+
+# End-of-line
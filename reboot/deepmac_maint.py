@@ -0,0 +1,101 @@
+#!/usr/bin/python
+
+# File	 : dmMaint.py
+# Author : Jeff Mercer <jedi@jedimercer.com>
+# Purpose: Maintenance operations on a DeepMac repository
+# Written: 2026/10/17
+# Updated: 2026/10/17
+
+# 20261017 - Initial version. Supports converting legacy journal files to the one-record-per-line format.
+#		   - Added rebuilding the OUI manifest of a filesystem repository.
+#		   - Added recovering a repository after an interrupted write.
+#		   - Added moving journals into pack files.
+#		   - Replaced the pack operation with compact, which moves OUI flags into the packs too and removes the OUI directories.
+#		   - Added writing a lookup file for dmLookupFile.
+#		   - Added checking the web service and web connections against the repository, on localhost.
+
+# Usage: deepmac_maint.py [-t type] [-c user:pass] [-o output] <repository address> <operation>
+#	migrate	 - Convert any legacy {"recs": [...]} journal files to the current format.
+#	manifest - Rebuild the OUI manifest from the journal tree.
+#	recover	 - Repair torn writes left in journal files and rebuild the manifest.
+#	compact	 - Move the per-OUI directories (records and flag files) into one pack file per top-level shard.
+#	lookup	 - Write a MAC address lookup file (see deepmac_lookup.py) of the active registrations to the output file.
+#	webcheck - Serve the repository with deepmac_web.py on a local port and check that a web connection to it reads
+#			   the same as the repository does.
+
+import sys
+import logging
+import argparse
+from deepmac_manager import dmManager
+from deepmac_lookup import dmLookup, write_lookup
+from deepmac_web import check_service
+
+# Logging configuration
+log = logging.getLogger('dm_maint')
+handler = logging.StreamHandler()
+logformat = logging.Formatter("%(asctime)s - %(name)s %(levelname)s: %(message)s")
+handler.setFormatter(logformat)
+log.addHandler(handler)
+log.setLevel(logging.INFO)
+
+# Parse command line
+parser = argparse.ArgumentParser(description = 'Maintenance operations on a DeepMac repository')
+parser.add_argument('-t', '--type', default = 'filesystem', help = 'Repository connection type (default: filesystem)')
+parser.add_argument('-c', '--creds', default = None, help = 'Credentials as user:pass, if the repository type needs them')
+parser.add_argument('-o', '--output', default = 'deepmac.lookup', help = 'Output file of the lookup operation (default: deepmac.lookup)')
+parser.add_argument('address', help = 'Repository address (journal directory for filesystem repositories)')
+parser.add_argument('operation', choices = ['migrate', 'manifest', 'recover', 'compact', 'lookup', 'webcheck'], help = 'Maintenance operation to perform')
+args = parser.parse_args()
+
+# Split credentials into the dict format dmConnector expects
+creds = None
+if args.creds != None:
+	(u, p) = args.creds.split(':', 1)
+	creds = { 'u': u, 'p': p }
+
+# Establish a connection to the DeepMac repository
+dm = dmManager(args.type, args.address, creds)
+
+#### Main Execution ###
+
+if args.operation == 'migrate':
+	count = dm.migrate()
+	if count == None:
+		log.error("Migration failed.")
+		sys.exit(1)
+	log.info("Converted %d journal files." % (count))
+elif args.operation == 'manifest':
+	count = dm.rebuildManifest()
+	if count == None:
+		log.error("Manifest rebuild failed.")
+		sys.exit(1)
+	log.info("Manifest lists %d OUIs." % (count))
+elif args.operation == 'recover':
+	count = dm.recover()
+	if count == None:
+		log.error("Recovery failed.")
+		sys.exit(1)
+	log.info("Repaired %d journal files." % (count))
+elif args.operation == 'compact':
+	count = dm.compact()
+	if count == None:
+		log.error("Compaction failed.")
+		sys.exit(1)
+	log.info("Compacted %d OUI directories." % (count))
+elif args.operation == 'lookup':
+	count = write_lookup(args.output, dmLookup(dm))
+	log.info("Wrote %d registrations to lookup file %s." % (count, args.output))
+elif args.operation == 'webcheck':
+	problems = check_service(dm)
+	for problem in problems:
+		log.error(problem)
+	if problems:
+		log.error("Web service check found %d differences." % (len(problems)))
+		sys.exit(1)
+	log.info("Web service check passed.")
+
+dm.end()
+
+####
+
+# End-of-line
@@ -4,18 +4,48 @@
 # Author : Jeff Mercer <jedi@jedimercer.com>
 # Purpose: Class definition for DeepMac Repository Manager
 # Written: 2014/04/25
-# Updated: 2019/05/24
+# Updated: 2026/10/17
 
 # 20180125 - Adjusted logging levels, replaced many printed errors with logged, similar tweaks.
 # 20190521 - Added debug line for when a record is detected as invalid, now displays invalid record data.
 # 20190524 - Trivial clean-up of commented out code, whitespace, etc.
+# 20261017 - Journal record files are now append-only, one JSON record per line. Legacy {"recs": [...]}
+#			 files are still readable, are converted on their next append, and can be converted in bulk with migrate().
+#		   - Added the database repository interface, backed by the embedded SQLite database opened by dmConnector.
+#		   - Filesystem repositories now keep a manifest of OUIs (size, flags, record count, last event date), updated
+#			 by append/setPrivate/setDeleted. Enumeration scans the manifest instead of walking the journal tree.
+#		   - Fixed setting a flag to False reporting failure after the flag file was successfully removed.
+#		   - Added latest() to load the most recent record of every OUI in one call.
+#		   - Added holdManifest()/releaseManifest()/mergeManifest() so worker processes can share a repository.
+#		   - Added batch(), returning a dmChangeSet that groups appends and flag changes by OUI and commits them
+#			 together: one journal write per OUI on filesystems, one transaction on databases.
+#		   - Journal writes are now synced to disk. A dirty marker is kept (and locked) while a filesystem repository is
+#			 being written, and if it's found unlocked on connect the journal is recovered: torn writes at the end of
+#			 journal files are cut off and the manifest rebuilt. Manifest loading skips damaged lines. Added recover().
+#		   - Added an optional LRU cache of get() results (cachesize parameter), dropped for an OUI whenever its
+#			 journal is written. Hit/miss/eviction counts are available from cacheStats().
+#		   - Added getMany() to get the records of many OUIs at once, read by a thread pool (filesystem) or in a few
+#			 large queries (database).
+#		   - Journal files are now kept in EventDate order: appends of older records rewrite the journal with them merged
+#			 in, and migrate() re-orders any journal found out of order. Added getLatest() and getAsOf(), which read
+#			 the end of the journal file instead of the whole thing.
+#		   - Records read from journals and databases are now made with dmRecord.fromraw(), so they're only decoded
+#			 when used. Sorting them only has to pick out their EventDate.
+#		   - Filesystem repositories can hold journals in pack files as well as per-OUI records files, see pack(). Reads
+#			 combine an OUI's packed records with any in its records file.
+#		   - pack() is now compact(), which also moves the OUI flags into the packs and removes the OUI directories. The
+#			 directory tree is an overlay on the packs, holding the records and flags of OUIs written to since.
+#		   - Manifest entries now carry the fingerprint and event type of the OUI's latest record, see getFingerprint().
+#		   - Added the web repository interface, a read-only client of the HTTP service in deepmac_web.py.
+#		   - Implemented search(), answered from a search index of all journal records (see deepmac_search.py) made on
+#			 the first search and kept up to date by append() and change set commits.
 
 # TODO: Add additional functions:
 # TODO: 	Metadata manipulation functions
 # TODO: 	Statistics reporting?
 
 # Library of functions for managing records in DeepMac journals. Supports multiple back-end storage
-# methods (coming soon!), searching journals using multiple criteria, and updating journals with new
+# methods (filesystem and SQLite database so far), searching journals using multiple criteria, and updating journals with new
 # DeepMac records.
 # The dmManager library is the heart of the DeepMac Project's automation of tracking
 # official IEEE hardware address registry changes and associated metadata from multiple sources.
@@ -25,9 +55,18 @@ import os
 import re
 import logging
 import codecs
+import errno
+import fcntl
+import urllib
+import threading
+import collections
+import multiprocessing.pool
 import simplejson as json
 from deepmac_record_class import dmRecord
 from deepmac_connector import dmConnector
+from deepmac_pack import dmPackFile, write_pack
+from deepmac_lookup import dmLookup
+from deepmac_search import dmSearchIndex, queryre
 
 # Logging configuration
 log = logging.getLogger('dm_mgr')
@@ -39,6 +78,11 @@ log.setLevel(logging.ERROR)
 
 					###### Filesystem Interface ######
 
+# Function to normalize an OUI string to the form used as a repository key (no separators, uppercase)
+def normoui(oui):
+	return re.sub('[:\-]', '', oui).upper()
+
+
 # Function to check if a specific OUI is private or not, via filesystem connection
 def ispriv_by_file(dmmgr, oui):
 	log.debug("priv_by_file() starting")
@@ -46,6 +90,13 @@ def ispriv_by_file(dmmgr, oui):
 	# This function assumes dmmgr has a valid connection and the OUI given is a valid format!
 	path = dmmgr.dmh.mkOUIPath(oui)
 
+	# Packed OUIs without a records file of their own have their flags in the pack
+	flags = packed_flags(dmmgr, oui)
+	if flags != None:
+		log.info("Packed OUI, returning %s." % (flags['Private']))
+		log.debug("priv_by_file() ending")
+		return flags['Private']
+
 	### Check if directory exists, if not then we return None.
 	if not os.path.isdir(path):
 		log.info("Path %s does not exist, returning None" % (path))
@@ -71,6 +122,13 @@ def isdel_by_file(dmmgr, oui):
 	# This function assumes dmmgr has a valid connection and the OUI given is a valid format!
 	path = dmmgr.dmh.mkOUIPath(oui)
 
+	# Packed OUIs without a records file of their own have their flags in the pack
+	flags = packed_flags(dmmgr, oui)
+	if flags != None:
+		log.info("Packed OUI, returning %s." % (flags['Deleted']))
+		log.debug("isdel_by_file() ending")
+		return flags['Deleted']
+
 	### Check if directory exists, if not then we return None.
 	if not os.path.isdir(path):
 		log.info("Path %s does not exist, returning None" % (path))
@@ -96,6 +154,15 @@ def setdel_by_file(dmmgr, oui, bool):
 	# This function assumes dmmgr has a valid connection and the OUI given is a valid format!
 	path = dmmgr.dmh.mkOUIPath(oui)
 
+	# A packed OUI only needs a directory of its own if the flag actually changes
+	flags = packed_flags(dmmgr, oui)
+	if flags != None:
+		if flags['Deleted'] == bool:
+			log.info("Packed OUI already has a Deleted flag of %s" % (bool))
+			log.debug("setdel_by_file() ending")
+			return True
+		overlay_by_file(dmmgr, oui)
+
 	### Check if directory exists, if not then we return None.
 	if not os.path.isdir(path):
 		log.info("Path %s does not exist, returning None" % (path))
@@ -111,9 +178,12 @@ def setdel_by_file(dmmgr, oui, bool):
 			return True
 		else:
 			# Need to delete this flag file
-			stat = os.remove(path + '.deleted')
+			mark_dirty_by_file(dmmgr)
+			os.remove(path + '.deleted')
+			stat = not os.path.isfile(path + '.deleted')
 			if stat:
 				log.info(".deleted flag successfully removed")
+				update_manifest_by_file(dmmgr, oui, Deleted = False)
 				log.debug("setdel_by_file() ending")
 				return True
 			else:
@@ -128,6 +198,7 @@ def setdel_by_file(dmmgr, oui, bool):
 			return True
 		else:
 			# Create an empty file to indicate the OUI is deleted from the registry
+			mark_dirty_by_file(dmmgr)
 			try:
 				fh = open(path + '.deleted', 'w')
 				fh.close()
@@ -138,6 +209,7 @@ def setdel_by_file(dmmgr, oui, bool):
 			stat = os.path.isfile(path + '.deleted')
 			if stat:
 				log.info(".deleted flag successfully created")
+				update_manifest_by_file(dmmgr, oui, Deleted = True)
 				log.debug("setdel_by_file() ending")
 				return True
 			else:
@@ -153,6 +225,15 @@ def setpriv_by_file(dmmgr, oui, bool):
 	# This function assumes dmmgr has a valid connection and the OUI given is a valid format!
 	path = dmmgr.dmh.mkOUIPath(oui)
 
+	# A packed OUI only needs a directory of its own if the flag actually changes
+	flags = packed_flags(dmmgr, oui)
+	if flags != None:
+		if flags['Private'] == bool:
+			log.info("Packed OUI already has a Private flag of %s" % (bool))
+			log.debug("setpriv_by_file() ending")
+			return True
+		overlay_by_file(dmmgr, oui)
+
 	### Check if directory exists, if not then we return None.
 	if not os.path.isdir(path):
 		log.info("Path %s does not exist, returning None" % (path))
@@ -168,9 +249,12 @@ def setpriv_by_file(dmmgr, oui, bool):
 			return True
 		else:
 			# Need to delete this flag file
-			stat = os.remove(path + '.private')
+			mark_dirty_by_file(dmmgr)
+			os.remove(path + '.private')
+			stat = not os.path.isfile(path + '.private')
 			if stat:
 				log.info(".private flag successfully removed")
+				update_manifest_by_file(dmmgr, oui, Private = False)
 				log.debug("setpriv_by_file() ending")
 				return True
 			else:
@@ -185,6 +269,7 @@ def setpriv_by_file(dmmgr, oui, bool):
 			return True
 		else:
 			# Create an empty file to indicate the OUI is deleted from the registry
+			mark_dirty_by_file(dmmgr)
 			try:
 				fh = open(path + '.private', 'w')
 				fh.close()
@@ -196,6 +281,7 @@ def setpriv_by_file(dmmgr, oui, bool):
 			stat = os.path.isfile(path + '.private')
 			if stat:
 				log.info(".private flag successfully created")
+				update_manifest_by_file(dmmgr, oui, Private = True)
 				log.debug("setpriv_by_file() ending")
 				return True
 			else:
@@ -204,18 +290,851 @@ def setpriv_by_file(dmmgr, oui, bool):
 				return False
 
 
+# Function to determine if a journal file is in the legacy format, a single JSON document of the form
+# {"recs": [...]}. Current journals hold one JSON record per line. Returns True for a legacy journal.
+def islegacy_journal(fname):
+	log.debug("islegacy_journal() starting")
+
+	fh = codecs.open(fname, 'r', encoding='utf-8')
+	line = fh.readline().strip()
+	fh.close()
+
+	# Empty files have nothing to convert
+	if line == '':
+		log.debug("islegacy_journal() ending")
+		return False
+
+	# A legacy journal written with indentation has just the opening brace on its first line. One without
+	# indentation parses, but as the wrapping dict rather than a record. Anything else that doesn't parse is
+	# a damaged record, not a legacy journal.
+	if line == '{':
+		log.debug("islegacy_journal() ending")
+		return True
+	try:
+		j = json.loads(line)
+	except ValueError:
+		log.debug("islegacy_journal() ending")
+		return False
+
+	log.debug("islegacy_journal() ending")
+	return ('recs' in j)
+
+
+# Function to read a journal file in either format. Returns a list of record dicts, in file order.
+def load_journal(fname):
+	log.debug("load_journal() starting")
+	log.debug("fname = %s" % (fname))
+
+	# Open the record file, bail if error occurs
+	try:
+		fh = codecs.open(fname, 'r', encoding='utf-8')
+	except Exception as e:
+		log.error("ERROR: Couldn't open file %s for reading." % (fname))
+		log.error("Exception triggered: %s" % (e))
+		raise
+
+	# Read record file contents. The first line tells us which format we're dealing with.
+	try:
+		first = fh.readline()
+		legacy = (first.strip() == '{')
+		if not legacy and first.strip() != '':
+			j = json.loads(first)
+			legacy = 'recs' in j
+
+		if legacy:
+			jarr = json.loads(first + fh.read())['recs']
+		else:
+			jarr = []
+			if first.strip() != '':
+				jarr.append(j)
+			for line in fh:
+				if line.strip() != '':
+					jarr.append(json.loads(line))
+	except Exception as e:
+		log.error("ERROR: Unknown error while trying to read file %s" % (fname))
+		log.error("Exception triggered: %s" % (e))
+		raise
+
+	# Close the record file
+	fh.close()
+
+	log.debug("load_journal() ending")
+	return jarr
+
+
+# Function to rewrite a single journal file in the one-record-per-line format, with its records in EventDate
+# order (records with the same date keep their order). The new journal is written to a temporary file and
+# renamed over the original, so the original stays intact if anything fails.
+def migrate_journal(fname):
+	log.debug("migrate_journal() starting")
+	log.debug("fname = %s" % (fname))
+
+	jarr = load_journal(fname)
+	jarr.sort(key = lambda r: r.get('EventDate', ''))
+
+	try:
+		fh = codecs.open(fname + '.tmp', 'w', encoding='utf-8')
+		for r in jarr:
+			fh.write(json.dumps(r, ensure_ascii = False, sort_keys = True) + u'\n')
+		sync_file(fh)
+		fh.close()
+		os.rename(fname + '.tmp', fname)
+	except Exception as e:
+		log.error("Unknown error while trying to convert file %s" % (fname))
+		log.error("Exception triggered: %s" % (e))
+		raise
+
+	log.info("Converted journal file %s (%d records)" % (fname, len(jarr)))
+	log.debug("migrate_journal() ending")
+	return True
+
+
+# Function to flush an open file all the way to disk, so it survives a crash once this returns
+def sync_file(fh):
+	fh.flush()
+	os.fsync(fh.fileno())
+
+
+# Function to check if the records of a journal file are in EventDate order. Returns False for legacy journals,
+# which were never kept in order.
+def isordered_journal(fname):
+	if islegacy_journal(fname):
+		return False
+
+	last = ''
+	for r in load_journal(fname):
+		if r.get('EventDate', '') < last:
+			return False
+		last = r.get('EventDate', '')
+	return True
+
+
+# Generator to read the lines of a journal file backwards, from the end, a block at a time. Lines are returned
+# as raw (UTF-8 encoded) strings without their line endings.
+def tail_journal(fname, blocksize = 4096):
+	fh = open(fname, 'rb')
+	try:
+		fh.seek(0, 2)
+		pos = fh.tell()
+		buf = ''
+		while pos > 0:
+			n = min(blocksize, pos)
+			pos -= n
+			fh.seek(pos)
+			buf = fh.read(n) + buf
+
+			# Everything after the first line break in the buffer is whole lines, the rest may continue further back
+			lines = buf.split('\n')
+			buf = lines.pop(0)
+			for line in reversed(lines):
+				yield line
+		yield buf
+	finally:
+		fh.close()
+
+
+# Function to add records to a journal file, keeping it in EventDate order. 'recs' is a list of (EventDate, JSON)
+# tuples and 'lastdate' is the latest EventDate already in the journal. Records no older than that are simply
+# appended. Otherwise the journal is rewritten with the records merged in, through a temporary file renamed over
+# the original. Records with the same date go after those already in the journal, in the order given.
+def journal_records(fname, recs, lastdate):
+	log.debug("journal_records() starting")
+	recs = sorted(recs, key = lambda r: r[0])
+
+	# A new journal file has nothing to keep its records in order with (the OUI's older records may be in a pack)
+	if not os.path.isfile(fname):
+		lastdate = ''
+
+	# Journals still in the legacy format get converted first, so the new records can simply be appended.
+	if os.path.isfile(fname) and islegacy_journal(fname):
+		log.info("Journal file is in legacy format, converting before append")
+		migrate_journal(fname)
+
+	if recs[0][0] >= lastdate:
+		# Append all of the new records in a single write
+		try:
+			fh = codecs.open(fname, 'a', encoding='utf-8')
+			fh.write(u''.join([r[1] + u'\n' for r in recs]))
+			sync_file(fh)
+			fh.close()
+		except Exception as e:
+			log.error("Unknown error while trying to update file %s (append)" % (fname))
+			log.error("Exception triggered: %s" % (e))
+			raise
+		log.info("Appended %d records to journal file %s" % (len(recs), fname))
+	else:
+		# Merge the new records in among the existing ones
+		log.info("Records older than %s for journal file %s, rewriting it in order" % (lastdate, fname))
+		lines = [(r.get('EventDate', ''), json.dumps(r, ensure_ascii = False, sort_keys = True)) for r in load_journal(fname)]
+		for r in recs:
+			i = len(lines)
+			while i > 0 and lines[i - 1][0] > r[0]:
+				i -= 1
+			lines.insert(i, r)
+
+		try:
+			fh = codecs.open(fname + '.tmp', 'w', encoding='utf-8')
+			fh.write(u''.join([l[1] + u'\n' for l in lines]))
+			sync_file(fh)
+			fh.close()
+			os.rename(fname + '.tmp', fname)
+		except Exception as e:
+			log.error("Unknown error while trying to update file %s (rewrite)" % (fname))
+			log.error("Exception triggered: %s" % (e))
+			raise
+
+	log.debug("journal_records() ending")
+	return True
+
+
+# Function to repair a journal file left with a torn write. Records are only ever appended as whole lines, so
+# a crash mid-write can only leave an incomplete line (or junk) at the very end. Those trailing lines are cut
+# off, back to the last complete record. Returns True if the file was repaired.
+def repair_journal(fname):
+	log.debug("repair_journal() starting")
+	log.debug("fname = %s" % (fname))
+
+	# Legacy journals are only ever replaced whole, so there's nothing to repair
+	if islegacy_journal(fname):
+		log.debug("repair_journal() ending")
+		return False
+
+	# Find where the last good line ends. Lines must be complete (end with a newline) and hold a JSON record.
+	fh = open(fname, 'rb+')
+	good = 0
+	pos = 0
+	bad = False
+	for line in fh:
+		pos += len(line)
+		if line.strip() == '':
+			if not bad:
+				good = pos
+			continue
+		try:
+			if not line.endswith('\n'):
+				raise ValueError("incomplete line")
+			json.loads(line)
+		except ValueError:
+			bad = True
+			continue
+
+		# A good record after a bad one means damage that a torn write can't explain, so leave the file alone
+		if bad:
+			log.error("Journal file %s is damaged before its last record, not repairing" % (fname))
+			fh.close()
+			log.debug("repair_journal() ending")
+			return False
+		good = pos
+
+	# Cut off the torn end of the file
+	if pos != good:
+		log.warn("Truncating torn write at the end of %s (%d bytes)" % (fname, pos - good))
+		fh.truncate(good)
+		sync_file(fh)
+	fh.close()
+
+	# If the torn write was the OUI's first record there's nothing left, so it never made it into the journal
+	if pos != good and good == 0:
+		log.warn("No records left in %s, removing it" % (fname))
+		os.remove(fname)
+		if not os.listdir(os.path.dirname(fname)):
+			os.rmdir(os.path.dirname(fname))
+
+	log.debug("repair_journal() ending")
+	return (pos != good)
+
+
+# Journals can also be kept in pack files (see deepmac_pack.py), one per top-level shard in the 'packs' directory at
+# the top of the journal, made by compact(). The directory tree is an overlay on the packs for OUIs written to since.
+# An OUI's records are those in its shard's pack followed by any in its records file, taken together in EventDate
+# order. Its flags are those in the pack, unless it has a records file, in which case its flag files are what count.
+# The first write to a packed OUI gives it a records file (empty if need be) with the pack's flags copied into flag
+# files (see overlay_by_file()). Packs are opened on first use and stay mapped until the dmManager instance ends, or
+# until the pack file is replaced (by compact() in this or another process), which is checked for on every use.
+
+# Function to make the file name of a shard's pack
+def packname(dmmgr, shard):
+	return dmmgr.dmh.addr + 'packs/' + shard + '.pack'
+
+
+# Function to return the pack of the shard an OUI is in, opening it if needed. Returns None if there's no such pack.
+def open_pack_by_file(dmmgr, oui):
+	shard = normoui(oui)[0:2]
+	fname = packname(dmmgr, shard)
+	try:
+		st = os.stat(fname)
+	except OSError:
+		st = None
+
+	with dmmgr.packlock:
+		pack = dmmgr.packs.get(shard)
+		if pack != None and (st == None or not os.path.samestat(pack.stat, st)):
+			# The pack has been replaced or removed since it was opened (i.e. another process compacted the shard, and
+			# took away the OUI directories that went into the new pack). It's left for the garbage collector to unmap,
+			# as other threads may still be reading it.
+			log.info("Pack file %s has changed, reopening" % (fname))
+			del dmmgr.packs[shard]
+		elif pack == None and st != None:
+			dmmgr.packs.pop(shard, None)
+
+		if shard not in dmmgr.packs:
+			pack = None
+			if st != None:
+				pack = dmPackFile(fname)
+			dmmgr.packs[shard] = pack
+		return dmmgr.packs[shard]
+
+
+# Function to close the open pack of a shard, or all open packs if no shard is given
+def close_packs_by_file(dmmgr, shard = None):
+	with dmmgr.packlock:
+		for k in dmmgr.packs.keys():
+			if shard == None or k == shard:
+				if dmmgr.packs[k] != None:
+					dmmgr.packs[k].close()
+				del dmmgr.packs[k]
+	return True
+
+
+# Function to get the packed records of an OUI, as a list of record dicts in EventDate order
+def packed_records(dmmgr, oui):
+	pack = open_pack_by_file(dmmgr, oui)
+	if pack == None:
+		return []
+	return pack.records(normoui(oui))
+
+
+# Function to get the latest packed record of an OUI as a record dict, or the latest as of a given date if 'date'
+# isn't None. Returns None if there is no such record.
+def packed_latest(dmmgr, oui, date):
+	pack = open_pack_by_file(dmmgr, oui)
+	if pack == None:
+		return None
+	pos = pack.find(normoui(oui))
+	if pos == None:
+		return None
+
+	(oui, flags, first, count) = pack.entry(pos)
+	for i in xrange(first + count - 1, first - 1, -1):
+		if date == None or pack.evdate(i) <= date:
+			return pack.record(i)
+	return None
+
+
+# Function to get the flags of a packed OUI, as a dict of its Private and Deleted flags. Returns None if the OUI isn't
+# packed, or has a records file of its own (its flag files are what count then).
+def packed_flags(dmmgr, oui):
+	if os.path.isfile(dmmgr.dmh.mkOUIPath(oui) + 'records'):
+		return None
+	pack = open_pack_by_file(dmmgr, oui)
+	if pack == None:
+		return None
+	pos = pack.find(normoui(oui))
+	if pos == None:
+		return None
+	return pack.entry(pos)[1]
+
+
+# Function to give a packed OUI its own directory in the overlay, before it's first written to. The pack's flags are
+# copied into flag files, then an empty records file is made, which from then on makes the flag files the ones that
+# count. Returns True if the directory was made, False if the OUI isn't packed or already has one.
+def overlay_by_file(dmmgr, oui):
+	flags = packed_flags(dmmgr, oui)
+	if flags == None:
+		return False
+
+	log.debug("overlay_by_file() starting")
+	path = dmmgr.dmh.mkOUIPath(oui)
+	mark_dirty_by_file(dmmgr)
+	try:
+		if not os.path.isdir(path):
+			os.makedirs(path, 0750)
+		for flag in ('Private', 'Deleted'):
+			fname = path + '.' + flag.lower()
+			if flags[flag] and not os.path.isfile(fname):
+				fh = open(fname, 'w')
+				fh.close()
+			elif not flags[flag] and os.path.isfile(fname):
+				os.remove(fname)
+		fh = open(path + 'records', 'a')
+		sync_file(fh)
+		fh.close()
+	except Exception as e:
+		log.error("Couldn't make overlay directory %s for packed OUI" % (path))
+		log.error("Exception triggered: %s" % (e))
+		raise
+
+	log.info("Made overlay directory %s for packed OUI" % (path))
+	log.debug("overlay_by_file() ending")
+	return True
+
+
+# Function to remove the OUI directories of a shard once their contents are in its pack. 'ouis' is the list of OUIs
+# packed. Their records and flag files are removed, then any directories of the shard left empty. Anything else
+# found in the tree is left alone.
+def remove_overlay_by_file(dmmgr, shard, ouis):
+	for oui in ouis:
+		path = dmmgr.dmh.mkOUIPath(oui)
+		for f in ('records', '.private', '.deleted'):
+			if os.path.isfile(path + f):
+				os.remove(path + f)
+
+	if os.path.isdir(dmmgr.dmh.addr + shard):
+		for entry in os.walk(dmmgr.dmh.addr + shard, topdown = False):
+			if not os.listdir(entry[0]):
+				os.rmdir(entry[0])
+	return True
+
+
+# Function to move a shard's pack into place once the new one has been written alongside it (as <pack>.tmp), then
+# remove the OUI directories it took in. A note of what's being done is kept in the 'packing' file at the top of the
+# journal until it's finished, so recover_pack_by_file() can tell which side of the rename a crash happened on.
+def finish_pack_by_file(dmmgr, shard, ouis):
+	log.debug("finish_pack_by_file() starting")
+	fname = packname(dmmgr, shard)
+	note = dmmgr.dmh.addr + 'packing'
+
+	try:
+		fh = open(note, 'w')
+		fh.write(''.join([l + '\n' for l in [shard] + ouis]))
+		sync_file(fh)
+		fh.close()
+
+		close_packs_by_file(dmmgr, shard)
+		os.rename(fname + '.tmp', fname)
+		remove_overlay_by_file(dmmgr, shard, ouis)
+		os.remove(note)
+	except Exception as e:
+		log.error("Unknown error while trying to replace pack file %s" % (fname))
+		log.error("Exception triggered: %s" % (e))
+		raise
+
+	log.debug("finish_pack_by_file() ending")
+	return True
+
+
+# Function to finish or undo a pack replacement cut short by a crash. If the new pack was never renamed into place the
+# old pack and OUI directories are still good, so the new pack is dropped. Otherwise the OUI directories it took in
+# are removed, as their records would be read twice. Returns True if there was a replacement to clean up.
+def recover_pack_by_file(dmmgr):
+	note = dmmgr.dmh.addr + 'packing'
+	if not os.path.isfile(note):
+		return False
+
+	fh = open(note, 'r')
+	lines = [l.strip() for l in fh if l.strip() != '']
+	fh.close()
+
+	if lines:
+		fname = packname(dmmgr, lines[0])
+		if os.path.isfile(fname + '.tmp'):
+			log.warn("Dropping unfinished pack file %s" % (fname + '.tmp'))
+			os.remove(fname + '.tmp')
+		else:
+			log.warn("Removing OUI directories already moved to pack file %s" % (fname))
+			remove_overlay_by_file(dmmgr, lines[0], lines[1:])
+	os.remove(note)
+	return True
+
+
+# Function to compact a filesystem repository, moving the records and flags of every OUI in the directory tree into
+# the pack of its shard. Each shard with any directory tree is rewritten as one pack with everything in its old pack
+# and tree together, then its tree is removed. Returns the number of OUI directories compacted.
+def compact_by_file(dmmgr):
+	# dmmgr is an instance of the dmManager class. This function assumes dmmgr has a valid connection!
+	log.debug("compact_by_file() starting")
+	count = 0
+	mark_dirty_by_file(dmmgr)
+
+	if not os.path.isdir(dmmgr.dmh.addr + 'packs'):
+		os.makedirs(dmmgr.dmh.addr + 'packs', 0750)
+
+	shards = {}
+	for oui in dmmgr.manifest:
+		shards.setdefault(oui[0:2], []).append(oui)
+
+	for shard in sorted(shards):
+		# Shards with nothing outside their pack are left as they are
+		if not os.path.isdir(dmmgr.dmh.addr + shard):
+			continue
+
+		ouis = []
+		loose = 0
+		for oui in sorted(shards[shard]):
+			path = dmmgr.dmh.mkOUIPath(oui)
+			recs = packed_records(dmmgr, oui)
+			flags = packed_flags(dmmgr, oui)
+			if flags == None:
+				flags = {'Private': os.path.isfile(path + '.private'), 'Deleted': os.path.isfile(path + '.deleted')}
+			if os.path.isdir(path):
+				loose += 1
+			if os.path.isfile(path + 'records'):
+				recs.extend(load_journal(path + 'records'))
+			recs.sort(key = lambda r: r.get('EventDate', ''))
+			ouis.append((oui, flags, recs))
+
+		write_pack(packname(dmmgr, shard) + '.tmp', ouis)
+		finish_pack_by_file(dmmgr, shard, [o[0] for o in ouis])
+		count += loose
+		log.info("Compacted %d OUI directories into shard %s" % (loose, shard))
+
+	log.info("Compacted %d OUI directories" % (count))
+	log.debug("compact_by_file() ending")
+	return count
+
+
+# The manifest is a summary of every OUI in a filesystem repository (size, flags, record count, last event date,
+# and the fingerprint and event type of the latest record), kept in the 'manifest' file at the top of the journal so enumeration never has to walk the directory
+# tree. The file is append-only: every change writes the full, updated entry for that OUI as one JSON line,
+# and the last line for an OUI wins. It is rewritten in compact form when it grows too far past the number
+# of OUIs, and can be rebuilt from the journal tree at any time.
+
+# Function to make a fresh manifest entry for an OUI
+def new_manifest_entry(oui):
+	return {'OUI': oui, 'OUISize': len(oui) * 4, 'Private': False, 'Deleted': False, 'Count': 0, 'LastDate': '',
+			'Fingerprint': None, 'LastType': None}
+
+
+# Function to update a manifest entry for records added to the OUI's journal. 'recs' is a list of the records' (EventDate,
+# JSON, fingerprint, event type) tuples, in the order they're added. A record dated on or after the latest one so far
+# becomes the latest, since it goes after it in the journal.
+def add_manifest_records(entry, recs):
+	entry['Count'] += len(recs)
+	for r in recs:
+		if r[0] >= entry['LastDate']:
+			entry['LastDate'] = r[0]
+			entry['Fingerprint'] = r[2]
+			entry['LastType'] = r[3]
+	return entry
+
+
+# Function to return the manifest entry for an OUI, or a fresh one if the OUI isn't in the manifest yet
+def manifest_entry(dmmgr, oui):
+	oui = normoui(oui)
+	if oui in dmmgr.manifest:
+		return dmmgr.manifest[oui]
+	return new_manifest_entry(oui)
+
+
+# Function to write out the whole manifest of a dmManager instance in compact form. The manifest is written to a
+# temporary file and renamed over the original.
+def save_manifest_by_file(dmmgr):
+	log.debug("save_manifest_by_file() starting")
+	fname = dmmgr.dmh.addr + 'manifest'
+
+	try:
+		fh = codecs.open(fname + '.tmp', 'w', encoding='utf-8')
+		for oui in sorted(dmmgr.manifest):
+			fh.write(json.dumps(dmmgr.manifest[oui], ensure_ascii = False, sort_keys = True) + u'\n')
+		sync_file(fh)
+		fh.close()
+		os.rename(fname + '.tmp', fname)
+	except Exception as e:
+		log.error("Unknown error while trying to write manifest %s" % (fname))
+		log.error("Exception triggered: %s" % (e))
+		raise
+
+	dmmgr.manifestlines = len(dmmgr.manifest)
+	log.debug("save_manifest_by_file() ending")
+	return True
+
+
+# Function to rebuild the manifest of a dmManager instance by walking the journal tree. Returns the number of
+# OUIs found.
+def rebuild_manifest_by_file(dmmgr):
+	log.debug("rebuild_manifest_by_file() starting")
+	dmmgr.manifest = {}
+
+	# Summarize the packed journals first, reading the packs as they are now
+	close_packs_by_file(dmmgr)
+	packdir = dmmgr.dmh.addr + 'packs'
+	if os.path.isdir(packdir):
+		for f in sorted(os.listdir(packdir)):
+			if not f.endswith('.pack'):
+				continue
+			pack = open_pack_by_file(dmmgr, f[:-5])
+			for (oui, flags, first, count) in pack.entries():
+				m = new_manifest_entry(oui)
+				m['Private'] = flags['Private']
+				m['Deleted'] = flags['Deleted']
+				if count > 0:
+					rec = dmRecord.fromdict(pack.record(first + count - 1))
+					add_manifest_records(m, [(rec.getEvDate(), None, rec.getFingerprint(), rec.getEvType())])
+				m['Count'] = count
+				dmmgr.manifest[oui] = m
+
+	# Walk through the repository directory tree
+	log.info("Walking directory %s" % (dmmgr.dmh.addr))
+	for entry in os.walk(dmmgr.dmh.addr):
+		# Check if this entry is for a records file
+		if 'records' in entry[2]:
+			# Break off root path and remove slashes
+			oui = entry[0][len(dmmgr.dmh.addr):].replace('/', '').upper()
+			log.debug("oui = %s" % (oui))
+
+			# Summarize the journal for this OUI, on top of any packed records. Its flag files are the ones that count.
+			jarr = load_journal(os.path.join(entry[0], 'records'))
+			m = dmmgr.manifest.get(oui, new_manifest_entry(oui))
+			m['Private'] = '.private' in entry[2]
+			m['Deleted'] = '.deleted' in entry[2]
+			for r in jarr:
+				rec = dmRecord.fromdict(r)
+				add_manifest_records(m, [(r.get('EventDate', ''), None, rec.getFingerprint(), rec.getEvType())])
+			dmmgr.manifest[oui] = m
+
+	save_manifest_by_file(dmmgr)
+
+	log.info("Manifest rebuilt with %d OUIs" % (len(dmmgr.manifest)))
+	log.debug("rebuild_manifest_by_file() ending")
+	return len(dmmgr.manifest)
+
+
+# Function to load the manifest of a filesystem repository into a dmManager instance. If the repository has
+# no manifest yet, one is built from the journal tree.
+def load_manifest_by_file(dmmgr):
+	log.debug("load_manifest_by_file() starting")
+	fname = dmmgr.dmh.addr + 'manifest'
+
+	if not os.path.isfile(fname):
+		log.info("No manifest found in %s, building one" % (dmmgr.dmh.addr))
+		rebuild_manifest_by_file(dmmgr)
+		log.debug("load_manifest_by_file() ending")
+		return True
+
+	dmmgr.manifest = {}
+	dmmgr.manifestlines = 0
+	try:
+		fh = codecs.open(fname, 'r', encoding='utf-8')
+		for line in fh:
+			if line.strip() == '':
+				continue
+			try:
+				m = json.loads(line)
+			except ValueError:
+				log.warn("Skipping damaged line in manifest %s" % (fname))
+				continue
+			dmmgr.manifest[m['OUI']] = m
+			dmmgr.manifestlines += 1
+		fh.close()
+	except Exception as e:
+		log.error("ERROR: Unknown error while trying to read manifest %s" % (fname))
+		log.error("Exception triggered: %s" % (e))
+		raise
+
+	log.info("Loaded manifest with %d OUIs" % (len(dmmgr.manifest)))
+	log.debug("load_manifest_by_file() ending")
+	return True
+
+
+# Function to update the manifest entry for an OUI with the given field values, called once the journal or
+# flag change it describes has been made.
+def update_manifest_by_file(dmmgr, oui, **changes):
+	log.debug("update_manifest_by_file() starting")
+	oui = normoui(oui)
+	entry = dict(manifest_entry(dmmgr, oui))
+	entry.update(changes)
+	write_manifest_by_file(dmmgr, [entry])
+
+	log.debug("update_manifest_by_file() ending")
+	return True
+
+
+# Function to record a list of updated manifest entries, in memory and in the manifest file, with a single write.
+def write_manifest_by_file(dmmgr, entries):
+	log.debug("write_manifest_by_file() starting")
+	for entry in entries:
+		dmmgr.manifest[entry['OUI']] = entry
+
+	# While the manifest is held, changes are only collected for the caller to merge elsewhere
+	if dmmgr.manifesthold != None:
+		dmmgr.manifesthold.extend(entries)
+		log.debug("write_manifest_by_file() ending")
+		return True
+	mark_dirty_by_file(dmmgr)
+
+	# Rewrite the manifest once superseded lines make up most of it, otherwise just append the new entries
+	if dmmgr.manifestlines + len(entries) > 2 * len(dmmgr.manifest) + 1000:
+		save_manifest_by_file(dmmgr)
+	else:
+		try:
+			fh = codecs.open(dmmgr.dmh.addr + 'manifest', 'a', encoding='utf-8')
+			fh.write(u''.join([json.dumps(entry, ensure_ascii = False, sort_keys = True) + u'\n' for entry in entries]))
+			fh.close()
+		except Exception as e:
+			log.error("Unknown error while trying to update manifest %s" % (dmmgr.dmh.addr + 'manifest'))
+			log.error("Exception triggered: %s" % (e))
+			raise
+		dmmgr.manifestlines += len(entries)
+
+	log.debug("write_manifest_by_file() ending")
+	return True
+
+
+# Function to merge manifest entries collected by another dmManager instance (see dmManager.holdManifest())
+def merge_manifest_by_file(dmmgr, entries):
+	log.debug("merge_manifest_by_file() starting")
+
+	merged = []
+	for entry in entries:
+		entry = dict((str(k), v) for (k, v) in entry.iteritems())
+		entry['OUI'] = normoui(entry['OUI'])
+		merged.append(dict(manifest_entry(dmmgr, entry['OUI']), **entry))
+	write_manifest_by_file(dmmgr, merged)
+
+	log.debug("merge_manifest_by_file() ending")
+	return True
+
+
+# A filesystem repository being written to has a 'dirty' marker file at the top of the journal, created before
+# the first write and removed when the dmManager instance ends. Writers hold a shared lock on the marker for as long
+# as they're open, so several can write at once (i.e. worker processes), and the lock goes away with the process.
+# Finding the marker when connecting only means the last writer never finished (crash, power loss, killed import) if
+# it can be locked exclusively; then the repository is checked over and repaired first. A marker that's still locked
+# belongs to a running writer, and is left alone.
+
+# Function to open the dirty marker and lock it with the given flock() operation, creating the marker first if
+# 'create' is set. Returns the open marker file, or None if there's no marker or a non-blocking lock isn't available.
+def lock_marker_by_file(dmmgr, op, create):
+	fname = dmmgr.dmh.addr + 'dirty'
+	flags = os.O_RDWR
+	if create:
+		flags |= os.O_CREAT
+
+	while True:
+		try:
+			fh = os.fdopen(os.open(fname, flags, 0644), 'r+')
+		except OSError as e:
+			if e.errno == errno.ENOENT:
+				return None
+			raise
+		try:
+			fcntl.flock(fh.fileno(), op)
+		except IOError as e:
+			fh.close()
+			if e.errno in (errno.EAGAIN, errno.EACCES):
+				log.info("Repository %s is being written by another process" % (dmmgr.dmh.addr))
+				return None
+			raise
+
+		# The marker may have been removed (and made again) while waiting for the lock, in which case try again
+		try:
+			if os.path.samestat(os.fstat(fh.fileno()), os.stat(fname)):
+				return fh
+		except OSError:
+			pass
+		fh.close()
+
+
+# Function to create the dirty marker, if this instance hasn't already, and hold a shared lock on it
+def mark_dirty_by_file(dmmgr):
+	if dmmgr.dirty:
+		return True
+
+	log.debug("Marking repository %s dirty" % (dmmgr.dmh.addr))
+	try:
+		fh = lock_marker_by_file(dmmgr, fcntl.LOCK_SH, True)
+		fh.seek(0, os.SEEK_END)
+		fh.write("%d\n" % (os.getpid()))
+		sync_file(fh)
+	except Exception as e:
+		log.error("Couldn't create dirty marker in %s" % (dmmgr.dmh.addr))
+		log.error("Exception triggered: %s" % (e))
+		raise
+
+	dmmgr.dirtyfh = fh
+	dmmgr.dirty = True
+	return True
+
+
+# Function to take the dirty marker exclusively, for recovery. Only possible when no other writer holds it. If
+# 'create' is set the marker is made if it doesn't exist. Returns True if this instance now holds the marker.
+def lock_dirty_by_file(dmmgr, create):
+	if dmmgr.dirty:
+		try:
+			fcntl.flock(dmmgr.dirtyfh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+		except IOError:
+			# Converting the lock may have dropped it, take the shared lock again
+			fcntl.flock(dmmgr.dirtyfh.fileno(), fcntl.LOCK_SH)
+			log.info("Repository %s is being written by another process" % (dmmgr.dmh.addr))
+			return False
+		return True
+
+	fh = lock_marker_by_file(dmmgr, fcntl.LOCK_EX | fcntl.LOCK_NB, create)
+	if fh == None:
+		return False
+	dmmgr.dirtyfh = fh
+	dmmgr.dirty = True
+	return True
+
+
+# Function to remove the dirty marker once everything this instance wrote is safely on disk. Journal writes are
+# synced as they're made, which leaves the manifest. The marker is only removed if no other writer still holds it.
+def mark_clean_by_file(dmmgr):
+	if not dmmgr.dirty:
+		return True
+
+	log.debug("Marking repository %s clean" % (dmmgr.dmh.addr))
+	if os.path.isfile(dmmgr.dmh.addr + 'manifest'):
+		fh = open(dmmgr.dmh.addr + 'manifest', 'a')
+		sync_file(fh)
+		fh.close()
+
+	try:
+		fcntl.flock(dmmgr.dirtyfh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+		os.remove(dmmgr.dmh.addr + 'dirty')
+	except IOError:
+		log.info("Leaving dirty marker in %s to the other writers" % (dmmgr.dmh.addr))
+	dmmgr.dirtyfh.close()
+
+	dmmgr.dirtyfh = None
+	dmmgr.dirty = False
+	return True
+
+
+# Function to recover a filesystem repository after an unfinished write. Every journal file is checked for a torn
+# write at its end, an interrupted pack replacement is finished or undone, temporary files from interrupted rewrites
+# are removed, and the manifest is rebuilt since it
+# may not have caught up with the journal. The caller must hold the dirty marker exclusively (see lock_dirty_by_file()),
+# so no other writer is running. Returns the number of journal files repaired.
+def recover_by_file(dmmgr):
+	log.debug("recover_by_file() starting")
+	count = 0
+
+	# An unfinished pack replacement has to be sorted out before temporary files are cleared away
+	recover_pack_by_file(dmmgr)
+
+	# Walk through the repository directory tree
+	log.info("Walking directory %s" % (dmmgr.dmh.addr))
+	for entry in os.walk(dmmgr.dmh.addr):
+		for f in entry[2]:
+			if f.endswith('.tmp'):
+				log.info("Removing temporary file %s" % (os.path.join(entry[0], f)))
+				os.remove(os.path.join(entry[0], f))
+		if 'records' in entry[2]:
+			if repair_journal(os.path.join(entry[0], 'records')):
+				count += 1
+
+	rebuild_manifest_by_file(dmmgr)
+	mark_clean_by_file(dmmgr)
+
+	log.info("Repaired %d journal files" % (count))
+	log.debug("recover_by_file() ending")
+	return count
+
+
 # Function to get all records for an OUI via filesystem connection
 def get_by_file(dmmgr, oui):
 	log.debug("get_by_file() starting")
 	# dmmgr is an instance of the dmManager class, oui is the OUI value to get
 	# This function assumes dmmgr has a valid connection and the OUI given is a valid format!
-	results = []
+	# Any packed records come first
+	results = [dmRecord.fromdict(r) for r in packed_records(dmmgr, oui)]
 	path = dmmgr.dmh.mkOUIPath(oui)
 	log.debug("path = %s" % (path))
 
-	### Check if directory exists, if not there's no records so return an empty set
+	### Check if directory exists, if not there's no more records so return what we have
 	if not os.path.isdir(path):
-		log.info("Path %s does not exist, returning empty set" % (path))
+		log.info("Path %s does not exist, returning %d packed records" % (path, len(results)))
 		log.debug("get_by_file() ending")
 		return results
 
@@ -226,39 +1145,32 @@ def get_by_file(dmmgr, oui):
 	# Check if there's record file in directory, if not there's no records so return empty set
 	if not os.path.isfile(fname):
 		# TODO: Fix so access errors are reported explicitly, versus file just not existing
-		log.info("No record file found in %s or inaccessible, returning empty set" % (path))
+		log.info("No record file found in %s or inaccessible, returning %d packed records" % (path, len(results)))
 		log.debug("get_by_file() ending")
 		return results
 
-	# Open the record file, bail if error occurs
-	try:
-		fh = codecs.open(fname, 'r', encoding='utf-8')
-	except Exception as e:
-		log.error("ERROR: Couldn't open file %s for reading." % (fname))
-		log.error("Exception triggered: %s" % (e))
-		raise
-
-	# Read record file contents
-	try:
-		jarr = json.load(fh)
-	except Exception as e:
-		log.error("ERROR: Unknown error while trying to read file %s" % (fname))
-		log.error("Exception triggered: %s" % (e))
-		raise
-
-	# Close the record file
-	fh.close()
-	log.debug("jarr length is %d" % (len(jarr)))
+	# Legacy journals have to be decoded whole
+	if islegacy_journal(fname):
+		jarr = load_journal(fname)
+		log.debug("jarr length is %d" % (len(jarr)))
 
-	# Process JSON array to an array of DeepMac record objects
-	log.info("Processing JSON records into DeepMac records")
-	for r in jarr['recs']:
-			rec = dmRecord(j = r)
-			if rec.rec == {}:
-					log.warn("Record could not be created for JSON string %s" % (line))
-
-			# Append to our results set
-			results.append(rec)
+		# Process JSON array to an array of DeepMac record objects
+		log.info("Processing JSON records into DeepMac records")
+		for r in jarr:
+			results.append(dmRecord.fromdict(r))
+	else:
+		# Each line is a record, which is left to be decoded when it's used. Lines are read as bytes for speed, and
+		# made unicode so the record's strings come out as unicode, as they do from codecs reads.
+		try:
+			fh = open(fname, 'rb')
+			for line in fh:
+				if line.strip() != '':
+					results.append(dmRecord.fromraw(line.rstrip('\r\n').decode('utf-8')))
+			fh.close()
+		except Exception as e:
+			log.error("ERROR: Unknown error while trying to read file %s" % (fname))
+			log.error("Exception triggered: %s" % (e))
+			raise
 
 	log.debug("results length is %d" % (len(results)))
 
@@ -267,6 +1179,113 @@ def get_by_file(dmmgr, oui):
 	return results
 
 
+# Function to get the latest record for an OUI via filesystem connection, or the latest as of a given date if
+# 'date' isn't None. Journals are kept in EventDate order, so this is read from the end of the journal file
+# without loading the rest of it, and checked against the OUI's latest packed record. Journals that turn out not to
+# be in order (written before they were kept that way) are read in full instead. Returns a dmRecord instance,
+# or None if there is no such record.
+def getlatest_by_file(dmmgr, oui, date):
+	log.debug("getlatest_by_file() starting")
+	# dmmgr is an instance of the dmManager class, oui is the OUI value to get and date the EventDate to get it as of
+	# This function assumes dmmgr has a valid connection and the OUI given is a valid format!
+	fname = dmmgr.dmh.mkOUIPath(oui) + "records"
+	log.debug("fname = %s" % (fname))
+
+	# Records in the records file win over packed ones with the same date, as they come after them
+	packrec = packed_latest(dmmgr, oui, date)
+	if packrec != None:
+		packrec = dmRecord.fromdict(packrec)
+
+	# No record file, only packed records if any
+	if not os.path.isfile(fname):
+		log.info("No record file %s found, returning latest packed record" % (fname))
+		log.debug("getlatest_by_file() ending")
+		return packrec
+
+	# Legacy journals aren't in order, so those get read in full
+	if not islegacy_journal(fname):
+		lastdate = manifest_entry(dmmgr, oui)['LastDate']
+		found = None
+		prevdate = None
+		trusted = True
+		for line in tail_journal(fname):
+			if line.strip() == '':
+				continue
+			rec = dmRecord.fromraw(line.decode('utf-8'))
+			evdate = rec.getEvDate()
+
+			# The last record in the file should have the latest date the manifest knows of, unless a packed record
+			# does. If not, the journal isn't one we can trust to be in order, so fall back to reading all of it.
+			if prevdate == None:
+				if evdate != lastdate:
+					latest = packed_latest(dmmgr, oui, None)
+					if evdate > lastdate or latest == None or latest.get('EventDate') != lastdate:
+						log.warn("Journal file %s doesn't end with its latest record" % (fname))
+						trusted = False
+						break
+				if date == None:
+					log.debug("getlatest_by_file() ending")
+					if evdate == lastdate:
+						return rec
+					return packrec
+
+			# Journals written before they were kept in order can still have older records appended after newer ones,
+			# so the lines read as of a date have to be in order too, up to the one before the record found
+			elif evdate > prevdate:
+				log.warn("Journal file %s isn't in EventDate order" % (fname))
+				trusted = False
+				break
+			prevdate = evdate
+
+			if found is not None:
+				break
+			if evdate <= date:
+				found = rec
+
+		if trusted:
+			log.debug("getlatest_by_file() ending")
+			if found is None or (packrec is not None and packrec.getEvDate() > found.getEvDate()):
+				return packrec
+			return found
+
+	results = get_by_file(dmmgr, oui)
+	results.sort()
+	if date != None:
+		results = [r for r in results if r.getEvDate() <= date]
+
+	log.debug("getlatest_by_file() ending")
+	if results:
+		return results[-1]
+	return None
+
+
+# Function to get all records for a list of OUIs via filesystem connection, using a pool of threads to read the
+# journal files. OUIs are grouped by their top-level shard directory and each group is read by one thread.
+# Returns a dict of record lists keyed by OUI.
+def getmany_by_file(dmmgr, ouis, threads):
+	log.debug("getmany_by_file() starting")
+	# dmmgr is an instance of the dmManager class, ouis is the list of normalized OUIs to get
+	# This function assumes dmmgr has a valid connection and the OUIs given are a valid format!
+	groups = {}
+	for oui in ouis:
+		groups.setdefault(oui[0:2], []).append(oui)
+
+	def readgroup(group):
+		return [(oui, get_by_file(dmmgr, oui)) for oui in group]
+
+	pool = multiprocessing.pool.ThreadPool(max(1, min(threads, len(groups))))
+	try:
+		results = {}
+		for part in pool.map(readgroup, [groups[k] for k in sorted(groups)]):
+			results.update(part)
+	finally:
+		pool.close()
+		pool.join()
+
+	log.debug("getmany_by_file() ending")
+	return results
+
+
 # Function to append a dmRecord instance to the repository via a dmManager instance.
 def add_by_file(dmmgr, rec):
 	# dmmgr is an instance of the dmManager class, rec is a dmRecord instance to append.
@@ -283,10 +1302,12 @@ def add_by_file(dmmgr, rec):
 
 	# Get the OUI from this record.
 	oui = rec.getOUI()
+	mark_dirty_by_file(dmmgr)
 
-	# Get a path for this OUI.
+	# Get a path for this OUI. Packed OUIs get their own directory in the overlay first.
 	path = dmmgr.dmh.mkOUIPath(oui)
 	log.debug("path = %s" % (path))
+	overlay_by_file(dmmgr, oui)
 
 	# Check if directory exists. If not, attempt to make it
 	if not os.path.exists(path):
@@ -299,102 +1320,699 @@ def add_by_file(dmmgr, rec):
 			raise
 		log.info("Path %s successfully created." % (path))
 
-	# Make the fully qualified filename.
-	fname = path + "records"
-	log.debug("fname = %s" % (fname))
+	# Make the fully qualified filename.
+	fname = path + "records"
+	log.debug("fname = %s" % (fname))
+
+	# Add our new record to the journal, in date order
+	log.info("Attempting to append record to journal")
+	journal_records(fname, [(rec.getEvDate(), rec.getJSON())], manifest_entry(dmmgr, oui)['LastDate'])
+	log.info("Successfully updated journal file.")
+
+	# Keep the manifest in step with the journal
+	entry = add_manifest_records(dict(manifest_entry(dmmgr, oui)), [(rec.getEvDate(), None, rec.getFingerprint(), rec.getEvType())])
+	write_manifest_by_file(dmmgr, [entry])
+
+	# Since (presumably) no errors occurred, set result to True
+	result = True
+
+	# Return the result status
+	log.debug("add_by_file() ending")
+	return result
+
+
+
+# Function to enumerate OUIs in the repository and return as a list
+def enum_by_file(dmmgr, sz, prvflag = True, delflag = False):
+	# dmmgr is an instance of the dmManager class. This function assumes dmmgr has a valid connection!
+	# sz is the OUI size(s) to be checked, prvflag is for private records, delflag is for deleted records (booleans)
+	# NOTE: If not specified in original call, prvflag will be True and delflag will be False
+	log.debug("enum_by_file() starting")
+	log.debug("dmmgr.dmh.addr = %s" % (dmmgr.dmh.addr))
+	log.debug("sz = %s" % (sz))
+	log.debug("prvflag = %s" % (prvflag))
+	log.debug("delflag = %s" % (delflag))
+	results = []
+
+	# Scan the manifest rather than the directory tree
+	for oui, entry in dmmgr.manifest.iteritems():
+		# Check if this OUI is a size we care about
+		if sz != 0 and entry['OUISize'] != sz:
+			continue
+
+		# Check flags
+		if prvflag == False and entry['Private']:
+			log.debug("Skipping private entry %s" % (oui))
+			continue
+
+		if delflag == False and entry['Deleted']:
+			log.debug("Skipping deleted entry %s" % (oui))
+			continue
+
+		# Entry matches all conditions, add this OUI to our results
+		results.append(oui)
+
+	### Return the result status
+	log.debug("enum_by_file() ending")
+	return results
+
+
+# Function to get the most recent record of every OUI in the repository via filesystem connection. Returns a dict
+# of dmRecord instances keyed by OUI.
+def latest_by_file(dmmgr, sz):
+	# dmmgr is an instance of the dmManager class. This function assumes dmmgr has a valid connection!
+	# sz is the OUI size to be loaded, or 0 for all.
+	log.debug("latest_by_file() starting")
+	results = {}
+
+	for oui in enum_by_file(dmmgr, sz, True, True):
+		recs = get_by_file(dmmgr, oui)
+		if recs:
+			recs.sort()
+			results[oui] = recs[-1]
+
+	log.debug("%d total results." % (len(results)))
+	log.debug("latest_by_file() ending")
+	return results
+
+
+# Function to convert every legacy journal file in the repository to the one-record-per-line format, and put any
+# journal with records out of EventDate order back in order. Returns the number of journal files converted.
+def migrate_by_file(dmmgr):
+	# dmmgr is an instance of the dmManager class. This function assumes dmmgr has a valid connection!
+	log.debug("migrate_by_file() starting")
+	count = 0
+	mark_dirty_by_file(dmmgr)
+
+	# Walk through the repository directory tree
+	log.info("Walking directory %s" % (dmmgr.dmh.addr))
+	for entry in os.walk(dmmgr.dmh.addr):
+		if 'records' in entry[2]:
+			fname = os.path.join(entry[0], 'records')
+			if not isordered_journal(fname):
+				migrate_journal(fname)
+				count += 1
+
+	log.info("Converted %d journal files" % (count))
+	log.debug("migrate_by_file() ending")
+	return count
+
+
+# Function to commit a change set to the repository via filesystem connection. 'changes' is the dict of pending
+# changes by OUI kept by a dmChangeSet. Each OUI's records are written to its journal in one write, then its
+# flags are set, and the manifest entries for all of the OUIs are written out together at the end.
+def batch_by_file(dmmgr, changes):
+	# dmmgr is an instance of the dmManager class. This function assumes dmmgr has a valid connection and
+	# every OUI and record in the change set has been validated!
+	log.debug("batch_by_file() starting")
+	entries = []
+	mark_dirty_by_file(dmmgr)
+
+	for oui in sorted(changes):
+		change = changes[oui]
+		path = dmmgr.dmh.mkOUIPath(oui)
+		log.debug("path = %s" % (path))
+		entry = dict(manifest_entry(dmmgr, oui))
+
+		# Packed OUIs get their own directory in the overlay before anything is changed
+		overlay_by_file(dmmgr, oui)
+
+		if change['recs']:
+			# Check if directory exists. If not, attempt to make it
+			if not os.path.exists(path):
+				log.info("Path %s does not exist, attempting to create." % (path))
+				try:
+					os.makedirs(path, 0750)
+				except Exception as e:
+					log.error("Couldn't make directory %s, aborting." % (path))
+					log.error("Exception triggered: %s" % (e))
+					raise
+
+			# Add the OUI's new records to its journal, in date order
+			journal_records(path + "records", change['recs'], entry['LastDate'])
+
+			add_manifest_records(entry, change['recs'])
+
+		# Set the flags, same as setPrivate()/setDeleted() would. Flags can only be set on OUIs in the repository.
+		for flag in ('Private', 'Deleted'):
+			if change[flag] == None:
+				continue
+			if not os.path.isdir(path):
+				log.info("Path %s does not exist, can't set %s flag" % (path, flag))
+				continue
+
+			fname = path + '.' + flag.lower()
+			try:
+				if change[flag] and not os.path.isfile(fname):
+					fh = open(fname, 'w')
+					fh.close()
+				elif not change[flag] and os.path.isfile(fname):
+					os.remove(fname)
+			except Exception as e:
+				log.error("FAILURE: Could not set %s flag file %s" % (flag, fname))
+				log.error("Exception triggered: %s" % (e))
+				raise
+			entry[flag] = change[flag]
+
+		entries.append(entry)
+
+	# Keep the manifest in step with the journal
+	write_manifest_by_file(dmmgr, entries)
+
+	log.debug("batch_by_file() ending")
+	return True
+
+					###### Database Interface ######
+
+# Database repositories are an embedded SQLite file, opened by dmConnector. Each OUI has a row in the
+# 'ouis' table holding its size and private/deleted flags, and its records are stored in the 'records'
+# table as JSON strings, indexed by OUI and event date.
+
+# Function to check if a specific OUI is private or not, via database connection
+def ispriv_by_db(dmmgr, oui):
+	log.debug("ispriv_by_db() starting")
+	# dmmgr is an instance of the dmManager class, oui is the OUI value to check
+	# This function assumes dmmgr has a valid connection and the OUI given is a valid format!
+	row = dmmgr.dmh.con.execute("SELECT private FROM ouis WHERE oui = ?", (normoui(oui),)).fetchone()
+
+	# No entry for this OUI, so we return None.
+	if row == None:
+		log.info("OUI %s does not exist, returning None" % (oui))
+		log.debug("ispriv_by_db() ending")
+		return None
+
+	log.debug("ispriv_by_db() ending")
+	return (row[0] != 0)
+
+
+# Function to check if a specific OUI is deleted or not, via database connection
+def isdel_by_db(dmmgr, oui):
+	log.debug("isdel_by_db() starting")
+	# dmmgr is an instance of the dmManager class, oui is the OUI value to check
+	# This function assumes dmmgr has a valid connection and the OUI given is a valid format!
+	row = dmmgr.dmh.con.execute("SELECT deleted FROM ouis WHERE oui = ?", (normoui(oui),)).fetchone()
+
+	# No entry for this OUI, so we return None.
+	if row == None:
+		log.info("OUI %s does not exist, returning None" % (oui))
+		log.debug("isdel_by_db() ending")
+		return None
+
+	log.debug("isdel_by_db() ending")
+	return (row[0] != 0)
+
+
+# Function to set one of the flag columns for a specific OUI, via database connection. Returns True on
+# success or None if the OUI doesn't exist in the repository.
+def setflag_by_db(dmmgr, oui, flag, bool):
+	log.debug("setflag_by_db() starting")
+	# dmmgr is an instance of the dmManager class, oui is the OUI value to set, flag is the column to set
+	# and bool is a true/false flag. This function assumes dmmgr has a valid connection and the OUI given is a valid format!
+	try:
+		cur = dmmgr.dmh.con.execute("UPDATE ouis SET %s = ? WHERE oui = ?" % (flag), (int(bool), normoui(oui)))
+		dmmgr.dmh.con.commit()
+	except Exception as e:
+		log.error("FAILURE: Could not set %s flag for OUI %s" % (flag, oui))
+		log.error("Exception triggered: %s" % (e))
+		raise
+
+	# No entry for this OUI, so we return None.
+	if cur.rowcount == 0:
+		log.info("OUI %s does not exist, returning None" % (oui))
+		log.debug("setflag_by_db() ending")
+		return None
+
+	log.info("%s flag set to %s" % (flag, str(bool)))
+	log.debug("setflag_by_db() ending")
+	return True
+
+
+# Function to set the Deleted flag for a specific OUI, via the database connection
+def setdel_by_db(dmmgr, oui, bool):
+	return setflag_by_db(dmmgr, oui, 'deleted', bool)
+
+
+# Function to set the Private flag for a specific OUI, via the database connection
+def setpriv_by_db(dmmgr, oui, bool):
+	return setflag_by_db(dmmgr, oui, 'private', bool)
+
+
+# Function to get all records for an OUI via database connection
+def get_by_db(dmmgr, oui):
+	log.debug("get_by_db() starting")
+	# dmmgr is an instance of the dmManager class, oui is the OUI value to get
+	# This function assumes dmmgr has a valid connection and the OUI given is a valid format!
+	results = []
+
+	# Pull records in the order they were journaled. Sorting by date is left to the caller, as with files.
+	try:
+		rows = dmmgr.dmh.con.execute("SELECT rec FROM records WHERE oui = ? ORDER BY id", (normoui(oui),)).fetchall()
+	except Exception as e:
+		log.error("ERROR: Couldn't read records for OUI %s" % (oui))
+		log.error("Exception triggered: %s" % (e))
+		raise
+
+	# Records are left to be decoded when they're used
+	for row in rows:
+		results.append(dmRecord.fromraw(row[0]))
+
+	log.debug("results length is %d" % (len(results)))
+	log.debug("get_by_db() ending")
+	return results
+
+
+# Function to get the latest record for an OUI via database connection, or the latest as of a given date if
+# 'date' isn't None. Returns a dmRecord instance, or None if there is no such record.
+def getlatest_by_db(dmmgr, oui, date):
+	log.debug("getlatest_by_db() starting")
+	# dmmgr is an instance of the dmManager class, oui is the OUI value to get and date the EventDate to get it as of
+	# This function assumes dmmgr has a valid connection and the OUI given is a valid format!
+	query = "SELECT rec FROM records WHERE oui = ?"
+	params = [normoui(oui)]
+	if date != None:
+		query += " AND eventdate <= ?"
+		params.append(date)
+
+	# Records with the same date are in the order they were journaled, same as get() sorts them
+	try:
+		row = dmmgr.dmh.con.execute(query + " ORDER BY eventdate DESC, id DESC LIMIT 1", params).fetchone()
+	except Exception as e:
+		log.error("ERROR: Couldn't read latest record for OUI %s" % (oui))
+		log.error("Exception triggered: %s" % (e))
+		raise
+
+	log.debug("getlatest_by_db() ending")
+	if row == None:
+		return None
+	return dmRecord.fromraw(row[0])
+
+
+# Function to get all records for a list of OUIs via database connection. The OUIs are looked up in chunks, to
+# stay under SQLite's limit on query parameters. Returns a dict of record lists keyed by OUI.
+def getmany_by_db(dmmgr, ouis):
+	log.debug("getmany_by_db() starting")
+	# dmmgr is an instance of the dmManager class, ouis is the list of normalized OUIs to get
+	# This function assumes dmmgr has a valid connection and the OUIs given are a valid format!
+	results = dict((oui, []) for oui in ouis)
+
+	for i in range(0, len(ouis), 500):
+		chunk = ouis[i:i + 500]
+		query = "SELECT oui, rec FROM records WHERE oui IN (%s) ORDER BY id" % (', '.join(['?'] * len(chunk)))
+		try:
+			rows = dmmgr.dmh.con.execute(query, chunk).fetchall()
+		except Exception as e:
+			log.error("ERROR: Couldn't read records for %d OUIs" % (len(chunk)))
+			log.error("Exception triggered: %s" % (e))
+			raise
+
+		for row in rows:
+			results[row[0]].append(dmRecord.fromraw(row[1]))
+
+	log.debug("getmany_by_db() ending")
+	return results
+
+
+# Function to append a dmRecord instance to the repository via a dmManager instance.
+def add_by_db(dmmgr, rec):
+	# dmmgr is an instance of the dmManager class, rec is a dmRecord instance to append.
+	# This function assumes dmmgr has a valid connection and rec is valid!
+	log.debug("add_by_db() starting")
+	oui = normoui(rec.getOUI())
+
+	# Make sure the OUI has an entry (the equivalent of its directory), then add the record.
+	try:
+		dmmgr.dmh.con.execute("INSERT OR IGNORE INTO ouis (oui, size) VALUES (?, ?)", (oui, len(oui) * 4))
+		dmmgr.dmh.con.execute("INSERT INTO records (oui, eventdate, rec) VALUES (?, ?, ?)",
+			(oui, rec.getEvDate(), rec.getJSON()))
+		dmmgr.dmh.con.commit()
+	except Exception as e:
+		log.error("Unknown error while trying to add record for OUI %s" % (oui))
+		log.error("Exception triggered: %s" % (e))
+		dmmgr.dmh.con.rollback()
+		raise
+	log.info("Successfully added record to database.")
+
+	log.debug("add_by_db() ending")
+	return True
+
+
+# Function to enumerate OUIs in the repository and return as a list
+def enum_by_db(dmmgr, sz, prvflag = True, delflag = False):
+	# dmmgr is an instance of the dmManager class. This function assumes dmmgr has a valid connection!
+	# sz is the OUI size(s) to be checked, prvflag is for private records, delflag is for deleted records (booleans)
+	log.debug("enum_by_db() starting")
+	log.debug("sz = %s" % (sz))
+	log.debug("prvflag = %s" % (prvflag))
+	log.debug("delflag = %s" % (delflag))
+
+	# Build query conditions from the size and flag filters
+	query = "SELECT oui FROM ouis WHERE 1"
+	params = []
+	if sz != 0:
+		query += " AND size = ?"
+		params.append(sz)
+	if prvflag == False:
+		query += " AND private = 0"
+	if delflag == False:
+		query += " AND deleted = 0"
+
+	results = [row[0] for row in dmmgr.dmh.con.execute(query + " ORDER BY oui", params)]
+
+	log.debug("enum_by_db() ending")
+	return results
+
+
+# Function to get the most recent record of every OUI in the repository via database connection. Returns a dict
+# of dmRecord instances keyed by OUI.
+def latest_by_db(dmmgr, sz):
+	# dmmgr is an instance of the dmManager class. This function assumes dmmgr has a valid connection!
+	# sz is the OUI size to be loaded, or 0 for all.
+	log.debug("latest_by_db() starting")
+	latest = {}
+
+	# One ordered pass over the records index, the last record seen for each OUI is its newest. Only those get decoded.
+	query = "SELECT records.oui, records.rec FROM records"
+	params = []
+	if sz != 0:
+		query += " JOIN ouis ON ouis.oui = records.oui WHERE ouis.size = ?"
+		params.append(sz)
+	for row in dmmgr.dmh.con.execute(query + " ORDER BY records.oui, records.eventdate, records.id", params):
+		latest[row[0]] = row[1]
+
+	results = {}
+	for oui in latest:
+		results[oui] = dmRecord.fromraw(latest[oui])
+
+	log.debug("%d total results." % (len(results)))
+	log.debug("latest_by_db() ending")
+	return results
+
+
+# Function to commit a change set to the repository via database connection, as a single transaction.
+# 'changes' is the dict of pending changes by OUI kept by a dmChangeSet.
+def batch_by_db(dmmgr, changes):
+	# dmmgr is an instance of the dmManager class. This function assumes dmmgr has a valid connection and
+	# every OUI and record in the change set has been validated!
+	log.debug("batch_by_db() starting")
+	con = dmmgr.dmh.con
+
+	try:
+		for oui in sorted(changes):
+			change = changes[oui]
+			if change['recs']:
+				con.execute("INSERT OR IGNORE INTO ouis (oui, size) VALUES (?, ?)", (oui, len(oui) * 4))
+				con.executemany("INSERT INTO records (oui, eventdate, rec) VALUES (?, ?, ?)",
+					[(oui, r[0], r[1]) for r in change['recs']])
+			for flag in ('Private', 'Deleted'):
+				if change[flag] != None:
+					con.execute("UPDATE ouis SET %s = ? WHERE oui = ?" % (flag.lower()), (int(change[flag]), oui))
+		con.commit()
+	except Exception as e:
+		log.error("Unknown error while trying to commit changes to database")
+		log.error("Exception triggered: %s" % (e))
+		con.rollback()
+		raise
+	log.info("Successfully committed changes for %d OUIs to database." % (len(changes)))
+
+	log.debug("batch_by_db() ending")
+	return True
+
+					###### Web Interface ######
+
+# Web repositories are served by deepmac_web.py, which answers from an index of another repository held in memory.
+# Requests go through dmConnector.request(), responses are JSON with records as record dicts. The service is
+# read-only, so appends and flag changes are refused here without contacting it.
+
+# Function to send a request to the web repository of a dmManager instance. Returns the decoded response, or None if
+# the request failed.
+def request_by_web(dmmgr, method, path, body = None):
+	(status, result) = dmmgr.dmh.request(method, path, body)
+	if status != 200:
+		log.error("Web repository request %s %s failed (status %s)" % (method, path, status))
+		if result != None and 'Error' in result:
+			log.error("Error given: %s" % (result['Error']))
+		return None
+	return result
+
+
+# Function to check if a specific OUI is private or not, via web connection
+def ispriv_by_web(dmmgr, oui):
+	log.debug("ispriv_by_web() starting")
+	result = request_by_web(dmmgr, 'GET', '/oui/%s/flags' % (normoui(oui)))
+	log.debug("ispriv_by_web() ending")
+	if result == None:
+		return None
+	return result['Private']
+
+
+# Function to check if a specific OUI is deleted or not, via web connection
+def isdel_by_web(dmmgr, oui):
+	log.debug("isdel_by_web() starting")
+	result = request_by_web(dmmgr, 'GET', '/oui/%s/flags' % (normoui(oui)))
+	log.debug("isdel_by_web() ending")
+	if result == None:
+		return None
+	return result['Deleted']
+
+
+# Functions to set the flags of an OUI via web connection, which the read-only service doesn't allow
+def setdel_by_web(dmmgr, oui, bool):
+	log.warn("Web repositories are read-only, can't set the Deleted flag of OUI %s" % (oui))
+	return False
+
+
+def setpriv_by_web(dmmgr, oui, bool):
+	log.warn("Web repositories are read-only, can't set the Private flag of OUI %s" % (oui))
+	return False
+
+
+# Function to get all records for a specific OUI via web connection. Returns a list of dmRecord instances.
+def get_by_web(dmmgr, oui):
+	log.debug("get_by_web() starting")
+	result = request_by_web(dmmgr, 'GET', '/oui/%s' % (normoui(oui)))
+	log.debug("get_by_web() ending")
+	if result == None:
+		return None
+	return [dmRecord.fromdict(r) for r in result['Records']]
+
+
+# Function to get the latest record of an OUI, as of an EventDate or None for the latest of all, via web connection.
+# Returns a dmRecord instance, or None if there isn't one.
+def getlatest_by_web(dmmgr, oui, date):
+	log.debug("getlatest_by_web() starting")
+	path = '/oui/%s/latest' % (normoui(oui))
+	if date != None:
+		path += '?' + urllib.urlencode({'date': date})
+	result = request_by_web(dmmgr, 'GET', path)
+	log.debug("getlatest_by_web() ending")
+	if result == None or result['Record'] == None:
+		return None
+	return dmRecord.fromdict(result['Record'])
+
+
+# Function to get all records for a list of OUIs via web connection, in batches of up to 'webbatch' OUIs a request.
+# Returns a dict of record lists keyed by OUI.
+def getmany_by_web(dmmgr, ouis):
+	log.debug("getmany_by_web() starting")
+	results = {}
+
+	for i in xrange(0, len(ouis), dmmgr.webbatch):
+		result = request_by_web(dmmgr, 'POST', '/ouis', {'OUIs': ouis[i:i + dmmgr.webbatch]})
+		if result == None:
+			log.debug("getmany_by_web() ending")
+			return None
+		for (oui, recs) in result['Records'].iteritems():
+			results[str(oui)] = [dmRecord.fromdict(r) for r in recs]
+
+	log.debug("getmany_by_web() ending")
+	return results
+
+
+# Function to append a record via web connection, which the read-only service doesn't allow
+def add_by_web(dmmgr, rec):
+	log.warn("Web repositories are read-only, can't append a record for OUI %s" % (rec.getOUI()))
+	return False
+
+
+# Function to enumerate OUIs in the repository via web connection and return as a list
+def enum_by_web(dmmgr, sz, prvflag = True, delflag = False):
+	log.debug("enum_by_web() starting")
+	query = urllib.urlencode({'sz': sz, 'prv': int(prvflag), 'del': int(delflag)})
+	result = request_by_web(dmmgr, 'GET', '/enumerate?' + query)
+	log.debug("enum_by_web() ending")
+	if result == None:
+		return None
+	return [str(oui) for oui in result['OUIs']]
+
+
+# Function to get the most recent record of every OUI in the repository via web connection. Returns a dict of
+# dmRecord instances keyed by OUI.
+def latest_by_web(dmmgr, sz):
+	log.debug("latest_by_web() starting")
+	result = request_by_web(dmmgr, 'GET', '/latest?' + urllib.urlencode({'sz': sz}))
+	log.debug("latest_by_web() ending")
+	if result == None:
+		return None
+	return dict([(str(oui), dmRecord.fromdict(r)) for (oui, r) in result['Records'].iteritems()])
+
+
+# Function to commit a change set via web connection, which the read-only service doesn't allow
+def batch_by_web(dmmgr, changes):
+	log.warn("Web repositories are read-only, can't commit changes for %d OUIs" % (len(changes)))
+	return False
+
+
+# Function to search the repository via web connection. 'terms', 'oui' and 'dates' are as for dmSearchIndex.find().
+# Returns a list of dmRecord instances.
+def search_by_web(dmmgr, terms, oui, dates):
+	log.debug("search_by_web() starting")
+	query = dict(terms)
+	if oui != None:
+		query['oui'] = oui
+	if dates != None:
+		(query['first'], query['last']) = dates
+	query = dict([(k, unicode(v).encode('utf-8')) for (k, v) in query.iteritems()])
+	result = request_by_web(dmmgr, 'GET', '/search?' + urllib.urlencode(query))
+	log.debug("search_by_web() ending")
+	if result == None:
+		return None
+	return [dmRecord.fromdict(r) for r in result['Records']]
+
+
+# Function to look up the registrations covering a list of MAC addresses via web connection (see deepmac_lookup.py).
+# Returns a list with an (OUI, dmRecord) tuple for each address, or None for addresses no registration covers.
+def lookup_by_web(dmmgr, macs):
+	log.debug("lookup_by_web() starting")
+	results = []
+
+	for i in xrange(0, len(macs), dmmgr.webbatch):
+		result = request_by_web(dmmgr, 'POST', '/macs', {'MACs': macs[i:i + dmmgr.webbatch]})
+		if result == None:
+			log.debug("lookup_by_web() ending")
+			return None
+		for oui in result['OUIs']:
+			if oui == None:
+				results.append(None)
+			else:
+				results.append((str(oui), dmRecord.fromdict(result['Records'][oui])))
+
+	log.debug("lookup_by_web() ending")
+	return results
+
+					###### Change Set Class ######
+
+# A set of repository changes (record appends and flag changes) to be committed together, made by
+# dmManager.batch(). Changes are validated as they're added and grouped by OUI, so committing writes each
+# OUI's journal once no matter how many records it gets. Flag changes for an OUI are applied after its
+# records, with the last value given winning.
+class dmChangeSet:
+	# Function to return the pending changes for an OUI, starting them if needed
+	def pending(self, oui):
+		oui = normoui(oui)
+		if oui not in self.changes:
+			self.changes[oui] = {'recs': [], 'Private': None, 'Deleted': None}
+		return self.changes[oui]
+
+
+	# Method for adding a record to append. Records are checked the same as for dmManager.append(), and are
+	# serialized here so later changes to the dmRecord instance don't affect what's journaled.
+	# Returns True if the record was added to the change set, otherwise returns False.
+	def append(self, record):
+		log.debug("dmChangeSet.append() starting")
+
+		# Verify this record is in a valid state before allowing it to be recorded
+		if not record.verify():
+			log.error("Record is not in a valid state. Can not append.")
+			log.error("Record = " + record.getJSON().encode('utf-8'))
+			log.debug("dmChangeSet.append() ending")
+			return False
+
+		self.pending(record.getOUI())['recs'].append((record.getEvDate(), record.getJSON(), record.getFingerprint(), record.getEvType()))
+
+		log.debug("dmChangeSet.append() ending")
+		return True
+
+
+	# Methods for adding a Private/Deleted flag change. Returns True if the change was added, or None if the
+	# OUI or flag value are invalid.
+	def setPrivate(self, oui, bool):
+		return self.setflag(oui, 'Private', bool)
+
+
+	def setDeleted(self, oui, bool):
+		return self.setflag(oui, 'Deleted', bool)
+
+
+	def setflag(self, oui, flag, bool):
+		# Check if the OUI specified is in a valid format, bail if not
+		if not self.dmmgr.chkoui(oui):
+			log.warn("An invalid OUI of %s was specified for the set%s() function." % (oui, flag))
+			return None
+
+		# Make sure bool is a True or False, anything else is not allowed
+		if bool != True and bool != False:
+			log.error("Invalid value given for %s flag. Must use True or False." % (flag))
+			return None
+
+		self.pending(oui)[flag] = bool
+		return True
+
+
+	# Method for writing all pending changes to the repository. The change set is empty afterwards and can be
+	# re-used. Returns True if successful, otherwise returns False.
+	def commit(self):
+		log.debug("commit() starting")
+		log.debug("%d OUIs with pending changes" % (len(self.changes)))
 
-	# Check if journal already exists
-	if os.path.isfile(fname):
-		# If it does, read it in and close the file. Fail if any errors occur
-		log.info("Attempting to load journal file")
-		try:
-			fh = codecs.open(fname, 'r', encoding='utf-8')
-			jarr = json.load(fh)
-		except Exception as e:
-			log.error("Unknown error while trying to update file %s (read-in)" % (fname))
-			log.error("Exception triggered: %s" % (e))
-			raise
+		# Nothing to do
+		if not self.changes:
+			log.debug("commit() ending")
+			return True
 
-		# Close the file
-		fh.close()
-	else:
-		# File doesn't exist, create an empty JSON array to use
-		log.info("Journal file doesn't exist, stubbing dict")
-		jarr = {'recs': []}
-		
-	# Append our new record to the JSON array
-	jarr['recs'].append(rec.rec)
-	log.info("Added new record to JSON array")
-	log.debug("jarr length now %d" % (len(jarr)))
+		# Verify we have an active connection to the repository
+		if not self.dmmgr.dmh.isConnected():
+			log.error("A connection to the repository is not established. Can't commit.")
+			log.debug("commit() ending")
+			return False
 
-	# Open file for writing and attempt to write new JSON array
-	log.info("Attempting to write updated journal")
-	try:
-		fh = codecs.open(fname, 'w', encoding='utf-8')
-		json.dump(jarr, fh, ensure_ascii = False, indent = "\t", sort_keys = True)
-	except Exception as e:
-		log.error("Unknown error while trying to update file %s (write-out)" % (fname))
-		log.error("Exception triggered: %s" % (e))
-		raise
-	log.info("Successfully updated journal file.")
+		for oui in self.changes:
+			self.dmmgr.clearCache(oui)
 
-	# Close file
-	fh.close()
+		# Use connection type to determine how to commit changes
+		if self.dmmgr.dmh.type == 'filesystem':
+			result = batch_by_file(self.dmmgr, self.changes)
+		elif self.dmmgr.dmh.type == 'web':
+			result = batch_by_web(self.dmmgr, self.changes)
+		elif self.dmmgr.dmh.type == 'database':
+			result = batch_by_db(self.dmmgr, self.changes)
+		else:
+			log.error("Unrecognized repository connection type, can't continue!")
+			sys.exit(666)
 
-	# Since (presumably) no errors occurred, set result to True
-	result = True
+		# Keep the search index in step, if there is one
+		if result and self.dmmgr.searchindex != None:
+			for oui in sorted(self.changes):
+				for r in self.changes[oui]['recs']:
+					self.dmmgr.searchindex.add(dmRecord.fromraw(r[1]))
 
-	# Return the result status
-	log.debug("add_by_file() ending")
-	return result
+		self.changes = {}
+		log.debug("commit() ending")
+		return result
 
 
+	# Check if an OUI has changes pending, so callers reading the repository know to commit first
+	def __contains__(self, oui):
+		return normoui(oui) in self.changes
 
-# Function to enumerate OUIs in the repository and return as a list
-def enum_by_file(dmmgr, sz, prvflag = True, delflag = False):
-	# dmmgr is an instance of the dmManager class. This function assumes dmmgr has a valid connection!
-	# sz is the OUI size(s) to be checked, prvflag is for private records, delflag is for deleted records (booleans)
-	# NOTE: If not specified in original call, prvflag will be True and delflag will be False
-	log.debug("enum_by_file() starting")
-	log.debug("dmmgr.dmh.addr = %s" % (dmmgr.dmh.addr))
-	log.debug("sz = %s" % (sz))
-	log.debug("prvflag = %s" % (prvflag))
-	log.debug("delflag = %s" % (delflag))
-	results = []
 
-	# Walk through the repository directory tree
-	log.info("Walking directory %s" % (dmmgr.dmh.addr))
-	for entry in os.walk(dmmgr.dmh.addr):
-		log.debug("entry = %s" % (str(entry)))
+	def __len__(self):
+		return len(self.changes)
 
-		# Check if this entry is for a records file
-		if 'records' in entry[2]:
-			log.info("Found entry for records file")
-			# Break off root path and remove slashes
-			dir = re.sub(dmmgr.dmh.addr, '', entry[0])
-			dir = re.sub('/', '', dir)
-			log.debug("dir = %s" % (dir))
-			
-			# Check if this OUI is a size we care about
-			if sz == 0 or len(dir) == sz/4:
-				# Check flags 
-				if prvflag == False and dmmgr.isPrivate(dir):
-					# Skip this entry
-					log.info("Skipping private entry")
-					continue
-
-				if delflag == False and dmmgr.isDeleted(dir):
-					# Skip this entry
-					log.info("Skipping deleted entry")
-					continue
-
-				# Entry matches all conditions, add this OUI to our results
-				results.append(dir)
-				log.info("Appended %s to results" % (dir))
 
-	### Return the result status
-	log.debug("enum_by_file() ending")
-	return results
+	# Called upon instantiation of the object. 'dmmgr' is the dmManager instance to commit changes through.
+	def __init__(self, dmmgr):
+		self.dmmgr = dmmgr
+		self.changes = {}
 
 					###### Primary Manager Class ######
 
@@ -443,6 +2061,12 @@ class dmManager:
 			log.warn("A connection to the repository is not established. Can't read.")
 			return None
 
+		# Serve the records from the cache if we have them
+		results = self.getCached(oui)
+		if results != None:
+			log.debug("get() ending")
+			return results
+
 		# Use connection type to determine how to pull records. Call the appropriate external
 		# function and pass in a copy of the dmManager instance along with the oui given.
 		if self.dmh.type == 'filesystem':
@@ -455,14 +2079,193 @@ class dmManager:
 			log.error("Unrecognized repository connection type, can't continue!")
 			sys.exit(666)
 
+		if results == None:
+			log.error("Couldn't read the records of OUI %s." % (oui))
+			log.debug("get() ending")
+			return None
+
 		# Sort the results by event date in ascending order.
 		# NOTE: The sorting logic is handled in functool overloads in the dmRecord class
 		results.sort()
+		self.putCached(oui, results)
 
 		log.debug("get() ending")
 		return results
 
 
+	# Methods for getting just the latest record for a specific OUI, or the latest as of a given date (i.e. the record
+	# in effect on that date), without reading its whole history. Returns a dmRecord type, or None if there is no
+	# such record or there is an error.
+	def getLatest(self, oui):
+		return self.getAsOf(oui, None)
+
+
+	def getAsOf(self, oui, date):
+		# 'oui' is the OUI to get the record for, 'date' the EventDate (YYYY-MM-DD) to get it as of, or None for the latest
+		log.debug("getAsOf() starting")
+		log.debug("oui = %s" % (oui))
+		log.debug("date = %s" % (date))
+
+		# Check if the OUI specified is in a valid format, bail if not
+		if not self.chkoui(oui):
+			log.warn("An invalid OUI of %s was specified for the getAsOf operation." % (oui))
+			log.debug("getAsOf() ending")
+			return None
+
+		# Verify we have an active connection to the repository
+		if not self.dmh.isConnected():
+			log.warn("A connection to the repository is not established. Can't read.")
+			log.debug("getAsOf() ending")
+			return None
+
+		# Use connection type to determine how to pull the record
+		if self.dmh.type == 'filesystem':
+			result = getlatest_by_file(self, oui, date)
+		elif self.dmh.type == 'web':
+			result = getlatest_by_web(self, oui, date)
+		elif self.dmh.type == 'database':
+			result = getlatest_by_db(self, oui, date)
+		else:
+			log.error("Unrecognized repository connection type, can't continue!")
+			sys.exit(666)
+
+		log.debug("getAsOf() ending")
+		return result
+
+
+	# Method returning the fingerprint (see dmRecord.getFingerprint()) and EventType of the latest record of an OUI as
+	# a tuple, without reading its journal. Only filesystem repositories keep these (in the manifest), None is returned
+	# for other repository types, for an invalid OUI, or if the repository doesn't have them for the OUI.
+	def getFingerprint(self, oui):
+		log.debug("getFingerprint() starting")
+		result = None
+
+		if not self.chkoui(oui):
+			log.warn("An invalid OUI of %s was specified for the getFingerprint operation." % (oui))
+			log.debug("getFingerprint() ending")
+			return result
+
+		if self.dmh.type == 'filesystem' and self.dmh.isConnected():
+			entry = manifest_entry(self, oui)
+			if entry.get('Fingerprint') != None:
+				result = (entry['Fingerprint'], entry['LastType'])
+
+		log.debug("getFingerprint() ending")
+		return result
+
+
+	# Method for getting all records for many OUIs at once. Takes a list of OUIs and returns a dict keyed by the
+	# normalized OUI, each value a list of dmRecord types sorted as get() would (empty if there are no records).
+	# Returns None if any OUI is invalid or there is an error. 'threads' is the number of threads used to read
+	# journal files on filesystem repositories.
+	def getMany(self, ouis, threads = 8):
+		log.debug("getMany() starting")
+		log.debug("%d OUIs requested" % (len(ouis)))
+
+		# Check all the OUIs specified are in a valid format, bail if not
+		for oui in ouis:
+			if not self.chkoui(oui):
+				log.warn("An invalid OUI of %s was specified for the getMany operation." % (oui))
+				log.debug("getMany() ending")
+				return None
+
+		# Verify we have an active connection to the repository
+		if not self.dmh.isConnected():
+			log.warn("A connection to the repository is not established. Can't read.")
+			log.debug("getMany() ending")
+			return None
+
+		# Take what we can from the cache, only the rest need reading
+		results = {}
+		wanted = []
+		for oui in sorted(set([normoui(oui) for oui in ouis])):
+			recs = self.getCached(oui)
+			if recs != None:
+				results[oui] = recs
+			else:
+				wanted.append(oui)
+
+		# Use connection type to determine how to pull records
+		if not wanted:
+			found = {}
+		elif self.dmh.type == 'filesystem':
+			found = getmany_by_file(self, wanted, threads)
+		elif self.dmh.type == 'web':
+			found = getmany_by_web(self, wanted)
+		elif self.dmh.type == 'database':
+			found = getmany_by_db(self, wanted)
+		else:
+			log.error("Unrecognized repository connection type, can't continue!")
+			sys.exit(666)
+
+		if found == None:
+			log.error("Couldn't read the records of the OUIs requested.")
+			log.debug("getMany() ending")
+			return None
+
+		# Sort each OUI's records by event date in ascending order, same as get()
+		for oui in found:
+			found[oui].sort()
+			self.putCached(oui, found[oui])
+		results.update(found)
+
+		log.debug("getMany() ending")
+		return results
+
+
+	# Methods for the optional cache of get() results, a bounded LRU of each OUI's sorted records kept as record
+	# dicts. Callers are free to change the dmRecord instances they get back, so records are copied going into
+	# the cache and again coming out of it. Any write to an OUI's journal drops its entry. The Private/Deleted
+	# flags aren't part of get() results, so flag changes leave the cache alone.
+
+	# Returns the cached records for an OUI as new dmRecord instances, or None if it isn't cached
+	def getCached(self, oui):
+		if self.cache == None:
+			return None
+
+		oui = normoui(oui)
+		if oui not in self.cache:
+			self.cachemisses += 1
+			return None
+
+		# Move the entry to the most recently used end
+		recs = self.cache.pop(oui)
+		self.cache[oui] = recs
+		self.cachehits += 1
+		log.debug("Cache hit for OUI %s" % (oui))
+		return [dmRecord.fromdict(r) for r in recs]
+
+
+	# Adds an OUI's records to the cache, evicting the least recently used entry if the cache is full
+	def putCached(self, oui, results):
+		if self.cache == None:
+			return None
+
+		self.cache[normoui(oui)] = [r.todict() for r in results]
+		while len(self.cache) > self.cachesize:
+			self.cache.popitem(last = False)
+			self.cacheevictions += 1
+		return None
+
+
+	# Drops the cached records of an OUI, or of every OUI if none is given
+	def clearCache(self, oui = None):
+		if self.cache == None:
+			return None
+
+		if oui == None:
+			self.cache.clear()
+		else:
+			self.cache.pop(normoui(oui), None)
+		return None
+
+
+	# Returns a dict of cache statistics: hits, misses, evictions, number of OUIs cached and the cache size.
+	def cacheStats(self):
+		return {'Hits': self.cachehits, 'Misses': self.cachemisses, 'Evictions': self.cacheevictions,
+				'Entries': len(self.cache) if self.cache != None else 0, 'Size': self.cachesize}
+
+
 	# Method for appending a record to the repository (i.e. journaling). Takes a
 	# dmRecord object as input. The record, if valid, is used to determine where to
 	# store the data and then the appropriate entry is appended to the record.
@@ -486,6 +2289,7 @@ class dmManager:
 		else:
 			# Use connection type to determine how to append record. Call the appropriate external
 			# function and pass in a copy of the dmManager instance along with the record given.
+			self.clearCache(record.getOUI())
 			if self.dmh.type == 'filesystem':
 				result = add_by_file(self, record)
 			elif self.dmh.type == 'web':
@@ -496,10 +2300,22 @@ class dmManager:
 				log.error("Unrecognized repository connection type, can't continue!")
 				sys.exit(666)
 
+			# Keep the search index in step, if there is one
+			if result and self.searchindex != None:
+				self.searchindex.add(record)
+
 		log.debug("append() ending")
 		return result
 
 
+	# Method for starting a set of changes to commit together. Returns a dmChangeSet that takes append(),
+	# setPrivate() and setDeleted() calls and writes them all out to the repository on commit().
+	def batch(self):
+		log.debug("batch() starting")
+		log.debug("batch() ending")
+		return dmChangeSet(self)
+
+
 	# Method for enumerating entries in the repository. Returns a list of OUIs currently
 	# in the repository. Optional flags control what size OUIs are looked at and if entries
 	# flagged private/deleted are included.
@@ -517,6 +2333,12 @@ class dmManager:
 			log.debug("enumerate() ending")
 			return results
 
+		# Verify we have an active connection to the repository
+		if not self.dmh.isConnected():
+			log.warn("A connection to the repository is not established. Can't read.")
+			log.debug("enumerate() ending")
+			return results
+
 		# Determine which enumeration process to use based on connection type
 		if self.dmh.type == 'filesystem':
 			results = enum_by_file(self, sz, prvflag, delflag)
@@ -528,24 +2350,189 @@ class dmManager:
 			log.error("Unrecognized repository connection type, can't continue!")
 			sys.exit(666)
 
+		if results == None:
+			log.error("Couldn't enumerate the OUIs of the repository.")
+			log.debug("enumerate() ending")
+			return None
+
 		log.debug("%d total results." % (len(results)))
 		log.debug("enumerate() ending")
 		return results
 
 
-	# Method for searching repository for all records matching specific criteria
-	# TODO: Finish writing this function
-	def search(self, oui, date, orgname, orgaddress):
+	# Method for getting the most recent record of every OUI in the repository (including private and deleted
+	# entries), for callers that would otherwise get() each OUI just to take the last record. Returns a dict of
+	# dmRecord instances keyed by OUI, or None on an error.
+	# sz	  - Size of OUIs to load. Default value of 0 means all, otherwise the bitsize of the OUI (i.e. 24, 36, etc)
+	def latest(self, sz = 0):
+		log.debug("latest() starting")
+		results = None
+
+		# Validate sz parameter
+		if sz > 0 and sz not in (dmRecord.ouisizes):
+			log.warn("sz is not a valid OUI size (%d)" % (sz))
+			log.debug("latest() ending")
+			return results
+
+		# Verify we have an active connection to the repository
+		if not self.dmh.isConnected():
+			log.warn("A connection to the repository is not established. Can't read.")
+			log.debug("latest() ending")
+			return results
+
+		# Determine which process to use based on connection type
+		if self.dmh.type == 'filesystem':
+			results = latest_by_file(self, sz)
+		elif self.dmh.type == 'web':
+			results = latest_by_web(self, sz)
+		elif self.dmh.type == 'database':
+			results = latest_by_db(self, sz)
+		else:
+			log.error("Unrecognized repository connection type, can't continue!")
+			sys.exit(666)
+
+		if results == None:
+			log.error("Couldn't read the latest records of the repository.")
+			log.debug("latest() ending")
+			return None
+
+		log.debug("%d total results." % (len(results)))
+		log.debug("latest() ending")
+		return results
+
+
+	# Method for finding the registrations covering a list of MAC addresses (see deepmac_lookup.py). Returns a list
+	# with an (OUI, dmRecord) tuple for each address, the OUI and latest record of the most specific active
+	# registration covering it, or None if there isn't one. Returns None if there is an error. Web repositories answer
+	# from the service's lookup table, for others a dmLookup is made for the call (make one directly to keep it).
+	def lookup(self, macs):
+		log.debug("lookup() starting")
+		log.debug("%d MAC addresses given" % (len(macs)))
+
+		# Verify we have an active connection to the repository
+		if not self.dmh.isConnected():
+			log.warn("A connection to the repository is not established. Can't read.")
+			log.debug("lookup() ending")
+			return None
+
+		if self.dmh.type == 'web':
+			results = lookup_by_web(self, macs)
+		elif self.dmh.type in ('filesystem', 'database'):
+			table = dmLookup(self)
+			results = []
+			for mac in macs:
+				slot = table.find(mac)
+				if slot == None:
+					results.append(None)
+				else:
+					results.append((table.oui(slot), table.record(slot)))
+		else:
+			log.error("Unrecognized repository connection type, can't continue!")
+			sys.exit(666)
+
+		log.debug("lookup() ending")
+		return results
+
+
+	# Method for searching repository for all records matching specific criteria. Returns a list of dmRecord types
+	# sorted by OUI and event date (empty if nothing matches), or None if there is an error. Parameters not used should
+	# be None, and at least one must be given. Every one given must match:
+	#	oui		   - OUI prefix, i.e. 0050C2 finds the OUI 0050C2 and every MA-S OUI inside it
+	#	date	   - EventDate as YYYY, YYYY-MM or YYYY-MM-DD, matching records from that year, month or day. Can also be
+	#				 a (first, last) tuple of YYYY-MM-DD dates, to match records from first to last inclusive.
+	#	orgname	   - Words to find in OrgName, case doesn't matter. Every word must be in it, and a word ending in '*'
+	#				 matches any word starting with it (i.e. "cisco sys*"). Text without any words (i.e. "*") is an error.
+	#	orgaddress - Words to find in OrgAddress, the same way
+	#	orgcountry - Words to find in OrgCountry, the same way
+	# The first search reads every record of the repository into a search index, later ones only use the index. Records
+	# appended through this instance are added to it; call clearSearch() to pick up changes made by anything else.
+	def search(self, oui, date, orgname, orgaddress, orgcountry = None):
 		log.debug("search() starting")
-		# Log the params given
+		log.debug("oui = %s" % (oui))
+		log.debug("date = %s" % (str(date)))
+		log.debug("orgname = %s" % (orgname))
+		log.debug("orgaddress = %s" % (orgaddress))
+		log.debug("orgcountry = %s" % (orgcountry))
 
 		# Verify at least one search parameter given, return error if not
+		terms = {}
+		for (field, text) in (('OrgName', orgname), ('OrgAddress', orgaddress), ('OrgCountry', orgcountry)):
+			if text != None and text != '':
+				terms[field] = text
+		if not terms and not oui and not date:
+			log.warn("No search parameters given.")
+			log.debug("search() ending")
+			return None
+
 		# Check each parameter to verify it's searchable for the given field
-		# Perform any case conversions
+		for (field, text) in sorted(terms.iteritems()):
+			if not queryre.search(unicode(text)):
+				log.warn("The %s search text %s has no words to search for." % (field, text))
+				log.debug("search() ending")
+				return None
+
+		if oui:
+			oui = normoui(oui)
+			if len(oui) > 9 or re.search('[^0-9A-F]', oui):
+				log.warn("An invalid OUI prefix of %s was specified for the search operation." % (oui))
+				log.debug("search() ending")
+				return None
+		else:
+			oui = None
+
+		dates = None
+		if isinstance(date, tuple):
+			if len(date) != 2 or not all([re.match('^\d{4}-\d{2}-\d{2}$', d) for d in date]):
+				log.warn("An invalid date range of %s was specified for the search operation." % (str(date)))
+				log.debug("search() ending")
+				return None
+			dates = date
+		elif date:
+			if not re.match('^\d{4}(-\d{2}(-\d{2})?)?$', date):
+				log.warn("An invalid date of %s was specified for the search operation." % (date))
+				log.debug("search() ending")
+				return None
+			# Every date starting with the one given sorts between it and it followed by '~'
+			dates = (date, date + '~')
+
+		# Verify we have an active connection to the repository
+		if not self.dmh.isConnected():
+			log.warn("A connection to the repository is not established. Can't search.")
+			log.debug("search() ending")
+			return None
 
-		# TODO: Write actual search code! :/
+		if self.dmh.type == 'web':
+			results = search_by_web(self, terms, oui, dates)
+		elif self.dmh.type in ('filesystem', 'database'):
+			# Make the search index the first time through
+			if self.searchindex == None:
+				log.info("Building search index")
+				ouis = self.enumerate(0, True, True)
+				found = None
+				if ouis != None:
+					found = self.getMany(ouis)
+				if found == None:
+					log.error("Couldn't read the repository to build the search index.")
+					log.debug("search() ending")
+					return None
+				index = dmSearchIndex()
+				for o in sorted(found):
+					for rec in found[o]:
+						index.add(rec)
+				self.searchindex = index
+				log.info("Search index has %d records" % (len(index)))
+			results = self.searchindex.find(terms, oui, dates)
+		else:
+			log.error("Unrecognized repository connection type, can't continue!")
+			sys.exit(666)
 
 		log.debug("search() ending")
+		return results
+
+
+	# Method to drop the search index, so the next search() makes it again from the repository as it is then
+	def clearSearch(self):
+		self.searchindex = None
 		return None
 
 
@@ -704,12 +2691,154 @@ class dmManager:
 		return result
 
 
+	# Method for converting a repository to the current journal format. Only filesystem repositories
+	# have older formats to convert. Returns the number of journals converted, or None on an error.
+	def migrate(self):
+		log.debug("migrate() starting")
+
+		# Verify we have an active connection to the repository
+		if not self.dmh.isConnected():
+			log.error("A connection to the repository is not established. Can't migrate.")
+			log.debug("migrate() ending")
+			return None
+
+		if self.dmh.type == 'filesystem':
+			result = migrate_by_file(self)
+		else:
+			log.info("Nothing to migrate for repository type %s" % (self.dmh.type))
+			result = 0
+
+		log.debug("migrate() ending")
+		return result
+
+
+	# Method for compacting a filesystem repository. The records and flags of every OUI in the journal's directory tree
+	# are moved into pack files, one per top-level shard, and the tree is removed, leaving a handful of files in place
+	# of tens of thousands. OUIs written to later get a directory in the tree again until the next compact(). Other
+	# repository types have nothing to compact. Returns the number of OUI directories compacted, or None on an error.
+	def compact(self):
+		log.debug("compact() starting")
+
+		# Verify we have an active connection to the repository
+		if not self.dmh.isConnected():
+			log.error("A connection to the repository is not established. Can't compact.")
+			log.debug("compact() ending")
+			return None
+
+		if self.dmh.type == 'filesystem':
+			result = compact_by_file(self)
+		else:
+			log.info("Nothing to compact for repository type %s" % (self.dmh.type))
+			result = 0
+
+		log.debug("compact() ending")
+		return result
+
+
+	# Method for rebuilding the manifest of OUIs from the repository contents, for when it's missing or suspect.
+	# Only filesystem repositories keep a manifest. Returns the number of OUIs found, or None on an error.
+	def rebuildManifest(self):
+		log.debug("rebuildManifest() starting")
+
+		# Verify we have an active connection to the repository
+		if not self.dmh.isConnected():
+			log.error("A connection to the repository is not established. Can't rebuild manifest.")
+			log.debug("rebuildManifest() ending")
+			return None
+
+		if self.dmh.type == 'filesystem':
+			result = rebuild_manifest_by_file(self)
+		else:
+			log.info("Repository type %s has no manifest to rebuild" % (self.dmh.type))
+			result = 0
+
+		log.debug("rebuildManifest() ending")
+		return result
+
+
+	# Method for checking a repository over and repairing it after an interrupted write. Filesystem repositories
+	# are recovered automatically when connecting if they weren't closed cleanly, this forces it. Database
+	# repositories are kept consistent by SQLite itself. Returns the number of journals repaired, or None on an error.
+	def recover(self):
+		log.debug("recover() starting")
+
+		# Verify we have an active connection to the repository
+		if not self.dmh.isConnected():
+			log.error("A connection to the repository is not established. Can't recover.")
+			log.debug("recover() ending")
+			return None
+
+		if self.dmh.type == 'filesystem':
+			# Recovering under a running writer would wreck its writes, so it needs the dirty marker to itself
+			if not lock_dirty_by_file(self, True):
+				log.error("Repository %s is being written by another process. Can't recover." % (self.dmh.addr))
+				log.debug("recover() ending")
+				return None
+			self.clearCache()
+			self.clearSearch()
+			result = recover_by_file(self)
+		else:
+			log.info("Nothing to recover for repository type %s" % (self.dmh.type))
+			result = 0
+
+		log.debug("recover() ending")
+		return result
+
+
+	# Methods for sharing a filesystem repository between processes (i.e. worker processes writing to different OUIs).
+	# holdManifest() stops manifest changes being written out by this instance, releaseManifest() ends that and
+	# returns the changes held, and mergeManifest() writes held changes out through another instance. Repository
+	# types without a manifest have nothing to hold, so release returns an empty list.
+	def holdManifest(self):
+		log.debug("holdManifest() starting")
+		if self.dmh.type == 'filesystem':
+			self.manifesthold = []
+		log.debug("holdManifest() ending")
+		return None
+
+
+	def releaseManifest(self):
+		log.debug("releaseManifest() starting")
+		entries = self.manifesthold
+		if entries == None:
+			entries = []
+		self.manifesthold = None
+		log.debug("releaseManifest() ending")
+		return entries
+
+
+	def mergeManifest(self, entries):
+		log.debug("mergeManifest() starting")
+
+		# Verify we have an active connection to the repository
+		if not self.dmh.isConnected():
+			log.error("A connection to the repository is not established. Can't merge manifest.")
+			log.debug("mergeManifest() ending")
+			return False
+
+		# The entries are for OUIs written by another instance, so our cached records and search index are stale
+		for entry in entries:
+			self.clearCache(entry['OUI'])
+		self.clearSearch()
+
+		if self.dmh.type == 'filesystem':
+			merge_manifest_by_file(self, entries)
+
+		log.debug("mergeManifest() ending")
+		return True
+
+
 	# Function to close repository connection, end any processing
 	def end(self):
 		log.debug("end() starting")
 
 		# Check if there's a valid connection handle, if so disconnect
 		if self.dmh.isConnected():
+			# Everything this instance wrote is on disk, so the repository can be marked clean again
+			if self.dmh.type == 'filesystem':
+				mark_clean_by_file(self)
+				close_packs_by_file(self)
+
 			log.info("Connection established, disconnecting.")
 			self.dmh.disconnect()
 			log.info("Disconnected.")
@@ -724,9 +2853,19 @@ class dmManager:
 	#	'type' is the connection type: filesystem, database, web
 	#	'address' is the address for the connection type:
 	#	'creds' is optional, and is a list 
-	def __init__(self, type, address, creds):
+	#	'cachesize' is the number of OUIs to keep get() results cached for, 0 (the default) for no cache
+	def __init__(self, type, address, creds, cachesize = 0):
 		log.debug("__init__() starting")
 
+		# Set up the get() cache
+		self.cache = None
+		self.cachesize = cachesize
+		self.cachehits = 0
+		self.cachemisses = 0
+		self.cacheevictions = 0
+		if cachesize > 0:
+			self.cache = collections.OrderedDict()
+
 		# Create an instance of the connector class here, using the above params.
 		self.dmh = dmConnector(type, address, creds)
 
@@ -740,6 +2879,25 @@ class dmManager:
 			sys.exit(666)
 
 		log.info("Connection to DeepMac repository established.")
+
+		# Filesystem repositories keep a manifest of their OUIs, load it (or build it if it doesn't exist yet)
+		self.manifest = None
+		self.manifestlines = 0
+		self.manifesthold = None
+		self.dirty = False
+		self.dirtyfh = None
+		self.packs = {}
+		self.packlock = threading.Lock()
+		self.webbatch = 1000
+		self.searchindex = None
+		if self.dmh.type == 'filesystem':
+			# A dirty marker nobody holds means the last writer didn't finish, so check the repository over first
+			if lock_dirty_by_file(self, False):
+				log.warn("Repository %s wasn't closed cleanly, recovering." % (self.dmh.addr))
+				recover_by_file(self)
+			else:
+				load_manifest_by_file(self)
+
 		log.debug("__init__() ending")
 		return None
 
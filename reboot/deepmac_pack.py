@@ -0,0 +1,360 @@
+#!/usr/bin/python
+
+# File   : dmPack.py
+# Author : Jeff Mercer <jedi@jedimercer.com>
+# Purpose: Packed binary journal files for DeepMac filesystem repositories
+# Written: 2026/10/17
+# Updated: 2026/10/17
+
+# 20261017 - Initial version. Reads and writes pack files, which hold the records of many OUIs in a compact binary
+#			 form read through mmap.
+#		   - Split the record and string table encoding out of write_pack() and dmPackFile, for other binary files
+#			 (see deepmac_lookup.py) to share.
+
+# A pack file holds the journals of every OUI under one top-level shard of a filesystem repository (i.e. all OUIs
+# starting with 00 are in packs/00.pack). All numbers are little-endian. The file is laid out as:
+#	header	 - magic 'DMPK', format version, OUI count, record count, string count and the offsets of the sections below
+#	OUI index - one fixed-width entry per OUI, sorted by (OUISize, OUI): the OUI as an integer, its size, its flags
+#				(bit 0 Private, bit 1 Deleted), and the position and number of its records in the record table
+#	records	 - one fixed-width entry per record, each OUI's records together and in EventDate order: OUI as an
+#				integer, OUISize, record type, event type, EventDate as days since 1970-01-01, and string table
+#				numbers for Source, OrgName, OrgAddress, OrgCountry and a JSON object of any other fields
+#	strings	 - an array of string end offsets followed by the UTF-8 strings themselves, each distinct string once (the
+#				pack's dmStrDict)
+# Any field value that doesn't fit its fixed-width slot (a malformed OUI, an unknown event type, etc) is kept in the
+# record's JSON object instead, so records always come back out exactly as they went in.
+# Pack files are never changed in place. A new one is written whole alongside the old one and renamed over it.
+
+import os
+import mmap
+import struct
+import logging
+import datetime
+import simplejson as json
+from deepmac_strdict import dmStrDict
+
+# Logging configuration
+log = logging.getLogger('dm_pack')
+handler = logging.StreamHandler()
+logformat = logging.Formatter("%(asctime)s - %(name)s %(levelname)s: %(message)s")
+handler.setFormatter(logformat)
+log.addHandler(handler)
+log.setLevel(logging.ERROR)
+
+# File layout
+magic = 'DMPK'
+version = 1
+header = struct.Struct('<4sHxxIIIIII')
+ouientry = struct.Struct('<QBBxxII')
+recentry = struct.Struct('<QBBBBiIIIII')
+strentry = struct.Struct('<I')
+
+# Values stored for a field that's absent (or kept in the record's JSON object instead)
+nostr = 0xFFFFFFFF
+nodate = -0x80000000
+nocode = 0xFF
+
+# Flag bits of an OUI index entry, and record bits
+flagbits = (('Private', 1), ('Deleted', 2))
+hasoui = 1
+
+# Codes for the record and event types
+rectypes = ['registry', 'metadata']
+eventtypes = ['add', 'change', 'delete']
+
+# Record fields with a string table slot, in the order of their slots
+strfields = ('Source', 'OrgName', 'OrgAddress', 'OrgCountry')
+
+epoch = datetime.date(1970, 1, 1).toordinal()
+
+####
+
+# Function to turn an EventDate into days since 1970-01-01. Returns None for anything that wouldn't come back out
+# exactly the same (wrong format, not a string, etc).
+def date2days(value):
+	if not isinstance(value, basestring) or len(value) != 10:
+		return None
+	try:
+		d = datetime.datetime.strptime(value, '%Y-%m-%d').date()
+	except ValueError:
+		return None
+	if d.isoformat() != value:
+		return None
+	return d.toordinal() - epoch
+
+
+def days2date(days):
+	return unicode(datetime.date.fromordinal(days + epoch).isoformat())
+
+
+# Function to turn an OUI into its integer form. Returns None if the OUI isn't hex digits of the length its size calls for.
+def oui2int(oui, size):
+	if not isinstance(oui, basestring) or size not in (24, 28, 36) or len(oui) != size / 4:
+		return None
+	try:
+		value = int(oui, 16)
+	except ValueError:
+		return None
+	if '%0*X' % (size / 4, value) != oui:
+		return None
+	return value
+
+
+def int2oui(value, size):
+	return u'%0*X' % (size / 4, value)
+
+
+# Function to make the index key of an OUI string, the order OUIs are sorted in within a pack. Returns None for
+# anything that can't be a repository OUI.
+def ouikey(oui):
+	size = len(oui) * 4
+	value = oui2int(oui, size)
+	if value == None:
+		return None
+	return (size, value)
+
+####
+
+# Function to encode a record dict as a record table entry, adding its strings to 'strings' (a dmStrDict). Returns
+# the packed entry.
+def pack_record(r, strings):
+	rest = dict(r)
+
+	# Take out each field that fits its slot, whatever is left over goes in the JSON object
+	osize = rest.get('OUISize')
+	if isinstance(osize, int) and not isinstance(osize, bool) and osize in (24, 28, 36):
+		del rest['OUISize']
+	else:
+		osize = 0
+	ouival = oui2int(rest.get('OUI'), osize)
+	if ouival != None:
+		del rest['OUI']
+		rbits = hasoui
+	else:
+		ouival = 0
+		rbits = 0
+	rtype = nocode
+	if rest.get('DeepMac') in rectypes:
+		rtype = rectypes.index(rest.pop('DeepMac'))
+	etype = nocode
+	if rest.get('EventType') in eventtypes:
+		etype = eventtypes.index(rest.pop('EventType'))
+	days = date2days(rest.get('EventDate'))
+	if days != None:
+		del rest['EventDate']
+	else:
+		days = nodate
+	strs = []
+	for key in strfields:
+		if isinstance(rest.get(key), basestring):
+			strs.append(strings.intern(unicode(rest.pop(key))))
+		else:
+			strs.append(nostr)
+	if rest:
+		strs.append(strings.intern(json.dumps(rest, ensure_ascii = False, sort_keys = True)))
+	else:
+		strs.append(nostr)
+
+	return recentry.pack(ouival, osize, rtype, etype, rbits, days, *strs)
+
+
+# Function to decode the record table entry at 'offset' in 'data' back into a record dict. 'string' is a function
+# returning a string from the file's string table by its number.
+def unpack_record(data, offset, string):
+	e = recentry.unpack_from(data, offset)
+	(ouival, osize, rtype, etype, bits, days) = e[0:6]
+
+	r = {}
+	if e[10] != nostr:
+		r = json.loads(string(e[10]))
+	if osize:
+		r['OUISize'] = osize
+	if bits & hasoui:
+		r['OUI'] = int2oui(ouival, osize)
+	if rtype != nocode:
+		r['DeepMac'] = rectypes[rtype]
+	if etype != nocode:
+		r['EventType'] = eventtypes[etype]
+	if days != nodate:
+		r['EventDate'] = days2date(days)
+	for (key, num) in zip(strfields, e[6:10]):
+		if num != nostr:
+			r[key] = string(num)
+	return r
+
+
+# Function to encode the strings of a dmStrDict as a string table: an array of string end offsets followed by the
+# UTF-8 strings. Returns the packed table.
+def pack_strings(strings):
+	blob = [value.encode('utf-8') for value in strings.strings]
+	ends = []
+	pos = 0
+	for s in blob:
+		pos += len(s)
+		ends.append(strentry.pack(pos))
+	return ''.join(ends) + ''.join(blob)
+
+
+# Function returning string number 'num' from the string table at 'offset' in 'data', which holds 'count' strings.
+# Returns None for an absent value.
+def unpack_string(data, offset, count, num):
+	if num == nostr:
+		return None
+	blob = offset + count * strentry.size
+	start = 0
+	if num > 0:
+		start = strentry.unpack_from(data, offset + (num - 1) * strentry.size)[0]
+	end = strentry.unpack_from(data, offset + num * strentry.size)[0]
+	return data[blob + start:blob + end].decode('utf-8')
+
+####
+
+# Function to write a pack file. 'ouis' is a list of (OUI, flags, records) tuples, flags being a dict with the
+# Private and Deleted flags of the OUI and records a list of record dicts, already in EventDate order. The file is
+# synced to disk before returning, renaming it into place is left to the caller. Returns the number of records written.
+def write_pack(fname, ouis):
+	log.debug("write_pack() starting")
+	log.debug("fname = %s" % (fname))
+
+	strings = dmStrDict()
+	index = []
+	records = []
+	for (oui, flags, recs) in sorted(ouis, key = lambda o: ouikey(o[0])):
+		(size, value) = ouikey(oui)
+		bits = 0
+		for (flag, bit) in flagbits:
+			if flags.get(flag):
+				bits |= bit
+		index.append(ouientry.pack(value, size, bits, len(records), len(recs)))
+
+		for r in recs:
+			records.append(pack_record(r, strings))
+
+	# Lay out the sections one after another
+	ouioff = header.size
+	recoff = ouioff + ouientry.size * len(index)
+	stroff = recoff + recentry.size * len(records)
+
+	try:
+		fh = open(fname, 'wb')
+		fh.write(header.pack(magic, version, len(index), len(records), len(strings), ouioff, recoff, stroff))
+		fh.write(''.join(index))
+		fh.write(''.join(records))
+		fh.write(pack_strings(strings))
+		fh.flush()
+		os.fsync(fh.fileno())
+		fh.close()
+	except Exception as e:
+		log.error("Unknown error while trying to write pack file %s" % (fname))
+		log.error("Exception triggered: %s" % (e))
+		raise
+
+	log.info("Wrote pack file %s (%d OUIs, %d records, %d strings)" % (fname, len(index), len(records), len(strings)))
+	log.debug("write_pack() ending")
+	return len(records)
+
+####
+
+# Class for reading a pack file. The file is mapped into memory and its entries are unpacked straight out of the
+# mapping as they're used, so opening a pack costs the same however big it is and only the records asked for are
+# ever decoded. Instances can be shared between threads.
+class dmPackFile(object):
+	# Function to look up an OUI in the index. Returns its position in the index, or None if it isn't there.
+	def find(self, oui):
+		key = ouikey(oui)
+		if key == None:
+			return None
+
+		# Binary search of the index, which is sorted by (size, OUI)
+		lo = 0
+		hi = self.ouicount
+		while lo < hi:
+			mid = (lo + hi) // 2
+			e = ouientry.unpack_from(self.mm, self.ouioff + mid * ouientry.size)
+			if (e[1], e[0]) < key:
+				lo = mid + 1
+			else:
+				hi = mid
+		if lo < self.ouicount:
+			e = ouientry.unpack_from(self.mm, self.ouioff + lo * ouientry.size)
+			if (e[1], e[0]) == key:
+				return lo
+		return None
+
+	# Function returning the index entry at a position as a tuple of (OUI, flags, first record, record count), flags
+	# being a dict with the OUI's Private and Deleted flags
+	def entry(self, pos):
+		(value, size, bits, first, count) = ouientry.unpack_from(self.mm, self.ouioff + pos * ouientry.size)
+		flags = dict([(flag, bool(bits & bit)) for (flag, bit) in flagbits])
+		return (int2oui(value, size), flags, first, count)
+
+	# Generator of the index entries of every OUI in the pack, in index order
+	def entries(self):
+		for pos in xrange(self.ouicount):
+			yield self.entry(pos)
+
+	# Function returning a string from the string table by its number, or None for an absent value
+	def string(self, num):
+		return unpack_string(self.mm, self.stroff, self.strcount, num)
+
+	# Function returning the EventDate of a record by its position in the record table, without decoding the rest
+	def evdate(self, pos):
+		days = recentry.unpack_from(self.mm, self.recoff + pos * recentry.size)[5]
+		if days != nodate:
+			return days2date(days)
+		return self.record(pos).get('EventDate', '')
+
+	# Function returning the record at a position in the record table as a record dict
+	def record(self, pos):
+		return unpack_record(self.mm, self.recoff + pos * recentry.size, self.string)
+
+	# Function returning the records of an OUI as a list of record dicts in EventDate order, empty if the OUI isn't
+	# in the pack
+	def records(self, oui):
+		pos = self.find(oui)
+		if pos == None:
+			return []
+		(oui, flags, first, count) = self.entry(pos)
+		return [self.record(i) for i in xrange(first, first + count)]
+
+	# Function to unmap and close the pack file
+	def close(self):
+		if self.mm != None:
+			self.mm.close()
+			self.fh.close()
+		self.mm = None
+		return None
+
+	# Called upon instantiation of the object. 'fname' is the pack file to open, a ValueError is raised if it isn't
+	# one this version can read.
+	def __init__(self, fname):
+		log.debug("__init__() starting")
+		log.debug("fname = %s" % (fname))
+		self.fname = fname
+		self.mm = None
+
+		self.fh = open(fname, 'rb')
+		self.stat = os.fstat(self.fh.fileno())
+		try:
+			self.mm = mmap.mmap(self.fh.fileno(), 0, access = mmap.ACCESS_READ)
+			if len(self.mm) < header.size:
+				raise ValueError("%s is too short to be a pack file" % (fname))
+			(m, v, self.ouicount, self.reccount, self.strcount, self.ouioff, self.recoff, self.stroff) = header.unpack_from(self.mm, 0)
+			if m != magic:
+				raise ValueError("%s is not a pack file" % (fname))
+			if v != version:
+				raise ValueError("%s is pack format version %d, expected %d" % (fname, v, version))
+			self.blob = self.stroff + self.strcount * strentry.size
+			if self.blob > len(self.mm):
+				raise ValueError("%s is truncated" % (fname))
+		except Exception:
+			self.close()
+			self.fh.close()
+			raise
+
+		log.debug("__init__() ending")
+		return None
+
+####
+
+# End-of-line
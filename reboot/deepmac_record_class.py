@@ -4,7 +4,7 @@
 # Author : Jeff Mercer <jedi@jedimercer.com>
 # Purpose: Class definition for DeepMac records
 # Written: 2014/02/04
-# Updated: 2019/05/24
+# Updated: 2026/10/17
 ### Defines class for a DeepMac record instance, which holds the data for a DeepMac Repository
 ### record. Includes methods for verifying the data, getting and setting values, etc.
 
@@ -17,12 +17,26 @@
 # 20190521 - Updated method for detecting Private registrations to ignore case.
 # 20190522 - Disabled check of blank OrgName in .verify() function, due to inconsistencies in IEEE data format.
 # 20190524 - Trivial clean-up of whitespace, commented-out code.
+# 20261017 - Records now keep their fields in slots instead of a per-instance dict, with commonly repeated values
+#			 (record/event type, source, date, country) shared between records. The 'rec' attribute is now a dict-like
+#			 view of the fields for existing code, todict() returns a plain dict.
+#		   - Added fromraw(), making a record from a raw journal line that's only decoded once a field is used (EventDate
+#			 can be read without decoding), and fromdict(). __init__ no longer scans locals() for its parameters.
+#		   - verify() now runs a schema of checks built once per record type, with regex hex checks and cached date
+#			 parsing. Added errors() and verifyMany(), which return error codes instead of logging.
+#		   - OrgName, OrgAddress and OrgCountry values are now kept once each in a string dictionary shared by all records.
+#		   - Added getFingerprint(), a hash of the organization details with the case and PRIVATE rules of the getters.
+#		   - The shared string dictionary is started over once it reaches stringlimit strings, so it can't grow forever.
 
 # Required libraries
+import re
 import logging
+import hashlib
 import datetime
 import functools
+import collections
 import simplejson as json
+from deepmac_strdict import dmStrDict
 
 # Logging configuration
 log = logging.getLogger('dm_rec')
@@ -41,9 +55,36 @@ log.setLevel(logging.ERROR)
 ###############################################################################
 
 # So it begins
-class dmRecord:
-	# Initial dictionary for holding record
-	rec = {}
+class dmRecord(object):
+	# Record fields, in the order records are usually written. Each has a slot of its own rather than a key in a
+	# per-instance dict, as there can be hundreds of thousands of records loaded at once. Fields not set on a
+	# record leave their slot empty. Any fields not listed here are kept in a dict in the 'extra' slot.
+	fields = ('DeepMac', 'Source', 'EventType', 'EventDate', 'OUISize', 'OUI', 'OrgName', 'OrgAddress', 'OrgCountry',
+			  'MACStart', 'MACEnd', 'Confidence', 'MediaType', 'DevType', 'DevModel', 'Note', 'WikiLink')
+	__slots__ = fields + ('extra', 'raw', 'fp')
+	fieldset = frozenset(fields)
+
+	# Records read from a journal can be made straight from their raw JSON line (see fromraw()), which is kept in
+	# the 'raw' slot and only decoded into fields when one is first used. EventDate alone can be picked out of the
+	# line without decoding the rest, which is all sorting records needs.
+	evdatere = re.compile(r'"EventDate": ?"([^"\\]*)"')
+
+	# Fields with only a few distinct values across all records. Their values are shared between records, via the
+	# pool below (intern() only takes byte strings, these are unicode).
+	pooled = frozenset(('DeepMac', 'Source', 'EventType', 'EventDate'))
+	pool = {}
+
+	# Organization values, repeated across the records of an OUI and across OUIs of the same organization. Each
+	# distinct value is kept once in a string dictionary shared by all records, which also gives it a number for
+	# comparing values without touching the strings (see dmStrDict). Once it holds stringlimit strings it's replaced
+	# with an empty one, so long-running processes don't keep every value they've ever seen; records made before keep
+	# the strings they have.
+	interned = frozenset(('OrgName', 'OrgAddress', 'OrgCountry'))
+	strings = dmStrDict()
+	stringlimit = 1 << 20
+
+	# Fields the fingerprint of a record is made from (see getFingerprint()), kept in the 'fp' slot once worked out
+	fpfields = frozenset(('DeepMac', 'OrgName', 'OrgAddress', 'OrgCountry'))
 
 	# Internal constants for validating record format
 	# TODO: Put these in a constants class to be included in all DeepMac code
@@ -52,7 +93,7 @@ class dmRecord:
 	ouisizes = [24, 28, 36]
 #	privacyflags = [u'PRIVATE', u'Private']
 
-	# Mapping of class init parameters to DeepMAC record field names, used in initializing an instance
+	# Mapping of class init parameters to DeepMAC record field names. The parameters are in the same order as fields.
 	fieldmap = {
 		'rectype': 'DeepMac',
 		'source': 'Source',
@@ -77,154 +118,141 @@ class dmRecord:
 	
 	# Function to verify we have a valid DeepMac record. Returns True if the structure
 	# is an expected record type and values conform. Otherwise returns False.
-
-	# TODO: Check to make sure all string value tests work regardless if str/unicode type
+	# The problems found are logged, see errors() for the checks themselves.
 	def verify(self):
 		log.debug("verify() starting")
-		status = True
-
-		# Look for DeepMac indicator field
-		if 'DeepMac' not in self.rec:
-			log.warning("Required field key 'DeepMac' missing")
-			status = False
-		elif self.rec['DeepMac'] not in self.rectypes:
-			log.warning("Field key 'DeepMac' has illegal value")
-			status = False
-
-		# Verify common fields for all DeepMac record types
-		if 'Source' not in self.rec:
-			log.warning("Required field key 'Source' missing")
-			status = False
-		elif self.rec['Source'] == '':
-			log.warning("Field key 'EventType' has illegal value (empty)")
-			status = False
-
-		if 'EventType' not in self.rec:
-			log.warning("Required field key 'EventType' missing")
-			status = False
-		elif self.rec['EventType'] not in self.eventtypes:
-			log.warning("Field key 'EventType' has illegal value")
-			status = False
-
-		if 'EventDate' not in self.rec:
-			log.warning("Required field key 'EventDate' missing")
-			status = False
+		errors = self.errors()
+
+		for code in errors:
+			(key, problem) = code.split(':')
+			if problem == 'missing':
+				log.warning("Required field key '%s' missing" % (key))
+			else:
+				log.warning("Field key '%s' has illegal value (%s)" % (key, problem))
+
+		log.debug("verify() ending")
+		return (errors == [])
+
+	# Function to check a record against the schema for its record type. Returns a list of error codes, empty if
+	# the record is valid. Codes are 'Field:problem', the problem being one of missing, empty, invalid, length
+	# or hex (e.g. 'OUI:length').
+	def errors(self):
+		rectype = getattr(self, 'DeepMac', None)
+		if rectype == None:
+			return ['DeepMac:missing']
+		if rectype not in self.schemas:
+			return ['DeepMac:invalid']
+
+		errors = []
+		for check in self.schemas[rectype]:
+			code = check(self)
+			if code != None:
+				errors.append(code)
+		return errors
+
+	# Function to verify a list of records in one call. Returns a list with the error codes for each record (see
+	# errors()), in the same order as the records given. Nothing is logged.
+	@classmethod
+	def verifyMany(cls, records):
+		return [r.errors() for r in records]
+
+####
+
+	# Function to set a field of the record, without any validation
+	def setfield(self, key, value):
+		if self.raw != None:
+			self.load()
+		if key in self.fieldset:
+			if key in self.pooled:
+				value = self.pool.setdefault((type(value), value), value)
+			elif key in self.interned and isinstance(value, unicode):
+				strings = dmRecord.strings
+				if len(strings) >= self.stringlimit:
+					strings = dmRecord.strings = dmStrDict()
+				value = strings[strings.intern(value)]
+			if key in self.fpfields:
+				self.fp = None
+			setattr(self, key, value)
 		else:
-			try:
-				datetime.datetime.strptime(self.rec['EventDate'], '%Y-%m-%d')
-			except ValueError:
-				log.warning("Field key 'EventDate' has illegal value")
-				status = False
-
-		# Depending on record type, verify remaining possible fields
-		if self.rec['DeepMac'] == 'registry':
-			if 'OUISize' not in self.rec:
-				log.warning("Required field key 'OUISize' missing")
-				status = False
-			elif self.rec['OUISize'] not in self.ouisizes:
-				log.warning("Field key 'OUISize' has illegal value")
-				status = False
-
-			if 'OUI' not in self.rec:
-				log.warning("Required field key 'OUI' missing")
-				status = False
-			if len(self.rec['OUI']) <> (self.rec['OUISize'] / 4):
-				log.warning("Field key 'OUI' has illegal value (incorrect length for OUI size)")
-				status = False
-			elif not all(char in '0123456789ABCDEF' for char in self.rec['OUI']):
-				log.warning("Field key 'OUI' has illegal value (non-HEX digits)")
-				status = False
-
-			if 'OrgName' not in self.rec:
-				log.warning("Required field key 'OrgName' missing")
-				status = False
-# Disabled check on 2019-05-19. Too many cases of private registrations having a blank OrgName, :(
-#			if self.rec['OrgName'] == '' :
-#				log.warning("Field key 'OrgName' has illegal value")
-#				status = False
-
-			# Only public registry entries should have address info
-			if self.rec['OrgName'].lower() != u'private' and self.rec['OrgName'] != '':
-				if 'OrgAddress' not in self.rec:
-					log.warning("Required field key 'OrgAddress' missing")
-					status = False
-				if self.rec['OrgAddress'] == '':
-					log.warning("Field key 'OrgAddress' has illegal value")
-					status = False
-
-				if 'OrgCountry' not in self.rec:
-					log.warning("Required field key 'OrgCountry' missing")
-					status = False
-				# Originally we were going to consider a record bad with no country, but IEEE data now frequently has
-				# bad entries with missing addresses, countries, etc. Disabled this check as of 1/29/19.
-#				if self.rec['OrgCountry'] == '':
-#					log.warning("Field key 'OrgCountry' has illegal value")
-#					status = False
-
-			# If we reach here, it's a valid registry record
-			log.debug("verify() ending")
-			return status
-		elif self.rec['DeepMac'] == 'metadata':
-			if 'MACStart' not in self.rec:
-				log.warning("Required field key 'MACStart' missing")
-				status = False
-			elif len(self.rec['MACStart']) <> 12:
-				log.warning("Field key 'MACStart' has illegal value (incorrect length)")
-				status = False
-			elif not all(char in '0123456789ABCDEF' for char in self.rec['MACStart']):
-				log.warning("Field key 'MACStart' has illegal value (invalid HEX digits)")
-				status = False
-
-			if 'MACEnd' not in self.rec:
-				log.warning("Required field key 'MACEnd' missing")
-				status = False
-			elif len(self.rec['MACEnd']) <> 12:
-				log.warning("Field key 'MACEnd' has illegal value")
-				status = False
-			elif not all(char in '0123456789ABCDEF' for char in self.rec['MACEnd']):
-				log.warning("Field key 'MACEnd' has illegal value")
-				status = False
-
-			if 'Confidence' not in self.rec:
-				log.warning("Required field key 'Confidence' missing")
-				status = False
-			elif self.rec['Confidence'] < 1 or self.rec['Confidence'] > 5 or not isinstance(self.rec['Confidence'], int):
-				log.warning("Field key 'Confidence' has illegal value")
-				status = False
-
-			if 'MediaType' in self.rec:
-				if self.rec['MediaType'] == '':
-					log.warning("Field key 'MediaType' has illegal value")
-					status = False
-
-			if 'DevType' in self.rec:
-				if self.rec['DevType'] == '':
-					log.warning("Field key 'DevType' has illegal value")
-					status = False
-
-			if 'DevModel' in self.rec:
-				if self.rec['DevModel'] == '':
-					log.warning("Field key 'DevModel' has illegal value")
-					status = False
-
-			if 'Note' in self.rec:
-				if self.rec['Note'] == '':
-					log.warning("Field key 'Note' has illegal value")
-					status = False
-
-			if 'WikiLink' in self.rec:
-				if self.rec['WikiLink'] == '':
-					log.warning("Field key 'WikiLink' has illegal value")
-					status = False
-
-			# If we reach here, it's a valid metadata record
-			log.debug("verify() ending")
-			return status
-		else:
-			# Shouldn't reach here, so if we do something is corrupt or logic errors
-			log.error("Reached impossible termination point")
-			log.debug("verify() ending")
-			return False
+			if self.extra == None:
+				self.extra = {}
+			self.extra[key] = value
+
+	# Function to return the record as a dict of field names and values
+	def todict(self):
+		if self.raw != None:
+			self.load()
+		d = {}
+		for key in self.fields:
+			if hasattr(self, key):
+				d[key] = getattr(self, key)
+		if self.extra != None:
+			d.update(self.extra)
+		return d
+
+	# The record as a dict-like view of its fields, for code written against the older dict-based records.
+	# Changes through the view change the record. Assigning a dict replaces all of the record's fields.
+	def getrec(self):
+		return dmRecordView(self)
+
+	def setrec(self, d):
+		self.raw = None
+		for key in self.fields:
+			if hasattr(self, key):
+				delattr(self, key)
+		self.extra = None
+		self.fp = None
+		for key in d:
+			self.setfield(key, d[key])
+
+	rec = property(getrec, setrec)
+
+	# Function to decode the raw JSON line of a record made by fromraw() into its fields
+	def load(self):
+		raw = self.raw
+		self.raw = None
+		d = json.loads(raw)
+		for key in d:
+			self.setfield(key, d[key])
+
+	# Called when an attribute isn't found, which for a record made by fromraw() includes any field not decoded yet
+	def __getattr__(self, name):
+		try:
+			raw = object.__getattribute__(self, 'raw')
+		except AttributeError:
+			raise AttributeError(name)
+		if raw == None or name not in self.fieldset:
+			raise AttributeError(name)
+
+		# Peek at EventDate if that's all that's wanted, otherwise decode the whole line
+		if name == 'EventDate':
+			m = self.evdatere.search(raw)
+			if m != None:
+				value = m.group(1)
+				if isinstance(value, str):
+					value = value.decode('utf8')
+				self.EventDate = self.pool.setdefault((unicode, value), value)
+				return self.EventDate
+		self.load()
+		return object.__getattribute__(self, name)
+
+	# Functions to make a record without the keyword parameter handling of __init__. fromraw() takes a JSON record
+	# as read from a journal (str or unicode), which is decoded when first used. fromdict() takes a dict of fields.
+	@classmethod
+	def fromraw(cls, raw):
+		self = cls.__new__(cls)
+		self.extra = None
+		self.raw = raw
+		return self
+
+	@classmethod
+	def fromdict(cls, d):
+		self = cls.__new__(cls)
+		self.extra = None
+		self.raw = None
+		for key in d:
+			self.setfield(key, d[key])
+		return self
 
 ####
 
@@ -261,7 +289,7 @@ class dmRecord:
 		log.debug("getJSON() starting")
 
 		# Create JSON string based on dictionary. JSON keys are sorted and non-ASCII characters are left as-is
-		j = json.dumps(self.rec, ensure_ascii = False, sort_keys=True)
+		j = json.dumps(self.todict(), ensure_ascii = False, sort_keys=True)
 		log.debug("j = %s" % j.encode('utf8'))
 
 		log.debug("getJSON() ending")
@@ -273,8 +301,8 @@ class dmRecord:
 
 	# Returns the record type, or False if the type isn't specified
 	def getType(self):
-		if 'DeepMac' in self.rec:
-			return self.rec['DeepMac']
+		if hasattr(self, 'DeepMac'):
+			return self.DeepMac
 		else:
 			return False
 
@@ -282,8 +310,8 @@ class dmRecord:
 
 	# Returns the source for the record, or False if Source not specified
 	def getSource(self):
-		if 'Source' in self.rec:
-			return self.rec['Source']
+		if hasattr(self, 'Source'):
+			return self.Source
 		else:
 			return False
 
@@ -291,8 +319,8 @@ class dmRecord:
 
 	# Returns the Event Type for the record, or False if Event Type not specified
 	def getEvType(self):
-		if 'EventType' in self.rec:
-			return self.rec['EventType']
+		if hasattr(self, 'EventType'):
+			return self.EventType
 		else:
 			return False
 
@@ -300,8 +328,8 @@ class dmRecord:
 
 	# Returns the Event Date for the record, or False if Event Date not specified
 	def getEvDate(self):
-		if 'EventDate' in self.rec:
-			return self.rec['EventDate']
+		if hasattr(self, 'EventDate'):
+			return self.EventDate
 		else:
 			return False
 
@@ -309,9 +337,9 @@ class dmRecord:
 
 	# Returns the OUI size for the record, or False if OUI Size not specified
 	def getSize(self):
-		if 'OUISize' in self.rec:
-			if self.rec['DeepMac'] == 'registry':
-				return self.rec['OUISize']
+		if hasattr(self, 'OUISize'):
+			if self.DeepMac == 'registry':
+				return self.OUISize
 			else:
 				log.warn("Not a DeepMac registry record")
 				return False
@@ -322,11 +350,11 @@ class dmRecord:
 
 	# Returns the OUI for the record, or False if OUI not specified
 	def getOUI(self):
-		if 'OUI' in self.rec:
-			if self.rec['DeepMac'] in self.rectypes:
-				return self.rec['OUI']
+		if hasattr(self, 'OUI'):
+			if self.DeepMac in self.rectypes:
+				return self.OUI
 			else:
-				log.warn("Not a valid DeepMac record, invalid type %s" % (self.rec['DeepMac']))
+				log.warn("Not a valid DeepMac record, invalid type %s" % (self.DeepMac))
 				return False
 		else:
 			return False
@@ -335,9 +363,9 @@ class dmRecord:
 
 	# Returns the Organization Name for the record, or False if Organization Name not specified
 	def getOrgName(self):
-		if 'OrgName' in self.rec:
-			if self.rec['DeepMac'] == 'registry':
-				return self.rec['OrgName']
+		if hasattr(self, 'OrgName'):
+			if self.DeepMac == 'registry':
+				return self.OrgName
 			else:
 				log.warn("Not a DeepMac registry record")
 				return False
@@ -348,12 +376,12 @@ class dmRecord:
 
 	# Returns the Organization Address for the record, or False if Organization Address not specified
 	def getOrgAddr(self):
-		if 'OrgAddress' in self.rec:
-			if self.rec['DeepMac'] == 'registry':
-				if self.rec['OrgName'].lower() == u'private':
+		if hasattr(self, 'OrgAddress'):
+			if self.DeepMac == 'registry':
+				if self.OrgName.lower() == u'private':
 					return u'PRIVATE'
 				else:
-					return self.rec['OrgAddress']
+					return self.OrgAddress
 			else:
 				log.debug("Not a DeepMac registry record")
 				return False
@@ -364,25 +392,43 @@ class dmRecord:
 
 	# Returns the Organization Country for the record, or False if Organization Country not specified
 	def getOrgCN(self):
-		if 'OrgCountry' in self.rec:
-			if self.rec['DeepMac'] == 'registry':
-				if self.rec['OrgName'].lower() == u'private':
+		if hasattr(self, 'OrgCountry'):
+			if self.DeepMac == 'registry':
+				if self.OrgName.lower() == u'private':
 					return u'PRIVATE'
 				else:
-					return self.rec['OrgCountry']
+					return self.OrgCountry
 			else:
 				log.debug("Not a DeepMac registry record")
 				return False
 		else:
 			return False
 
+####
+
+	# Returns the fingerprint of the record's registration details: a hash of its OrgName, OrgAddress and OrgCountry as
+	# returned by the getters above (so PRIVATE registrations have an address and country of PRIVATE, and values not
+	# specified count as 'False'), ignoring case. Records with the same fingerprint are the same registration as far as
+	# importing is concerned. It's only worked out once per record, until one of those fields is set again.
+	def getFingerprint(self):
+		fp = getattr(self, 'fp', None)
+		if fp == None:
+			values = []
+			for value in (self.getOrgName(), self.getOrgAddr(), self.getOrgCN()):
+				if isinstance(value, bool):
+					value = unicode(value)
+				values.append(value.lower())
+			fp = hashlib.sha1(u'\x00'.join(values).encode('utf-8')).hexdigest()[0:16]
+			self.fp = fp
+		return fp
+
 ####
 
 	# Returns the starting MAC address for the record (metadata types only), or False if not specified
 	def getMACStart(self):
-		if 'MACStart' in self.rec:
-			if self.rec['DeepMac'] == 'metadata':
-				return self.rec['MACStart']
+		if hasattr(self, 'MACStart'):
+			if self.DeepMac == 'metadata':
+				return self.MACStart
 			else:
 				log.warn("Not a DeepMac metadata record")
 				return False
@@ -393,9 +439,9 @@ class dmRecord:
 
 	# Returns the ending MAC address for the record (metadata types only), or False if not specified
 	def getMACEnd(self):
-		if 'MACEnd' in self.rec:
-			if self.rec['DeepMac'] == 'metadata':
-				return self.rec['MACEnd']
+		if hasattr(self, 'MACEnd'):
+			if self.DeepMac == 'metadata':
+				return self.MACEnd
 			else:
 				log.warn("Not a DeepMac metadata record")
 				return False
@@ -406,9 +452,9 @@ class dmRecord:
 
 	# Returns the confidence level for the record (metadata types only), or False if not specified
 	def getConf(self):
-		if 'Confidence' in self.rec:
-			if self.rec['DeepMac'] == 'metadata':
-				return self.rec['Confidence']
+		if hasattr(self, 'Confidence'):
+			if self.DeepMac == 'metadata':
+				return self.Confidence
 			else:
 				log.warn("Not a DeepMac metadata record")
 				return False
@@ -419,10 +465,10 @@ class dmRecord:
 
 	# Returns the Media Type for the record (metadata types only), or False if not specified
 	def getMedia(self):
-		if 'MediaType' in self.rec:
-			if self.rec['DeepMac'] == 'metadata':
-				if 'MediaType' in self.rec:
-					return self.rec['MediaType']
+		if hasattr(self, 'MediaType'):
+			if self.DeepMac == 'metadata':
+				if hasattr(self, 'MediaType'):
+					return self.MediaType
 				else:
 					return 'Unknown'
 			else:
@@ -435,10 +481,10 @@ class dmRecord:
 
 	# Returns the Device Type for the record (metadata types only), or False if not specified
 	def getDevice(self):
-		if 'DevType' in self.rec:
-			if self.rec['DeepMac'] == 'metadata':
-				if 'DevType' in self.rec:
-					return self.rec['DevType']
+		if hasattr(self, 'DevType'):
+			if self.DeepMac == 'metadata':
+				if hasattr(self, 'DevType'):
+					return self.DevType
 				else:
 					return 'Unknown'
 			else:
@@ -451,10 +497,10 @@ class dmRecord:
 
 	# Returns the Device Model for the record (metadata types only), or False if not specified
 	def getModel(self):
-		if 'DevModel' in self.rec:
-			if self.rec['DeepMac'] == 'metadata':
-				if 'DevModel' in self.rec:
-					return self.rec['DevModel']
+		if hasattr(self, 'DevModel'):
+			if self.DeepMac == 'metadata':
+				if hasattr(self, 'DevModel'):
+					return self.DevModel
 				else:
 					return 'Unknown'
 			else:
@@ -467,10 +513,10 @@ class dmRecord:
 
 	# Returns the Notes for the record (metadata types only), or False if not specified
 	def getNote(self):
-		if 'Note' in self.rec:
-			if self.rec['DeepMac'] == 'metadata':
-				if 'Note' in self.rec:
-					return self.rec['Note']
+		if hasattr(self, 'Note'):
+			if self.DeepMac == 'metadata':
+				if hasattr(self, 'Note'):
+					return self.Note
 				else:
 					return 'None'
 			else:
@@ -481,10 +527,10 @@ class dmRecord:
 
 	# Returns the Wiki Link for the record (metadata types only), or False if not specified
 	def getWiki(self):
-		if 'WikiLink' in self.rec:
-			if self.rec['DeepMac'] == 'metadata':
-				if 'WikiLink' in self.rec:
-					return self.rec['WikiLink']
+		if hasattr(self, 'WikiLink'):
+			if self.DeepMac == 'metadata':
+				if hasattr(self, 'WikiLink'):
+					return self.WikiLink
 				else:
 					return 'None'
 			else:
@@ -499,7 +545,7 @@ class dmRecord:
 	# Sets the type for the record. Returns True if successful or False if invalid value given.
 	def setType(self, value):
 		if value in self.rectypes:
-			self.rec['DeepMac'] = value
+			self.setfield('DeepMac', value)
 			log.debug("Set record type to %s" % (value))
 			return True
 		else:
@@ -513,7 +559,7 @@ class dmRecord:
 		# TODO: Make Source a more explicit list set of allowed values/types
 
 		if value != '':
-			self.rec['Source'] = value
+			self.setfield('Source', value)
 			log.debug("Set Source to %s" % (value))
 			return True
 		else:
@@ -525,7 +571,7 @@ class dmRecord:
 	# Sets the Event Type for the record. Returns True if successful or False if invalid value given.
 	def setEvType(self, value):
 		if value in self.eventtypes:
-			self.rec['EventType'] = value
+			self.setfield('EventType', value)
 			log.debug("Set event type to %s" % (value))
 			return True
 		else:
@@ -536,12 +582,11 @@ class dmRecord:
 
 	# Sets the Event Date for the record. Returns True if successful or False if invalid value given.
 	def setEvDate(self, value):
-		try:
-			datetime.datetime.strptime(value, '%Y-%m-%d')
-			self.rec['EventDate'] = value
+		if isdate(value):
+			self.setfield('EventDate', value)
 			log.debug("Set event date to %s" % (value))
 			return True
-		except ValueError:
+		else:
 			log.warn("Invalid event date '%s' specified" % (value))
 			return False
 
@@ -549,9 +594,9 @@ class dmRecord:
 
 	# Sets the OUI Size for the record. Returns True if successful or False if invalid value given.
 	def setSize(self, value):
-		if self.rec['DeepMac'] == 'registry':
+		if self.DeepMac == 'registry':
 			if value in self.ouisizes:
-				self.rec['OUISize'] = value
+				self.setfield('OUISize', value)
 				return True
 			else:
 				log.debug("Invalid OUI size '%s' specified" % (value))
@@ -564,18 +609,18 @@ class dmRecord:
 
 	# Sets the OUI for the record. Returns True if successful or False if invalid value given.
 	def setOUI(self, value):
-		if self.rec['DeepMac'] == 'registry':
-			if 'OUISize' not in self.rec:
+		if self.DeepMac == 'registry':
+			if not hasattr(self, 'OUISize'):
 				log.warn("OUISize must be set before OUI can be set")
 				return False
-			elif len(value) <> (self.rec['OUISize'] / 4):
+			elif len(value) <> (self.OUISize / 4):
 				log.warn("OUI value incorrect length for OUI size")
 				return False
-			elif not all(char in '0123456789ABCDEF' for char in value):
+			elif not hexre.match(value):
 				log.warn("Invalid OUI '%s' specified" % (value))
 				return False
 			else:
-				self.rec['OUI'] = value
+				self.setfield('OUI', value)
 				return True
 		else:
 			log.warn("Not a DeepMac registry record")
@@ -585,9 +630,9 @@ class dmRecord:
 
 	# Sets the Organization Name for the record. Returns True if successful or False if invalid value given.
 	def setOrgName(self, value):
-		if self.rec['DeepMac'] == 'registry':
+		if self.DeepMac == 'registry':
 			if value != '':
-				self.rec['OrgName'] = value
+				self.setfield('OrgName', value)
 				return True
 			else:
 				log.warn("Organization name can't be empty")
@@ -600,9 +645,9 @@ class dmRecord:
 
 	# Sets the Organization Address for the record. Returns True if successful or False if invalid value given.
 	def setOrgAddr(self, value):
-		if self.rec['DeepMac'] == 'registry':
+		if self.DeepMac == 'registry':
 			if value != '':
-				self.rec['OrgAddress'] = value
+				self.setfield('OrgAddress', value)
 				return True
 			else:
 				log.warn("Organization address can't be empty")
@@ -614,9 +659,9 @@ class dmRecord:
 ####
 
 	def setOrgCN(self, value):
-		if self.rec['DeepMac'] == 'registry':
+		if self.DeepMac == 'registry':
 			if value != '':
-				self.rec['OrgCountry'] = value
+				self.setfield('OrgCountry', value)
 				return True
 			else:
 				log.warn("Organization country can't be empty")
@@ -626,15 +671,15 @@ class dmRecord:
 			return False
 
 	def setMACStart(self, value):
-		if self.rec['DeepMac'] == 'metadata':
+		if self.DeepMac == 'metadata':
 			if len(value) <> 12:
 				log.warn("Invalid MAC '%s' specified - Incorrect length" % (value))
 				return False
-			elif not all(char in '0123456789ABCDEF' for char in value):
+			elif not hexre.match(value):
 				log.warn("Invalid MAC '%s' specified - Non-HEX values present" % (value))
 				return False
 			else:
-				self.rec['MACStart'] = value
+				self.setfield('MACStart', value)
 				return True
 		else:
 			log.warn("Not a DeepMac metadata record")
@@ -643,15 +688,15 @@ class dmRecord:
 ####
 
 	def setMACEnd(self, value):
-		if self.rec['DeepMac'] == 'metadata':
+		if self.DeepMac == 'metadata':
 			if len(value) <> 12:
 				log.warn("Invalid MAC '%s' specified - Incorrect length" % (value))
 				return False
-			elif not all(char in '0123456789ABCDEF' for char in value):
+			elif not hexre.match(value):
 				log.warn("Invalid MAC '%s' specified - Non-HEX values present" % (value))
 				return False
 			else:
-				self.rec['MACEnd'] = value
+				self.setfield('MACEnd', value)
 				return True
 		else:
 			log.warn("Not a DeepMac metadata record")
@@ -660,9 +705,9 @@ class dmRecord:
 ####
 
 	def setConf(self, value):
-		if self.rec['DeepMac'] == 'metadata':
+		if self.DeepMac == 'metadata':
 			if value < 6 and value > 0 and isinstance(value, int):
-				self.rec['Confidence'] = value
+				self.setfield('Confidence', value)
 				return True
 			else:
 				log.warn("Invalid confidence value '%s' specified" % (value))
@@ -674,9 +719,9 @@ class dmRecord:
 ####
 
 	def setMedia(self, value):
-		if self.rec['DeepMac'] == 'metadata':
+		if self.DeepMac == 'metadata':
 			if value != '':
-				self.rec['MediaType'] = value
+				self.setfield('MediaType', value)
 				return True
 			else:
 				log.warn("Media type can't be empty")
@@ -688,9 +733,9 @@ class dmRecord:
 ####
 
 	def setDevice(self, value):
-		if self.rec['DeepMac'] == 'metadata':
+		if self.DeepMac == 'metadata':
 			if value != '':
-				self.rec['DevType'] = value
+				self.setfield('DevType', value)
 				return True
 			else:
 				log.warn("Device type can't be empty")
@@ -702,9 +747,9 @@ class dmRecord:
 ####
 
 	def setModel(self, value):
-		if self.rec['DeepMac'] == 'metadata':
+		if self.DeepMac == 'metadata':
 			if value != '':
-				self.rec['DevModel'] = value
+				self.setfield('DevModel', value)
 				return True
 			else:
 				log.warn("Device model can't be empty")
@@ -716,9 +761,9 @@ class dmRecord:
 ####
 
 	def setNote(self, value):
-		if self.rec['DeepMac'] == 'metadata':
+		if self.DeepMac == 'metadata':
 			if value != '':
-				self.rec['Note'] = value
+				self.setfield('Note', value)
 				return True
 			else:
 				log.warn("Note can't be empty")
@@ -730,9 +775,9 @@ class dmRecord:
 ####
 
 	def setWiki(self, value):
-		if self.rec['DeepMac'] == 'metadata':
+		if self.DeepMac == 'metadata':
 			if value != '':
-				self.rec['WikiLink'] = value
+				self.setfield('WikiLink', value)
 				return True
 			else:
 				log.warn("Wiki link can't be empty")
@@ -752,7 +797,8 @@ class dmRecord:
 				 orgadd=None, orgcn=None, mac1=None, mac2=None, conf=None, mtype=None, dtype=None,
 				 dmodel=None, note=None, wiki=None):
 		log.debug("__init__ starting")		 
-		self.rec = {}
+		self.extra = None
+		self.raw = None
 
 		# If first parameter is a string, initialize using it as a JSON string
 		if isinstance(j, (str, unicode)):
@@ -763,7 +809,7 @@ class dmRecord:
 				log.error("Could not initialize dmRecord instance, failed verify check.")
 				log.error("\t(JSON valid but DeepMac-specific requirements for record not met, see documentation)\n")
 				sys.exit(666)
-		# If it's a dict instead, directly pass to the "private" dict (stupid python)
+		# If it's a dict instead, take the fields from it
 		elif isinstance(j, dict):
 			log.debug("Dictionary passed in, using as new record")
 			log.debug("j = %s" % (str(j)))
@@ -777,22 +823,11 @@ class dmRecord:
 			
 		# Run through all keywords that could have been given. We over-write any values already initialized via
 		# JSON this way.
-		log.debug("Checking for additional passed parameters...")
-		l = locals()
-		for var in l.keys():
-			if var in self.fieldmap:
-				log.debug("\tMatched '%s' key in fieldmap as '%s'" % (var, self.fieldmap[var]))
-				if l[var] != None:
-					ltype = type(l[var])
-					log.debug("\t\tType of value is %s" % (str(ltype)))
-
-					# Assign the value to our internal record dictionary
-					self.rec[self.fieldmap[var]] = l[var]
-					log.debug("\t\tSet to value %s" % (l[var]))
-				else:
-					log.debug("\t\tNot initialized in call")
-			else:
-				log.debug("\tLocal variable '%s' not matched in fieldmap" % (str(var)))
+		values = (rectype, source, etype, edate, osize, oui, orgname, orgadd, orgcn, mac1, mac2, conf, mtype, dtype,
+				  dmodel, note, wiki)
+		for i in range(len(values)):
+			if values[i] != None:
+				self.setfield(self.fields[i], values[i])
 
 		# TODO: Maybe issue warning that the record isn't verified yet? Do a verify but don't except if it's invalid?
 
@@ -818,4 +853,178 @@ class dmRecord:
 
 ####
 
+# Record validation. Each record type has a schema: a list of check functions built once here, each taking a record
+# and returning an error code or None. Hex fields are checked with a regex, and EventDate values already parsed are
+# remembered so each distinct date is only parsed once.
+
+hexre = re.compile(r'[0-9A-F]*\Z')
+validdates = {}
+missing = object()
+
+# Function to check a date is in YYYY-MM-DD format, with results cached by value
+def isdate(value):
+	if value not in validdates:
+		# Don't let the cache grow without bound on bad input
+		if len(validdates) > 100000:
+			validdates.clear()
+		try:
+			datetime.datetime.strptime(value, '%Y-%m-%d')
+			validdates[value] = True
+		except (ValueError, TypeError):
+			validdates[value] = False
+	return validdates[value]
+
+
+# Functions to build check functions for a field
+def chkrequired(key, test = None, problem = 'invalid'):
+	def check(rec):
+		value = getattr(rec, key, missing)
+		if value is missing:
+			return key + ':missing'
+		if test != None and not test(value):
+			return key + ':' + problem
+		return None
+	return check
+
+
+def chkoptional(key, test, problem = 'invalid'):
+	def check(rec):
+		value = getattr(rec, key, missing)
+		if value is not missing and not test(value):
+			return key + ':' + problem
+		return None
+	return check
+
+
+def chkmac(key):
+	def check(rec):
+		value = getattr(rec, key, missing)
+		if value is missing:
+			return key + ':missing'
+		if len(value) != 12:
+			return key + ':length'
+		if not hexre.match(value):
+			return key + ':hex'
+		return None
+	return check
+
+
+# The OUI has to be hex digits, and as long as its OUISize calls for
+def chkoui(rec):
+	value = getattr(rec, 'OUI', missing)
+	if value is missing:
+		return 'OUI:missing'
+	size = getattr(rec, 'OUISize', missing)
+	if size is not missing and len(value) != (size / 4):
+		return 'OUI:length'
+	if not hexre.match(value):
+		return 'OUI:hex'
+	return None
+
+
+# Only public registry entries need address info
+def ispublic(rec):
+	name = getattr(rec, 'OrgName', missing)
+	return (name is not missing and name.lower() != u'private' and name != '')
+
+
+def chkorgaddr(rec):
+	if not ispublic(rec):
+		return None
+	addr = getattr(rec, 'OrgAddress', missing)
+	if addr is missing:
+		return 'OrgAddress:missing'
+	if addr == '':
+		return 'OrgAddress:empty'
+	return None
+
+
+def chkorgcountry(rec):
+	if ispublic(rec) and getattr(rec, 'OrgCountry', missing) is missing:
+		return 'OrgCountry:missing'
+	return None
+
+
+def notempty(value):
+	return (value != '')
+
+# Checks common to all record types
+# Originally we were going to consider a record bad with no country or a blank OrgName, but IEEE data frequently
+# has private registrations with a blank OrgName, and bad entries with missing addresses, countries, etc. Those
+# checks were disabled in 2019.
+commonchecks = [
+	chkrequired('Source', notempty, 'empty'),
+	chkrequired('EventType', lambda v: v in dmRecord.eventtypes),
+	chkrequired('EventDate', isdate)
+]
+
+dmRecord.schemas = {
+	'registry': commonchecks + [
+		chkrequired('OUISize', lambda v: v in dmRecord.ouisizes),
+		chkoui,
+		chkrequired('OrgName'),
+		chkorgaddr,
+		chkorgcountry
+	],
+	'metadata': commonchecks + [
+		chkmac('MACStart'),
+		chkmac('MACEnd'),
+		chkrequired('Confidence', lambda v: isinstance(v, int) and v >= 1 and v <= 5),
+		chkoptional('MediaType', notempty, 'empty'),
+		chkoptional('DevType', notempty, 'empty'),
+		chkoptional('DevModel', notempty, 'empty'),
+		chkoptional('Note', notempty, 'empty'),
+		chkoptional('WikiLink', notempty, 'empty')
+	]
+}
+
+####
+
+# Dict-like view of a dmRecord's fields, returned by its 'rec' attribute
+class dmRecordView(collections.MutableMapping):
+	__slots__ = ('record',)
+
+	def __init__(self, record):
+		self.record = record
+
+	def __getitem__(self, key):
+		if key in dmRecord.fieldset:
+			try:
+				return getattr(self.record, key)
+			except AttributeError:
+				raise KeyError(key)
+		if self.record.raw != None:
+			self.record.load()
+		if self.record.extra == None:
+			raise KeyError(key)
+		return self.record.extra[key]
+
+	def __setitem__(self, key, value):
+		self.record.setfield(key, value)
+
+	def __delitem__(self, key):
+		if self.record.raw != None:
+			self.record.load()
+		if key in dmRecord.fieldset:
+			try:
+				delattr(self.record, key)
+			except AttributeError:
+				raise KeyError(key)
+			self.record.fp = None
+		elif self.record.extra == None:
+			raise KeyError(key)
+		else:
+			del self.record.extra[key]
+
+	def __iter__(self):
+		return iter(self.record.todict())
+
+	def __len__(self):
+		return len(self.record.todict())
+
+	def __repr__(self):
+		return repr(self.record.todict())
+
+####
+
 # End-Of-Line
\ No newline at end of file
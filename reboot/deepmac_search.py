@@ -0,0 +1,166 @@
+#!/usr/bin/python
+
+# File   : dmSearch.py
+# Author : Jeff Mercer <jedi@jedimercer.com>
+# Purpose: Search index of DeepMac journal records
+# Written: 2026/10/17
+# Updated: 2026/10/17
+
+# 20261017 - Initial version. Inverted index of the organization fields of journal records, for dmManager.search().
+
+# Every journal record is a document in the index. Its OrgName, OrgAddress and OrgCountry are split into words
+# (lowercased runs of letters and digits), and for each field each word has the set of documents it appears in, so a
+# query is answered by intersecting a few of those sets instead of reading journals. Documents are also indexed by
+# OUI and EventDate, for the OUI prefix and date filters. Records are only ever added, as they are to journals.
+
+import re
+import bisect
+import logging
+from deepmac_record_class import dmRecord
+
+# Logging configuration
+log = logging.getLogger('dm_search')
+handler = logging.StreamHandler()
+logformat = logging.Formatter("%(asctime)s - %(name)s %(levelname)s: %(message)s")
+handler.setFormatter(logformat)
+log.addHandler(handler)
+log.setLevel(logging.ERROR)
+
+# Indexed fields and the record getters for them
+fields = (('OrgName', dmRecord.getOrgName), ('OrgAddress', dmRecord.getOrgAddr), ('OrgCountry', dmRecord.getOrgCN))
+
+# Words of field values, and of query text (which can end in '*')
+wordre = re.compile(r'\w+', re.UNICODE)
+queryre = re.compile(r'\w+\*?', re.UNICODE)
+
+####
+
+# Function to split a field value into the words it's indexed by. Returns a set of lowercase words.
+def words(value):
+	if not isinstance(value, basestring):
+		return set()
+	return set(wordre.findall(unicode(value).lower()))
+
+####
+
+# Class for the search index. Instances are made empty, filled with add() and queried with find().
+class dmSearchIndex(object):
+	# Function to add a record (a dmRecord) to the index
+	def add(self, rec):
+		doc = len(self.docs)
+		oui = rec.getOUI()
+		date = rec.getEvDate()
+		self.docs.append((oui, date, rec.getJSON()))
+
+		for (field, getter) in fields:
+			for word in words(getter(rec)):
+				key = (field, word)
+				if key not in self.postings:
+					self.postings[key] = set()
+					self.vocab = None
+				self.postings[key].add(doc)
+
+		if oui not in self.byoui:
+			self.byoui[oui] = set()
+			self.ouis = None
+		self.byoui[oui].add(doc)
+		if date not in self.bydate:
+			self.bydate[date] = set()
+			self.dates = None
+		self.bydate[date].add(doc)
+		return doc
+
+	# Function returning the documents containing a word in a field, or every word starting with it if it ends with '*'
+	def matches(self, field, word):
+		if not word.endswith('*'):
+			return self.postings.get((field, word), set())
+
+		# Prefix match over the sorted vocabulary of (field, word) keys
+		if self.vocab == None:
+			self.vocab = sorted(self.postings)
+		prefix = word[:-1]
+		docs = set()
+		i = bisect.bisect_left(self.vocab, (field, prefix))
+		while i < len(self.vocab) and self.vocab[i][0] == field and self.vocab[i][1].startswith(prefix):
+			docs |= self.postings[self.vocab[i]]
+			i += 1
+		return docs
+
+	# Function returning the documents of OUIs starting with 'prefix' (a normalized OUI or the start of one)
+	def ouimatches(self, prefix):
+		if self.ouis == None:
+			self.ouis = sorted(self.byoui)
+		docs = set()
+		i = bisect.bisect_left(self.ouis, prefix)
+		while i < len(self.ouis) and self.ouis[i].startswith(prefix):
+			docs |= self.byoui[self.ouis[i]]
+			i += 1
+		return docs
+
+	# Function returning the documents with an EventDate in a range, 'first' and 'last' inclusive
+	def datematches(self, first, last):
+		if self.dates == None:
+			self.dates = sorted(self.bydate)
+		docs = set()
+		i = bisect.bisect_left(self.dates, first)
+		while i < len(self.dates) and self.dates[i] <= last:
+			docs |= self.bydate[self.dates[i]]
+			i += 1
+		return docs
+
+	# Function to find the records matching a query. 'terms' is a dict of field name to the text to look for in that
+	# field; every word of the text must be in the field (a word ending in '*' matches any word starting with it).
+	# 'oui' is an OUI prefix and 'dates' a (first, last) tuple of EventDates, or None for either to not filter on it.
+	# Returns a list of dmRecord instances sorted by OUI and EventDate.
+	def find(self, terms, oui = None, dates = None):
+		log.debug("find() starting")
+
+		# Gather the document sets each condition allows, then intersect them starting with the smallest
+		sets = []
+		for (field, text) in terms.iteritems():
+			qwords = queryre.findall(unicode(text).lower())
+			if not qwords:
+				# Text with nothing to look for matches nothing, rather than leaving the field unfiltered
+				sets.append(set())
+			for word in qwords:
+				sets.append(self.matches(field, word))
+		if oui != None:
+			sets.append(self.ouimatches(oui))
+		if dates != None:
+			sets.append(self.datematches(dates[0], dates[1]))
+
+		if not sets:
+			docs = set(xrange(len(self.docs)))
+		else:
+			sets.sort(key = len)
+			docs = set(sets[0])
+			for s in sets[1:]:
+				if not docs:
+					break
+				docs &= s
+
+		results = [dmRecord.fromraw(self.docs[doc][2]) for doc in sorted(docs, key = lambda d: (self.docs[d][0], self.docs[d][1], d))]
+
+		log.debug("%d results" % (len(results)))
+		log.debug("find() ending")
+		return results
+
+	def __len__(self):
+		return len(self.docs)
+
+	# Called upon instantiation of the object
+	def __init__(self):
+		# Documents, as (OUI, EventDate, record JSON) tuples numbered by their position
+		self.docs = []
+
+		# Document sets by (field, word), OUI and EventDate, and the sorted keys of each made as they're needed
+		self.postings = {}
+		self.byoui = {}
+		self.bydate = {}
+		self.vocab = None
+		self.ouis = None
+		self.dates = None
+
+####
+
+# End-of-line
@@ -0,0 +1,95 @@
+#!/usr/bin/python
+
+# File   : dmStrDict.py
+# Author : Jeff Mercer <jedi@jedimercer.com>
+# Purpose: String dictionary for DeepMac record values
+# Written: 2026/10/17
+# Updated: 2026/10/17
+
+# 20261017 - Initial version.
+#		   - intern() and fold() are now safe to call from several threads at once.
+
+# Registry records repeat the same organization names, addresses and countries over and over: every change record of
+# an OUI carries all of them again, and large vendors have hundreds of OUIs with the same address. A dmStrDict keeps
+# each distinct string once and gives it a number, so records can share one copy of each string and be compared and
+# stored by number. Numbers are handed out in order from 0 and never change, so a dictionary can be written out and
+# read back with all of its numbers intact. Adding strings is locked, so threads can share a dictionary; looking them
+# up isn't, as entries are only ever added once complete.
+
+import logging
+import threading
+import simplejson as json
+
+# Logging configuration
+log = logging.getLogger('dm_strdict')
+handler = logging.StreamHandler()
+logformat = logging.Formatter("%(asctime)s - %(name)s %(levelname)s: %(message)s")
+handler.setFormatter(logformat)
+log.addHandler(handler)
+log.setLevel(logging.ERROR)
+
+####
+
+class dmStrDict(object):
+	# Function to add a string to the dictionary if it isn't there yet. Returns the string's number.
+	def intern(self, value):
+		num = self.nums.get(value)
+		if num == None:
+			with self.lock:
+				num = self.nums.get(value)
+				if num == None:
+					num = len(self.strings)
+					self.strings.append(value)
+					self.folds.append(None)
+					self.nums[value] = num
+		return num
+
+	# Function to look up the number of a string. Returns None if it isn't in the dictionary.
+	def find(self, value):
+		return self.nums.get(value)
+
+	# Function returning the number of the lowercase form of a string, given the string's number. Two strings that
+	# only differ in case have the same folded number. The lowercase form is worked out once per string.
+	def fold(self, num):
+		folded = self.folds[num]
+		if folded == None:
+			with self.lock:
+				folded = self.intern(self.strings[num].lower())
+				self.folds[num] = folded
+				self.folds[folded] = folded
+		return folded
+
+	# Function to write the strings of the dictionary to an open file, one JSON string per line in number order.
+	# Returns the number of strings written.
+	def write(self, fh):
+		for value in self.strings:
+			fh.write(json.dumps(value, ensure_ascii = False) + u'\n')
+		return len(self.strings)
+
+	# Function to read 'count' strings written by write() from an open file into a new dictionary
+	@classmethod
+	def read(cls, fh, count):
+		self = cls()
+		for i in xrange(count):
+			self.intern(json.loads(fh.readline()))
+		return self
+
+	def __getitem__(self, num):
+		return self.strings[num]
+
+	def __contains__(self, value):
+		return value in self.nums
+
+	def __len__(self):
+		return len(self.strings)
+
+	# Called upon instantiation of the object
+	def __init__(self):
+		self.strings = []
+		self.nums = {}
+		self.folds = []
+		self.lock = threading.RLock()
+
+####
+
+# End-of-line
@@ -0,0 +1,493 @@
+#!/usr/bin/python
+
+# File   : dmWeb.py
+# Author : Jeff Mercer <jedi@jedimercer.com>
+# Purpose: HTTP service for DeepMac web repositories
+# Written: 2026/10/17
+# Updated: 2026/10/17
+
+# 20261017 - Initial version. Serves a repository read-only over HTTP from an index held in memory, for dmManager
+#			 web connections.
+#		   - Added searching, from a search index of the repository's records (see deepmac_search.py).
+#		   - Added check_service(), which tests the service and the web connection type against a repository, all on
+#			 localhost (see the webcheck operation of deepmac_maint.py).
+
+# Usage: deepmac_web.py [-t type] [-c user:pass] [-b address] [-p port] -a user:pass <repository address>
+# The repository is loaded into memory once at startup, then served to any number of clients from a single
+# asyncore event loop. Requests use HTTP/1.1 with keep-alive and Basic authentication ('-a' sets the login clients
+# must give), and every response is a JSON object:
+#	GET	 /ping					 - {"OUIs": count}
+#	GET	 /oui/<OUI>				 - {"Records": [records]}, all records of an OUI in EventDate order
+#	GET	 /oui/<OUI>/latest		 - {"Record": record}, the latest record of an OUI (or null). Takes ?date=YYYY-MM-DD
+#								   to get the latest as of that date.
+#	GET	 /oui/<OUI>/flags		 - {"Private": flag, "Deleted": flag}, null for OUIs not in the repository
+#	POST /ouis					 - Takes {"OUIs": [OUIs]}, returns {"Records": {OUI: [records]}}
+#	GET	 /enumerate				 - {"OUIs": [OUIs]}. Takes ?sz=, ?prv= and ?del= as dmManager.enumerate() does.
+#	GET	 /latest				 - {"Records": {OUI: record}}, the latest record of every OUI. Takes ?sz=.
+#	GET	 /mac/<MAC>				 - {"OUI": OUI, "Record": record}, the most specific active registration covering a
+#								   MAC address (see deepmac_lookup.py), both null if there isn't one
+#	POST /macs					 - Takes {"MACs": [MACs]}, returns {"OUIs": [OUI or null for each MAC], "Records":
+#								   {OUI: record}}
+#	GET	 /search				 - {"Records": [records]}, the records matching a search (see dmManager.search()).
+#								   Takes ?OrgName=, ?OrgAddress=, ?OrgCountry=, ?oui= and ?first= with ?last=.
+# Errors are given as {"Error": message} with a 4xx status. The service doesn't change the repository, and doesn't
+# see changes made to it after it starts.
+# It listens on localhost unless told otherwise, as it has no encryption of its own.
+
+import os
+import sys
+import socket
+import base64
+import random
+import threading
+import asyncore
+import asynchat
+import urllib
+import urlparse
+import logging
+import argparse
+from BaseHTTPServer import BaseHTTPRequestHandler
+import simplejson as json
+from deepmac_lookup import dmLookup
+from deepmac_search import dmSearchIndex, fields
+
+# Logging configuration
+log = logging.getLogger('dm_web')
+handler = logging.StreamHandler()
+logformat = logging.Formatter("%(asctime)s - %(name)s %(levelname)s: %(message)s")
+handler.setFormatter(logformat)
+log.addHandler(handler)
+log.setLevel(logging.ERROR)
+
+# Biggest request headers and body accepted, in bytes
+maxheader = 65536
+maxbody = 64 * 1024 * 1024
+
+####
+
+# Exception raised while handling a request to send an error response
+class dmWebError(Exception):
+	def __init__(self, status, message):
+		Exception.__init__(self, message)
+		self.status = status
+
+####
+
+# Class holding a repository in memory for the service: every OUI's records (as their JSON, ready to send), flags and
+# a lookup table of its registrations. Answers requests with the JSON of their responses.
+class dmWebIndex(object):
+	# Function to check an OUI from a request, returning its normalized form
+	def chkoui(self, oui):
+		if not self.dmmgr.chkoui(oui):
+			raise dmWebError(400, "Invalid OUI %s" % (oui))
+		return oui.replace(':', '').replace('-', '').upper()
+
+	# Functions to build JSON from the records held as JSON: a list of an OUI's records, and an object of record lists
+	# or single records keyed by OUI
+	def recordlist(self, oui):
+		return u'[' + u', '.join(self.records.get(oui, [])) + u']'
+
+	def recordmap(self, items):
+		return u'{' + u', '.join([json.dumps(oui) + u': ' + value for (oui, value) in items]) + u'}'
+
+	# Function to answer a request, returning the JSON of the response. 'parts' is the request path split on '/',
+	# 'query' a dict of its query parameters and 'body' the decoded request body (POST only).
+	def answer(self, method, parts, query, body):
+		if method == 'GET' and parts == ['ping']:
+			return json.dumps({'OUIs': len(self.flags)})
+
+		if method == 'GET' and len(parts) >= 2 and parts[0] == 'oui':
+			oui = self.chkoui(parts[1])
+			if len(parts) == 2:
+				return u'{"Records": ' + self.recordlist(oui) + u'}'
+			if parts[2:] == ['latest']:
+				date = query.get('date')
+				recs = self.records.get(oui, [])
+				for i in reversed(xrange(len(recs))):
+					if date == None or self.dates[oui][i] <= date:
+						return u'{"Record": ' + recs[i] + u'}'
+				return u'{"Record": null}'
+			if parts[2:] == ['flags']:
+				(prv, dele) = self.flags.get(oui, (None, None))
+				return json.dumps({'Private': prv, 'Deleted': dele})
+
+		if method == 'POST' and parts == ['ouis']:
+			ouis = sorted(set([self.chkoui(oui) for oui in self.listarg(body, 'OUIs')]))
+			return u'{"Records": ' + self.recordmap([(oui, self.recordlist(oui)) for oui in ouis]) + u'}'
+
+		if method == 'GET' and parts == ['enumerate']:
+			sz = self.intarg(query, 'sz', 0)
+			prvflag = bool(self.intarg(query, 'prv', 1))
+			delflag = bool(self.intarg(query, 'del', 0))
+			results = []
+			for (oui, (prv, dele)) in self.flags.iteritems():
+				if (sz == 0 or len(oui) * 4 == sz) and (prvflag or not prv) and (delflag or not dele):
+					results.append(oui)
+			return json.dumps({'OUIs': sorted(results)})
+
+		if method == 'GET' and parts == ['latest']:
+			sz = self.intarg(query, 'sz', 0)
+			items = [(oui, recs[-1]) for (oui, recs) in sorted(self.records.iteritems())
+					 if recs and (sz == 0 or len(oui) * 4 == sz)]
+			return u'{"Records": ' + self.recordmap(items) + u'}'
+
+		if method == 'GET' and len(parts) == 2 and parts[0] == 'mac':
+			oui = self.lookup.owner(parts[1])
+			if oui == None:
+				return json.dumps({'OUI': None, 'Record': None})
+			return u'{"OUI": ' + json.dumps(oui) + u', "Record": ' + self.registration[oui] + u'}'
+
+		if method == 'POST' and parts == ['macs']:
+			ouis = [self.lookup.owner(mac) for mac in self.listarg(body, 'MACs')]
+			found = sorted(set([oui for oui in ouis if oui != None]))
+			return (u'{"OUIs": ' + json.dumps(ouis) + u', "Records": ' +
+					self.recordmap([(oui, self.registration[oui]) for oui in found]) + u'}')
+
+		if method == 'GET' and parts == ['search']:
+			terms = dict([(field, query[field].decode('utf-8')) for (field, getter) in fields if query.get(field)])
+			dates = None
+			if 'first' in query or 'last' in query:
+				dates = (query.get('first', ''), query.get('last', '~'))
+			recs = self.search.find(terms, query.get('oui'), dates)
+			return u'{"Records": [' + u', '.join([rec.getJSON() for rec in recs]) + u']}'
+
+		raise dmWebError(404, "No such request %s /%s" % (method, '/'.join(parts)))
+
+	# Functions to get request arguments, raising a dmWebError if they aren't the right type
+	def intarg(self, query, key, default):
+		try:
+			return int(query.get(key, default))
+		except ValueError:
+			raise dmWebError(400, "Parameter %s must be a number" % (key))
+
+	def listarg(self, body, key):
+		if not isinstance(body, dict) or not isinstance(body.get(key), list):
+			raise dmWebError(400, "Request body must be an object with a %s list" % (key))
+		return body[key]
+
+	# Called upon instantiation of the object. 'dmmgr' is a connected dmManager instance to load the index from.
+	def __init__(self, dmmgr):
+		log.debug("__init__() starting")
+		self.dmmgr = dmmgr
+
+		# Flags of every OUI, as (Private, Deleted) tuples
+		lists = [dmmgr.enumerate(0, True, True), dmmgr.enumerate(0, False, True), dmmgr.enumerate(0, True, False)]
+		if None in lists:
+			raise ValueError("Couldn't enumerate the OUIs of the repository")
+		ouis = lists[0]
+		private = set(ouis) - set(lists[1])
+		deleted = set(ouis) - set(lists[2])
+		self.flags = dict([(oui, (oui in private, oui in deleted)) for oui in ouis])
+
+		# Records of every OUI in EventDate order as their JSON, and a matching list of their EventDates
+		self.records = {}
+		self.dates = {}
+		found = dmmgr.getMany(ouis)
+		if found == None:
+			raise ValueError("Couldn't load the records of the repository")
+		self.search = dmSearchIndex()
+		for (oui, recs) in sorted(found.iteritems()):
+			self.records[oui] = [rec.getJSON() for rec in recs]
+			self.dates[oui] = [rec.getEvDate() for rec in recs]
+			for rec in recs:
+				self.search.add(rec)
+
+		# Lookup table for MAC addresses, and the JSON of each registration's record
+		self.lookup = dmLookup(dmmgr)
+		self.registration = dict([(oui, rec.getJSON()) for (oui, rec) in zip(self.lookup.ouis, self.lookup.records)])
+
+		log.info("Index has %d OUIs, %d records" % (len(self.flags), sum([len(r) for r in self.records.itervalues()])))
+		log.debug("__init__() ending")
+		return None
+
+####
+
+# Class handling one client connection to the service. Requests are read and answered one after another for as long
+# as the client keeps the connection open.
+class dmWebChannel(asynchat.async_chat):
+	# Function called by asynchat with data read from the client
+	def collect_incoming_data(self, data):
+		self.data.append(data)
+		self.size += len(data)
+		if self.body == None and self.size > maxheader:
+			log.warn("Request headers from %s too big, closing connection" % (str(self.peer)))
+			self.close()
+
+	# Function called by asynchat once the request headers, and then the request body, have been read
+	def found_terminator(self):
+		data = ''.join(self.data)
+		self.data = []
+		self.size = 0
+
+		if self.body == None:
+			# Request line and headers
+			lines = data.split('\r\n')
+			try:
+				(self.method, self.path, self.version) = lines[0].split(' ', 2)
+			except ValueError:
+				self.respond(400, json.dumps({'Error': "Malformed request line"}), True)
+				return
+			self.headers = {}
+			for line in lines[1:]:
+				if ':' in line:
+					(key, value) = line.split(':', 1)
+					self.headers[key.strip().lower()] = value.strip()
+
+			# Read the body next if there is one, otherwise answer straight away
+			try:
+				length = int(self.headers.get('content-length', 0))
+			except ValueError:
+				length = -1
+			if length < 0 or length > maxbody:
+				self.respond(400, json.dumps({'Error': "Bad Content-Length"}), True)
+				return
+			if length > 0:
+				self.body = ''
+				self.set_terminator(length)
+				return
+			self.body = ''
+
+		else:
+			self.body = data
+
+		self.handle_request()
+		self.body = None
+		self.set_terminator('\r\n\r\n')
+
+	# Function to answer a complete request
+	def handle_request(self):
+		log.debug("%s %s" % (self.method, self.path))
+
+		# HTTP/1.1 connections are kept open unless the client says otherwise, HTTP/1.0 ones only if it asks
+		conn = self.headers.get('connection', '').lower()
+		if self.version == 'HTTP/1.1':
+			close = (conn == 'close')
+		else:
+			close = (conn != 'keep-alive')
+
+		try:
+			# Check the client's login
+			if self.headers.get('authorization', '') != self.server.auth:
+				raise dmWebError(401, "Login required")
+
+			url = urlparse.urlparse(self.path)
+			parts = [urllib.unquote(p) for p in url.path.split('/') if p]
+			query = dict(urlparse.parse_qsl(url.query))
+			body = None
+			if self.method == 'POST':
+				try:
+					body = json.loads(self.body)
+				except ValueError:
+					raise dmWebError(400, "Request body isn't JSON")
+			result = self.server.index.answer(self.method, parts, query, body)
+			status = 200
+		except dmWebError as e:
+			result = json.dumps({'Error': e.args[0]})
+			status = e.status
+		except Exception as e:
+			log.error("Error while answering %s %s" % (self.method, self.path))
+			log.error("Exception triggered: %s" % (e))
+			result = json.dumps({'Error': "Internal error"})
+			status = 500
+
+		self.respond(status, result, close)
+
+	# Function to send a response to the client, closing the connection after it if 'close' is True
+	def respond(self, status, result, close):
+		if isinstance(result, unicode):
+			result = result.encode('utf-8')
+		head = ["HTTP/1.1 %d %s" % (status, BaseHTTPRequestHandler.responses[status][0]),
+				"Content-Type: application/json; charset=utf-8",
+				"Content-Length: %d" % (len(result))]
+		if status == 401:
+			head.append('WWW-Authenticate: Basic realm="DeepMac"')
+		if close:
+			head.append("Connection: close")
+		self.push('\r\n'.join(head) + '\r\n\r\n' + result)
+		if close:
+			self.close_when_done()
+
+	def handle_error(self):
+		log.error("Error on connection from %s, closing it" % (str(self.peer)))
+		self.close()
+
+	# Called upon instantiation of the object, for a new client connection
+	def __init__(self, sock, peer, server):
+		asynchat.async_chat.__init__(self, sock, map = server.sockets)
+		self.server = server
+		self.peer = peer
+		self.data = []
+		self.size = 0
+		self.body = None
+		self.set_terminator('\r\n\r\n')
+
+####
+
+# Class for the service itself: a listening socket that starts a dmWebChannel for each client. Call serve() to run it.
+class dmWebServer(asyncore.dispatcher):
+	def handle_accept(self):
+		pair = self.accept()
+		if pair != None:
+			log.debug("Connection from %s" % (str(pair[1])))
+			dmWebChannel(pair[0], pair[1], self)
+
+	# Function to run the service until close() is called (from another thread, or a signal handler)
+	def serve(self):
+		log.info("Serving on %s:%d" % self.address)
+		while self.sockets:
+			asyncore.loop(timeout = 1, use_poll = True, map = self.sockets, count = 1)
+		return None
+
+	# Function to stop the service and close all client connections
+	def close(self):
+		for channel in self.sockets.values():
+			if channel is not self:
+				channel.close()
+		asyncore.dispatcher.close(self)
+		return None
+
+	# Called upon instantiation of the object. 'index' is the dmWebIndex to serve, 'creds' the login clients must give
+	# (a dict with 'u' and 'p' keys, as for dmConnector). 'port' 0 picks a free port, see the address attribute.
+	def __init__(self, index, creds, host = '127.0.0.1', port = 8080):
+		log.debug("__init__() starting")
+		self.sockets = {}
+		asyncore.dispatcher.__init__(self, map = self.sockets)
+		self.index = index
+		self.auth = 'Basic ' + base64.b64encode('%s:%s' % (creds['u'], creds['p']))
+
+		self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.set_reuse_addr()
+		self.bind((host, port))
+		self.listen(128)
+		self.address = self.socket.getsockname()
+
+		log.debug("__init__() ending")
+		return None
+
+####
+
+# Function to check the service and the web connection type against a repository, entirely on localhost. The
+# repository of 'dmmgr' (a connected dmManager) is served on a free local port with a throwaway login, and every read
+# operation of a web connection to it is compared with what 'dmmgr' gives directly: enumerate(), get(), getLatest(),
+# getAsOf(), the flags, getMany(), latest(), lookup() and search(). Writes through the web connection must be refused.
+# 'macs' is the number of random MAC addresses to look up, on top of one in each registration. Returns a list of the
+# differences found, empty if there are none.
+def check_service(dmmgr, macs = 1000):
+	from deepmac_manager import dmManager
+	log.debug("check_service() starting")
+	problems = []
+
+	def same(a, b):
+		if isinstance(a, (list, tuple)):
+			return isinstance(b, (list, tuple)) and len(a) == len(b) and all([same(x, y) for (x, y) in zip(a, b)])
+		if isinstance(a, dict):
+			return isinstance(b, dict) and sorted(a) == sorted(b) and all([same(a[k], b[k]) for k in a])
+		if hasattr(a, 'todict'):
+			return hasattr(b, 'todict') and a.todict() == b.todict()
+		return a == b
+
+	def ordered(ouis):
+		if ouis == None:
+			return None
+		return sorted(ouis)
+
+	def compare(what, a, b):
+		if not same(a, b):
+			problems.append("%s differs" % (what))
+
+	creds = {'u': 'check', 'p': base64.b16encode(os.urandom(16))}
+	server = dmWebServer(dmWebIndex(dmmgr), creds, '127.0.0.1', 0)
+	thread = threading.Thread(target = server.serve)
+	thread.daemon = True
+	thread.start()
+	web = None
+	try:
+		web = dmManager('web', 'http://127.0.0.1:%d/' % (server.address[1]), creds)
+
+		for sz in (0, 24, 28, 36):
+			for prv in (True, False):
+				for dele in (True, False):
+					compare("enumerate(%d, %s, %s)" % (sz, prv, dele), ordered(dmmgr.enumerate(sz, prv, dele)),
+							ordered(web.enumerate(sz, prv, dele)))
+			compare("latest(%d)" % (sz), dmmgr.latest(sz), web.latest(sz))
+
+		ouis = ordered(dmmgr.enumerate(0, True, True)) or []
+		for oui in ouis:
+			recs = dmmgr.get(oui)
+			compare("get(%s)" % (oui), recs, web.get(oui))
+			compare("getLatest(%s)" % (oui), dmmgr.getLatest(oui), web.getLatest(oui))
+			for date in sorted(set(['0000-00-00'] + [rec.getEvDate() for rec in recs])):
+				compare("getAsOf(%s, %s)" % (oui, date), dmmgr.getAsOf(oui, date), web.getAsOf(oui, date))
+			compare("isPrivate(%s)" % (oui), dmmgr.isPrivate(oui), web.isPrivate(oui))
+			compare("isDeleted(%s)" % (oui), dmmgr.isDeleted(oui), web.isDeleted(oui))
+		compare("getMany()", dmmgr.getMany(ouis), web.getMany(ouis))
+
+		# Random addresses, plus one inside each registration
+		addrs = ['%012X' % (random.getrandbits(48)) for i in xrange(macs)]
+		addrs += [(oui + '0' * 12)[0:12] for oui in ouis]
+		compare("lookup()", dmmgr.lookup(addrs), web.lookup(addrs))
+
+		# Searches for the words of registrations' names, each alone and within the OUI's first byte
+		for oui in ouis[::max(1, len(ouis) // 100)]:
+			rec = dmmgr.getLatest(oui)
+			if rec is None or not isinstance(rec.getOrgName(), basestring):
+				continue
+			name = rec.getOrgName()
+			compare("search(%s)" % (repr(name)), dmmgr.search(None, None, name, None), web.search(None, None, name, None))
+			compare("search(%s, %s)" % (oui[0:2], repr(name)), dmmgr.search(oui[0:2], None, name, None),
+					web.search(oui[0:2], None, name, None))
+
+		if ouis:
+			rec = dmmgr.getLatest(ouis[0])
+			if web.append(rec) or web.setPrivate(ouis[0], True) or web.setDeleted(ouis[0], True):
+				problems.append("Writes through the web connection weren't refused")
+	finally:
+		if web != None:
+			web.end()
+		server.close()
+		thread.join()
+
+	log.debug("check_service() ending")
+	return problems
+
+####
+
+#### Main Execution ###
+
+if __name__ == '__main__':
+	from deepmac_manager import dmManager
+	log.setLevel(logging.INFO)
+
+	# Parse command line
+	parser = argparse.ArgumentParser(description = 'HTTP service for DeepMac web repositories')
+	parser.add_argument('-t', '--type', default = 'filesystem', help = 'Repository connection type (default: filesystem)')
+	parser.add_argument('-c', '--creds', default = None, help = 'Credentials as user:pass, if the repository type needs them')
+	parser.add_argument('-b', '--bind', default = '127.0.0.1', help = 'Address to listen on (default: 127.0.0.1)')
+	parser.add_argument('-p', '--port', type = int, default = 8080, help = 'Port to listen on (default: 8080)')
+	parser.add_argument('-a', '--auth', required = True, help = 'Login clients must give, as user:pass')
+	parser.add_argument('address', help = 'Repository address (journal directory for filesystem repositories)')
+	args = parser.parse_args()
+
+	# Split credentials into the dict format dmConnector expects
+	creds = None
+	if args.creds != None:
+		(u, p) = args.creds.split(':', 1)
+		creds = { 'u': u, 'p': p }
+	(u, p) = args.auth.split(':', 1)
+	auth = { 'u': u, 'p': p }
+
+	# Load the repository into memory, then it's no longer needed
+	dm = dmManager(args.type, args.address, creds)
+	index = dmWebIndex(dm)
+	dm.end()
+
+	server = dmWebServer(index, auth, args.bind, args.port)
+	try:
+		server.serve()
+	except KeyboardInterrupt:
+		log.info("Stopping")
+	server.close()
+
+####
+
+# End-of-line